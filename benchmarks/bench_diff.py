@@ -0,0 +1,44 @@
+"""Compares the notifier's fingerprint based diff against the old list scan.
+
+    python -m benchmarks.bench_diff [--sizes 1000 10000 100000] [--max-scan 10000]
+
+The list scan is quadratic, so sizes above ``--max-scan`` are skipped for it.
+"""
+import argparse
+from florin_notifier.tasks import TangerineTransactionNotifier
+from .synthetic import transactions
+from .timing import timed
+
+
+def list_scan(previous, current):
+    return [txn for txn in current if txn not in previous]
+
+
+def fingerprint_scan(notifier, known, current):
+    """Returns the unseen transactions of ``current`` the way the notifier finds
+    them, ``known`` being the state's identity -> fingerprint mapping.
+    """
+    identities = [notifier.identify(txn) for txn in current]
+    unseen, _ = notifier.select_unseen(current, identities, [known.get(identity) for identity, _ in identities])
+    return unseen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--max-scan', type=int, default=10000)
+    args = parser.parse_args()
+
+    notifier = TangerineTransactionNotifier(['12345', '12346', '12347'], 'foo@example.com')
+    print('{:>8} {:>12} {:>12}'.format('rows', 'list scan', 'fingerprint'))
+    for size in args.sizes:
+        # 10% of the current scrape is new, the rest overlaps with the previous one.
+        previous = transactions(size)
+        current = previous[size // 10:] + transactions(size // 10, start=size)
+        known = dict(notifier.identify(txn) for txn in previous)
+        scan = '{:.4f}s'.format(min(timed(list_scan, previous, current))) if size <= args.max_scan else 'skipped'
+        print('{:>8} {:>12} {:>11.4f}s'.format(size, scan, min(timed(fingerprint_scan, notifier, known, current))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Render time of a large new-transactions digest.
+
+    CONFIG_FILE=test-config.yaml python -m benchmarks.bench_email [--rows 10000]
+
+``legacy_render`` is the rendering as it was before the templates were
+precompiled and the adapter was moved out of the template loop, kept here as the
+baseline.
+"""
+import argparse
+from collections import OrderedDict
+from jinja2 import Environment, FileSystemLoader
+from florin_notifier import email
+from .synthetic import transactions
+from .timing import timed
+
+
+LEGACY_TEMPLATE = '''<html>
+<head><title>New Transactions</title></head>
+<body>
+    {% for acct, ts in txns.items() %}
+    <p>{{ acct }}</p>
+    <table>
+    <tbody>
+    {% for t in ts %}
+    {% set adapted_txn = transaction_adapter(t) %}
+        <tr>
+            <td>{{ adapted_txn["date"] }}</td>
+            <td>{{ adapted_txn["description"] }}</td>
+            <td>{{ adapted_txn["amount"] }}</td>
+        </tr>
+    {% endfor %}
+    </tbody>
+    </table>
+    {% endfor %}
+</body>
+</html>
+'''
+
+
+def adapter(t):
+    t = dict(t)
+    t['date'] = t['posted_date']
+    return t
+
+
+def digest(rows, accounts=5):
+    txns = OrderedDict()
+    for txn in transactions(rows, accounts=accounts):
+        txns.setdefault(txn['account_id'], []).append(txn)
+    return txns
+
+
+def legacy_render(txns):
+    env = Environment(loader=FileSystemLoader(email.EMAIL_TEMPLATE_DIR), trim_blocks=True)
+    return env.from_string(LEGACY_TEMPLATE).render(txns=txns, transaction_adapter=adapter)
+
+
+def render(txns):
+    context = {'txns': email.transaction_rows(txns, adapter)}
+    return (email.render_template('new_transactions.txt.jinja2', context),
+            email.render_template('new_transactions.html.jinja2', context))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    txns = digest(args.rows)
+    print('{:>24} {:>10} {:>12}'.format('render', 'total ms', 'us/row'))
+    for name, fn in (('legacy (html only)', legacy_render), ('precompiled html+text', render)):
+        seconds = min(timed(fn, txns, repeat=args.repeat))
+        print('{:>24} {:>10.1f} {:>12.2f}'.format(name, seconds * 1000, seconds / args.rows * 1e6))
+
+
+if __name__ == '__main__':
+    main()
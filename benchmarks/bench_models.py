@@ -0,0 +1,103 @@
+"""Construct + serialize throughput of the CouchDB transaction model.
+
+    python -m benchmarks.bench_models [--count 100000]
+
+``LegacyTransaction`` is the model as it was before it moved to ``__slots__``
+with the id and checksum computed once, kept here as the baseline.
+"""
+import argparse
+import datetime
+import decimal
+import hashlib
+import tracemalloc
+import ofxparse
+from florin_notifier.couchdb_importer import Transaction
+from .timing import timed
+
+
+class LegacyTransaction():
+    SIGNATURE_FIELDS = ['amount', 'date', 'memo', 'payee', 'type', 'id']
+
+    def __init__(self, ofx_txn):
+        self._raw = ofx_txn
+        self.amount = str(ofx_txn.amount)
+        self.date = ofx_txn.date.strftime("%Y-%m-%d")
+        self.memo = ofx_txn.memo
+        self.payee = ofx_txn.payee
+        self.type = "CREDIT" if float(self.amount) > 0 else "DEBIT"
+
+    @property
+    def _id(self):
+        signature = ''.join([str(getattr(self._raw, field)) or '' for field in self.SIGNATURE_FIELDS])
+        return hashlib.sha1(signature.encode('ascii')).hexdigest()
+
+    @property
+    def checksum(self):
+        signature = ''.join([str(getattr(self._raw, field)) or '' for field in self.SIGNATURE_FIELDS])
+        return 'sha256:' + hashlib.sha256(signature.encode('ascii')).hexdigest()
+
+    @property
+    def json(self):
+        return {
+            'metadata': {
+                'type': 'Transaction'
+            },
+            '_id': self._id,
+            'amount': self.amount,
+            'date': self.date,
+            'name': self.payee,
+            'memo': self.memo,
+            'checksum': self.checksum,
+            'type': self.type
+        }
+
+
+def synthetic_ofx_transaction(i):
+    txn = ofxparse.Transaction()
+    txn.type = 'debit'
+    txn.payee = 'PAYEE {}'.format(i)
+    txn.memo = 'MEMO {}'.format(i)
+    txn.amount = decimal.Decimal('-{}.{:02d}'.format(i % 1000, i % 100))
+    txn.date = datetime.datetime(2017, 11, 1) + datetime.timedelta(days=i % 30)
+    txn.id = str(i)
+    return txn
+
+
+def build(model, ofx_txns):
+    docs = [model(ofx_txn).json for ofx_txn in ofx_txns]
+    assert len(docs) == len(ofx_txns)
+
+
+def throughput(model, ofx_txns):
+    [seconds] = timed(build, model, ofx_txns)
+    return len(ofx_txns) / seconds
+
+
+def model_memory(model, count):
+    """Memory held by ``count`` models built from ofx objects nothing else refers to.
+
+    Measured separately from the throughput because tracemalloc slows
+    allocation-heavy code down a lot.
+    """
+    tracemalloc.start()
+    models = [model(synthetic_ofx_transaction(i)) for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del models
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100000)
+    args = parser.parse_args()
+
+    ofx_txns = [synthetic_ofx_transaction(i) for i in range(args.count)]
+    print('{:>20} {:>12} {:>12}'.format('model', 'txns/s', 'held MiB'))
+    for model in (LegacyTransaction, Transaction):
+        print('{:>20} {:>12.0f} {:>12.1f}'.format(
+            model.__name__, throughput(model, ofx_txns), model_memory(model, args.count) / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
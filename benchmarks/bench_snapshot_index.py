@@ -0,0 +1,57 @@
+"""Latency of finding the latest snapshot as the keyspace fills with unrelated keys.
+
+    REDIS_HOST=... python -m benchmarks.bench_snapshot_index [--db 15] [--sizes 0 10000 100000 1000000]
+
+Compares the sorted index (``latest``) with the old ``KEYS`` + sort lookup. The
+selected database is flushed, so do not point it at one holding real data.
+"""
+import argparse
+import datetime
+import statistics
+from florin_notifier import redis as store
+from .timing import timed
+
+
+PREFIX = 'scrape:bench:'
+
+
+def keys_lookup(prefix):
+    return sorted(store.client().keys('{}*'.format(prefix)))[-1]
+
+
+def fill(count, start):
+    with store.client().pipeline(transaction=False) as pipe:
+        for i in range(start, count):
+            pipe.set('unrelated:{}'.format(i), i)
+            if i % 10000 == 0:
+                pipe.execute()
+        pipe.execute()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[0, 10000, 100000, 1000000])
+    args = parser.parse_args()
+    if args.db == 0:
+        parser.error('refusing to flush database 0')
+
+    store.connect(db=args.db)
+    store.client().flushdb()
+    now = datetime.datetime.now()
+    for hour in range(24):
+        store.store_snapshot(PREFIX, now - datetime.timedelta(hours=hour), [])
+
+    print('{:>10} {:>14} {:>14}'.format('keys', 'latest()', 'KEYS + sort'))
+    filled = 0
+    for size in sorted(args.sizes):
+        fill(size, filled)
+        filled = max(filled, size)
+        print('{:>10} {:>12.3f}ms {:>12.3f}ms'.format(
+            size, statistics.mean(timed(store.latest, PREFIX, repeat=20)) * 1000,
+            statistics.mean(timed(keys_lookup, PREFIX, repeat=3)) * 1000))
+    store.client().flushdb()
+
+
+if __name__ == '__main__':
+    main()
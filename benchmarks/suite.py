@@ -0,0 +1,251 @@
+"""Benchmarks of the notifier and importer hot paths, fully offline.
+
+    CONFIG_FILE=test-config.yaml python -m benchmarks.suite [--scale 10000] [--repeat 5]
+        [--only notifier ofx_parse ...] [--output results.json] [--compare baseline.json]
+
+Redis is an in-process fakeredis server and CouchDB the fake HTTP server of the
+tests; the scrapes and statements are synthetic, ``--scale`` transactions each.
+``cold_import`` times a new interpreter importing the Celery app.
+The results are written as JSON (best and mean seconds per benchmark) so runs of
+two commits can be compared with ``--compare``.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import fakeredis
+import ofxparse
+from florin_notifier import email, redis as store
+from florin_notifier.journal import Journal
+from florin_notifier.couchdb_importer import CouchDBImporter
+from florin_notifier.diff import fingerprint
+from florin_notifier.ofx_stream import iter_ofx
+from florin_notifier.tasks import TangerineTransactionNotifier
+from tests.fake_couchdb import FakeCouchDB
+from . import synthetic
+from .bench_diff import fingerprint_scan
+from .timing import timed
+
+
+BENCHMARKS = []
+
+# The fake CouchDB server, running while the suite runs
+couchdb = None
+
+
+def benchmark(fn):
+    """Registers ``fn(scale)``, which returns the function to time and the number of
+    items it processes per call.
+    """
+    BENCHMARKS.append(fn)
+    return fn
+
+
+@contextlib.contextmanager
+def fake_redis():
+    # Swap the module's pooled client for an in-process one
+    saved = store._client
+    store._client = fakeredis.FakeRedis()
+    try:
+        yield store._client
+    finally:
+        store._client = saved
+
+
+class FakeTangerineClient():
+    """Returns a sliding window of ``scale`` transactions, 10% new on every call."""
+    def __init__(self, scale):
+        self._scale = scale
+        self._start = 0
+
+    @contextlib.contextmanager
+    def login(self):
+        yield
+
+    def list_transactions(self, account_ids, period_from=None, period_to=None):
+        txns = synthetic.transactions(self._scale, start=self._start)
+        self._start += max(self._scale // 10, 1)
+        return txns
+
+
+class RenderingEmail():
+    """Builds the email like the real module does, but does not send it."""
+    @staticmethod
+    def send_new_transaction_email(recipient, new_transactions, transaction_adapter):
+        email.new_transaction_mail(recipient, new_transactions, transaction_adapter)
+
+
+@benchmark
+def notifier(scale):
+    client = FakeTangerineClient(scale)
+
+    def run():
+        notifier = TangerineTransactionNotifier(['12345', '12346', '12347'], 'foo@example.com',
+                                                client, RenderingEmail)
+        notifier()
+    return run, scale
+
+
+@benchmark
+def fingerprint_diff(scale):
+    previous = synthetic.transactions(scale)
+    current = previous[scale // 10:] + synthetic.transactions(scale // 10, start=scale)
+    notifier = TangerineTransactionNotifier(['12345', '12346', '12347'], 'foo@example.com')
+    known = dict(notifier.identify(txn) for txn in previous)
+    return (lambda: fingerprint_scan(notifier, known, current)), scale
+
+
+@benchmark
+def redis_store_retrieve(scale):
+    txns = synthetic.transactions(scale)
+
+    def run():
+        store.store('scrape:bench:', txns)
+        assert len(store.retrieve('scrape:bench:')) == scale
+    return run, scale
+
+
+@benchmark
+def redis_snapshot(scale):
+    txns = synthetic.transactions(scale)
+
+    def run():
+        key = store.store_snapshot('scrape:bench:', datetime.datetime.now(), txns)
+        assert store.latest('scrape:bench:').decode('ascii') == key
+    return run, scale
+
+
+@benchmark
+def journal_lookup(scale):
+    fps = {fingerprint(txn, ['account_id', 'id']): fingerprint(txn) for txn in synthetic.transactions(scale)}
+    journal = Journal(tempfile.mkdtemp(prefix='florin-bench-') + '/journal')
+    journal.put_many(fps)
+
+    def run():
+        journal.put_many(fps)
+        assert None not in journal.get_many(list(fps))
+    return run, scale
+
+
+@benchmark
+def ofx_parse(scale):
+    statement = synthetic.ofx_statement(scale)
+    return (lambda: ofxparse.OfxParser().parse(io.StringIO(statement))), scale
+
+
+@benchmark
+def ofx_stream(scale):
+    statement = synthetic.ofx_statement(scale)
+
+    def run():
+        for _ in iter_ofx(io.StringIO(statement)):
+            pass
+    return run, scale
+
+
+@benchmark
+def couchdb_upload(scale):
+    statement = synthetic.ofx_statement(scale)
+    counter = iter(range(1000000))
+
+    def run():
+        # A new database every call, so every call inserts all transactions
+        target = {'db_server': couchdb.url, 'db_name': 'bench{}'.format(next(counter))}
+        CouchDBImporter().upload(statement, None, target)
+    return run, scale
+
+
+@benchmark
+def render_template(scale):
+    txns = {}
+    for txn in synthetic.transactions(scale):
+        txns.setdefault(txn['account_id'], []).append(txn)
+    adapter = TangerineTransactionNotifier.transaction_adapter
+    return (lambda: email.new_transaction_mail('foo@example.com', txns, lambda t: adapter(None, t))), scale
+
+
+@benchmark
+def cold_import(scale):
+    # What a worker pays before it runs its first job: a new interpreter importing
+    # the Celery app. Compare with ``python -X importtime`` for the breakdown.
+    command = [sys.executable, '-c', 'import florin_notifier.scheduler']
+    return (lambda: subprocess.check_call(command)), 1
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, scale, repeat):
+    global couchdb
+    results = {}
+    couchdb = FakeCouchDB().start()
+    try:
+        with fake_redis():
+            for bench in BENCHMARKS:
+                if names and bench.__name__ not in names:
+                    continue
+                fn, items = bench(scale)
+                fn()  # warm up
+                times = timed(fn, repeat=repeat)
+                results[bench.__name__] = {
+                    'items': items,
+                    'best_s': min(times),
+                    'mean_s': statistics.mean(times),
+                    'us_per_item': min(times) / items * 1e6,
+                }
+                print('{:>22} {:>10.4f}s {:>10.4f}s {:>10.2f}'.format(
+                    bench.__name__, min(times), statistics.mean(times), min(times) / items * 1e6))
+    finally:
+        couchdb.stop()
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, report):
+    print('\n{:>22} {:>11} {:>11} {:>8}'.format('benchmark', 'baseline', 'current', 'change'))
+    for name, result in sorted(report['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['best_s'] / before['best_s'] - 1
+        print('{:>22} {:>10.4f}s {:>10.4f}s {:>+7.1%}'.format(name, before['best_s'], result['best_s'], change))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=[bench.__name__ for bench in BENCHMARKS])
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='a JSON report of an earlier run')
+    args = parser.parse_args()
+
+    print('{:>22} {:>11} {:>11} {:>10}'.format('benchmark', 'best', 'mean', 'us/item'))
+    report = run(args.only, args.scale, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('\nWrote {}'.format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
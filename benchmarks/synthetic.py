@@ -0,0 +1,24 @@
+"""Generators of synthetic scrapes and statements for the benchmarks."""
+import random
+from tests.fake_ofx import STMTTRN, statement
+
+
+def transactions(count, start=0, accounts=3, seed=0):
+    """Tangerine-like scraped transactions with ids ``start .. start + count``."""
+    rand = random.Random(seed + start)
+    return [{
+        'transaction_date': '2017-11-{:02d}T07:17:03'.format(i % 28 + 1),
+        'amount': -round(rand.uniform(1, 500), 2),
+        'description': 'PURCHASE #{}'.format(i),
+        'type': 'WITHDRAWAL',
+        'account_id': str(12345 + i % accounts),
+        'id': i,
+        'posted_date': '2017-11-{:02d}T00:00:00'.format(i % 28 + 1),
+        'status': 'POSTED',
+    } for i in range(start, start + count)]
+
+
+def ofx_statement(count, start=0):
+    """A bank statement with ``count`` transactions."""
+    return statement(STMTTRN.format(id=i, day=i % 28 + 1, amount='-{}.{:02d}'.format(i % 1000, i % 100))
+                     for i in range(start, start + count))
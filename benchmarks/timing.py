@@ -0,0 +1,12 @@
+"""Timing shared by the benchmarks."""
+import time
+
+
+def timed(fn, *args, repeat=1):
+    """Calls ``fn(*args)`` ``repeat`` times and returns the seconds of every call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return times
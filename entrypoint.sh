@@ -1,3 +1,17 @@
 #! /bin/sh
+# ROLE=beat runs only the scheduler; ROLE=worker runs only a worker, consuming the
+# queues of WORKER_SHARD and WORKER_BANK (all of them if unset). Both by default.
 gpg --import /root/id.gpg.key
-exec pipenv run celery -A florin_notifier.scheduler -b redis://$REDIS_HOST:$REDIS_PORT worker -B -l INFO
+BROKER=redis://$REDIS_HOST:$REDIS_PORT
+case "${ROLE:-all}" in
+    beat)
+        exec pipenv run celery -A florin_notifier.scheduler -b $BROKER beat -l INFO
+        ;;
+    worker)
+        QUEUES=$(pipenv run python -m florin_notifier.routing queues ${WORKER_SHARD:+--shard $WORKER_SHARD} ${WORKER_BANK:+--bank $WORKER_BANK})
+        exec pipenv run celery -A florin_notifier.scheduler -b $BROKER worker -Q $QUEUES -n ${WORKER_SHARD:-worker}@%h -l INFO
+        ;;
+    *)
+        exec pipenv run celery -A florin_notifier.scheduler -b $BROKER worker -B -Q $(pipenv run python -m florin_notifier.routing queues) -l INFO
+        ;;
+esac
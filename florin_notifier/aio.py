@@ -0,0 +1,79 @@
+"""Runs every enabled job of the config concurrently on one asyncio event loop.
+
+    CONFIG_FILE=config.yaml python -m florin_notifier.aio
+
+Notifiers run natively on the loop (their bank client on a thread pool); statement
+imports, which are blocking end to end, run on the thread pool as a whole.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from . import bank_sessions
+from .registry import create_client
+from .tasks import (
+    RogersBankTransactionNotifier,
+    TangerineTransactionNotifier,
+    upload_statement,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+NOTIFIERS = {
+    'notify_tangerine_transactions': (TangerineTransactionNotifier, functools.partial(create_client, 'tangerine')),
+    'notify_rogersbank_transactions': (RogersBankTransactionNotifier, functools.partial(create_client, 'rogersbank')),
+}
+
+BLOCKING_JOBS = {
+    'upload_statement': upload_statement,
+}
+
+
+async def run_job(job, executor, email=None):
+    loop = asyncio.get_event_loop()
+    args = dict(job['args'])
+    if job['type'] in NOTIFIERS:
+        notifier_class, client_factory = NOTIFIERS[job['type']]
+        client = await loop.run_in_executor(executor, bank_sessions.manager().get,
+                                            notifier_class.BANK, args['secret_file'], client_factory)
+        notifier = notifier_class(args['account_ids'], args['recipient'], client, email)
+        return await notifier.run_async(executor)
+    if job['type'] in BLOCKING_JOBS:
+        return await loop.run_in_executor(executor, functools.partial(BLOCKING_JOBS[job['type']], **args))
+    raise ValueError('Unknown job type: {}'.format(job['type']))
+
+
+async def run_jobs(jobs, max_workers=DEFAULT_MAX_WORKERS, email=None):
+    """Runs the enabled ``jobs`` concurrently. A failing job is logged and returned as
+    its exception; it does not stop the others.
+    """
+    jobs = [job for job in jobs if job.get('enabled', True)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = await asyncio.gather(*[run_job(job, executor, email) for job in jobs],
+                                       return_exceptions=True)
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logger.error('Job {} failed: {!r}'.format(job['type'], result))
+    return results
+
+
+def main():
+    from .config import config
+    from . import secret_cache
+    logging.basicConfig(level='INFO')
+    secret_cache.warm(config['jobs'])
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run_jobs(config['jobs'] or [],
+                                         max_workers=config.get('max_workers', DEFAULT_MAX_WORKERS)))
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    main()
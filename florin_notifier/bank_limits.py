@@ -0,0 +1,152 @@
+"""Limits on what all the workers together ask of a bank.
+
+Configured per bank in the ``bank_limits`` section of the config::
+
+    bank_limits:
+        tangerine: {concurrency: 2, requests_per_minute: 30}
+
+At most ``concurrency`` jobs of the bank run at once, and its clients send at most
+``requests_per_minute`` requests per calendar minute. The counts are kept in
+Redis, so the limits hold however many workers there are; a job or request over
+the limit waits for its turn. A job's slot expires after ``slot_ttl`` seconds
+unless a heartbeat thread renews it, which it does every third of that while the
+job runs.
+"""
+import contextlib
+import logging
+import threading
+import time
+import uuid
+from redis import WatchError
+from . import metrics, redis
+
+
+logger = logging.getLogger(__name__)
+
+
+# The slot of a worker that died is freed after this long
+DEFAULT_SLOT_TTL = 60
+
+DEFAULT_MAX_WAIT = 10 * 60
+
+POLL_INTERVAL = 1.0
+
+WINDOW = 60
+
+
+class BankBusy(Exception):
+    pass
+
+
+class BankLimits():
+    def __init__(self, bank, concurrency=None, requests_per_minute=None, max_wait=DEFAULT_MAX_WAIT,
+                 slot_ttl=DEFAULT_SLOT_TTL, clock=time.time, sleep=time.sleep):
+        self.bank = bank
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self._max_wait = max_wait
+        self._slot_ttl = slot_ttl
+        self._clock = clock
+        self._sleep = sleep
+
+    @property
+    def slots_key(self):
+        return 'limit:slots:{}'.format(self.bank)
+
+    def _take_slot(self, token):
+        now = self._clock()
+        with redis.client().pipeline() as pipe:
+            try:
+                pipe.watch(self.slots_key)
+                # Only the slots that have not expired count; writing to the watched
+                # key before MULTI would fail our own EXEC
+                if pipe.zcount(self.slots_key, '({}'.format(now), '+inf') >= self.concurrency:
+                    return False
+                pipe.multi()
+                # Slots of workers that died
+                pipe.zremrangebyscore(self.slots_key, '-inf', now)
+                pipe.zadd(self.slots_key, {token: now + self._slot_ttl})
+                pipe.pexpire(self.slots_key, int(self._slot_ttl * 1000))
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def _renew(self, token):
+        """Extends the slot ``token``, unless it is gone. Returns whether it was."""
+        with redis.client().pipeline() as pipe:
+            pipe.zadd(self.slots_key, {token: self._clock() + self._slot_ttl}, xx=True)
+            pipe.pexpire(self.slots_key, int(self._slot_ttl * 1000))
+            pipe.zscore(self.slots_key, token)
+            _, _, score = pipe.execute()
+        return score is not None
+
+    def _beat(self, token, stop):
+        while not stop.wait(self._slot_ttl / 3):
+            try:
+                renewed = self._renew(token)
+            except Exception as e:
+                logger.warning('Could not renew a {} slot: {!r}'.format(self.bank, e))
+                continue
+            if not renewed:
+                logger.warning('Lost a {} slot; more than {} jobs may run at once'.format(
+                    self.bank, self.concurrency))
+                return
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Runs the block as one of the bank's ``concurrency`` jobs, waiting up to
+        ``max_wait`` seconds for a slot (then raising ``BankBusy``).
+        """
+        if not self.concurrency:
+            yield
+            return
+        token = uuid.uuid4().hex
+        deadline = self._clock() + self._max_wait
+        with metrics.stage('bank_wait'):
+            while not self._take_slot(token):
+                if self._clock() >= deadline:
+                    raise BankBusy('{} jobs of {} are running'.format(self.concurrency, self.bank))
+                self._sleep(POLL_INTERVAL)
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(token, stop),
+                                     name='slot-{}'.format(self.bank), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            heartbeat.join()
+            redis.client().zrem(self.slots_key, token)
+
+    def throttle(self):
+        """Waits until another request may be sent to the bank."""
+        if not self.requests_per_minute:
+            return
+        while True:
+            now = self._clock()
+            window = int(now // WINDOW)
+            key = 'limit:rate:{}:{}'.format(self.bank, window)
+            with redis.client().pipeline() as pipe:
+                pipe.incr(key)
+                pipe.expire(key, WINDOW * 2)
+                count, _ = pipe.execute()
+            if count <= self.requests_per_minute:
+                return
+            wait = (window + 1) * WINDOW - now
+            logger.info('{} requests to {} this minute, waiting {:.1f}s'.format(
+                self.requests_per_minute, self.bank, wait))
+            with metrics.stage('bank_wait'):
+                self._sleep(wait)
+
+
+_limits = {}
+
+
+def limits(bank):
+    """Returns the limits of ``bank`` from the ``bank_limits`` section of the config."""
+    if bank not in _limits:
+        from .config import config
+        options = (config.get('bank_limits') or {}).get(bank) or {}
+        _limits[bank] = BankLimits(bank, **options)
+    return _limits[bank]
@@ -0,0 +1,196 @@
+"""Logged-in bank clients shared across jobs.
+
+Logging in is the slowest step of a run. ``SessionManager`` keeps one client per
+``(bank, secret_file)`` and leaves it logged in after a job, so the next job that
+uses the same credentials skips the login flow. A session is logged out and in
+again once it is older than ``max_age`` or has been idle for ``max_idle``
+seconds, or when the bank rejects a request made with it.
+"""
+import atexit
+import contextlib
+import functools
+import logging
+import threading
+import time
+import requests
+from . import bank_limits, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_AGE = 60 * 60
+
+DEFAULT_MAX_IDLE = 10 * 60
+
+REJECTED_STATUS_CODES = (401, 403)
+
+
+def is_rejected(e):
+    """Whether ``e`` means the bank no longer accepts the session."""
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in REJECTED_STATUS_CODES
+    from tangerine.exceptions import APIResponseError
+    return isinstance(e, APIResponseError)
+
+
+class BankSession():
+    """Wraps a bank client so that ``login()`` reuses a live session instead of
+    logging in, and calls rejected by the bank log in again and are retried once.
+    Everything else is proxied to the client. ``throttle``, if given, is called
+    before every request to the bank (logging in, calling a method of the client or
+    reading one of its properties).
+    """
+    def __init__(self, client, max_age=DEFAULT_MAX_AGE, max_idle=DEFAULT_MAX_IDLE, clock=time.monotonic,
+                 throttle=None):
+        self._client = client
+        self._throttle = throttle
+        self._max_age = max_age
+        self._max_idle = max_idle
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._login = None
+        self._logged_in_at = None
+        self._last_used = None
+        self._users = 0
+        self._generation = 0
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def logged_in(self):
+        return self._login is not None
+
+    def _expired(self, now):
+        return now - self._logged_in_at >= self._max_age or now - self._last_used >= self._max_idle
+
+    def _request(self):
+        if self._throttle is not None:
+            self._throttle()
+
+    def _start(self):
+        self._request()
+        login = self._client.login()
+        with metrics.stage('login'):
+            login.__enter__()
+        self._login = login
+        self._logged_in_at = self._last_used = self._clock()
+        self._generation += 1
+
+    def _end(self):
+        login, self._login = self._login, None
+        if login is None:
+            return
+        try:
+            login.__exit__(None, None, None)
+        except Exception as e:
+            logger.warning('Logging out failed: {!r}'.format(e))
+
+    @contextlib.contextmanager
+    def login(self):
+        with self._lock:
+            if self._login is not None and self._users == 0 and self._expired(self._clock()):
+                logger.info('Session expired, logging in again')
+                self._end()
+            if self._login is None:
+                self._start()
+            self._users += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._users -= 1
+                self._last_used = self._clock()
+
+    def relogin(self, generation=None):
+        """Logs in again, unless another thread already did since ``generation``."""
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._end()
+            self._start()
+
+    def logout(self):
+        with self._lock:
+            self._end()
+
+    def _retry_rejected(self, fn):
+        generation = self._generation
+        try:
+            return fn()
+        except Exception as e:
+            if self._login is None or not is_rejected(e):
+                raise
+            logger.info('Session rejected ({!r}), logging in again'.format(e))
+        self.relogin(generation)
+        return fn()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        # Properties of the client, like RogersBank's activities, are requests too
+        is_property = isinstance(getattr(type(self._client), name, None), property)
+
+        def get():
+            if is_property:
+                self._request()
+            return getattr(self._client, name)
+        value = self._retry_rejected(get)
+        if not callable(value):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            def request():
+                self._request()
+                return getattr(self._client, name)(*args, **kwargs)
+            return self._retry_rejected(request)
+        return call
+
+
+class SessionManager():
+    def __init__(self, max_age=DEFAULT_MAX_AGE, max_idle=DEFAULT_MAX_IDLE, clock=time.monotonic):
+        self._max_age = max_age
+        self._max_idle = max_idle
+        self._clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, bank, secret_file, client_factory):
+        """Returns the session of ``(bank, secret_file)``, creating its client with
+        ``client_factory(secret_file)`` the first time.
+        """
+        key = (bank, secret_file)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = BankSession(client_factory(secret_file), self._max_age, self._max_idle, self._clock,
+                                      throttle=bank_limits.limits(bank).throttle)
+                self._sessions[key] = session
+            return session
+
+    def close(self):
+        """Logs out of every session."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.logout()
+
+
+_manager = None
+
+
+def manager():
+    """Returns the process wide manager, configured from the ``bank_sessions``
+    section of the config on first use.
+    """
+    global _manager
+    if _manager is None:
+        from .config import config
+        options = config.get('bank_sessions') or {}
+        _manager = SessionManager(max_age=options.get('max_age', DEFAULT_MAX_AGE),
+                                  max_idle=options.get('max_idle', DEFAULT_MAX_IDLE))
+        atexit.register(_manager.close)
+    return _manager
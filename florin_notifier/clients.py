@@ -0,0 +1,24 @@
+"""Bank clients, created from gpg encrypted secret files.
+
+Only imported through ``registry.BANK_CLIENTS``, so the bank libraries are loaded
+by the processes that use them.
+"""
+from rogersbank.client import RogersBankClient
+from rogersbank.secret_provider import DictionaryBasedSecretProvider as RogersBankSecretProvider
+from tangerine import TangerineClient, DictionaryBasedSecretProvider as TangerineSecretProvider
+from . import secret_cache
+
+
+def create_provider(filename, provider_factory):
+    return provider_factory(secret_cache.cache().get(filename))
+
+
+def tangerine_client_factory(secret_file):
+    secret_provider = create_provider(secret_file, provider_factory=TangerineSecretProvider)
+    tangerine_client = TangerineClient(secret_provider)
+    return tangerine_client
+
+
+def rogersbank_client_factory(secret_file):
+    secret_provider = create_provider(secret_file, provider_factory=RogersBankSecretProvider)
+    return RogersBankClient(secret_provider)
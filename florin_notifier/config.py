@@ -1,9 +1,54 @@
+"""The config, read from ``$CONFIG_FILE`` the first time it is used.
+
+``config`` behaves like the dict of the parsed YAML file, so importing this
+module is free and a process that never looks at the config never parses it.
+"""
 import os
-import yaml
+import threading
+from collections.abc import MutableMapping
+
+
+class Config(MutableMapping):
+    def __init__(self, path=None):
+        self._path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or os.getenv('CONFIG_FILE')
+
+    def load(self):
+        """Returns the parsed config, reading the file the first time."""
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    if self.path is None:
+                        raise RuntimeError('CONFIG_FILE is not set')
+                    import yaml
+                    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+                    with open(self.path) as f:
+                        self._data = yaml.load(f, Loader=loader) or {}
+        return self._data
+
+    def reload(self):
+        """Reads the file again on next use."""
+        self._data = None
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
 
+    def __len__(self):
+        return len(self.load())
 
-config_file = os.getenv('CONFIG_FILE')
-assert config_file is not None
 
-with open(config_file) as f:
-    config = yaml.load(f)
+config = Config()
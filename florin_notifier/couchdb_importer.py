@@ -1,33 +1,105 @@
+import datetime
 import logging
-import couchdb
 import hashlib
-import ofxparse
 import io
+import threading
+from collections import OrderedDict, namedtuple
+from . import metrics
 
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_MAX_CONNECTIONS = 4
+
+
+class Connections():
+    """Process wide CouchDB handles.
+
+    One ``couchdb.Server`` per server URL, so its keep-alive connections are reused
+    by every upload, and one ``Database`` per ``(server, name)``, whose existence is
+    checked (and the database created) once. At most ``max_connections`` uploads
+    talk to a server at a time.
+    """
+    def __init__(self):
+        self._servers = {}
+        self._databases = {}
+        self._limits = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def server(self, url):
+        import couchdb
+        with self._lock:
+            if url not in self._servers:
+                self._servers[url] = couchdb.Server(url)
+            return self._servers[url]
+
+    def database(self, url, name):
+        import couchdb
+        key = (url, name)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            db = self._databases.get(key)
+            if db is None:
+                server = self.server(url)
+                try:
+                    db = server[name]
+                except couchdb.ResourceNotFound:
+                    logger.info('Creating database {}'.format(name))
+                    try:
+                        db = server.create(name)
+                    except couchdb.PreconditionFailed:
+                        # Created by someone else in the meantime
+                        db = server[name]
+                self._databases[key] = db
+            return db
+
+    def forget(self, url, name):
+        """Drops the handle of a database that turned out not to exist anymore."""
+        with self._lock:
+            self._databases.pop((url, name), None)
+
+    def limit(self, url, max_connections=None):
+        """Returns the semaphore bounding the uploads to the server. The limit is set
+        by the first caller.
+        """
+        with self._lock:
+            if url not in self._limits:
+                self._limits[url] = threading.BoundedSemaphore(max_connections or DEFAULT_MAX_CONNECTIONS)
+            return self._limits[url]
+
+
+_connections = None
+
+
+def connections():
+    global _connections
+    if _connections is None:
+        _connections = Connections()
+    return _connections
+
+
 class Account():
     SIGNATURE_FIELDS = ['account_id', 'branch_id', 'currency', 'financial_institution', 'number',
                         'routing_number', 'type']
 
+    __slots__ = ['currency', 'account_id', 'branch_id', 'financial_institution', 'number',
+                 'routing_number', 'type', 'name', '_id']
+
     def __init__(self, ofx_account):
-        self._raw = ofx_account
-        self.currency = self._raw.curdef
-        self.account_id = self._raw.account_id
-        self.branch_id = self._raw.branch_id
-        self.financial_institution = self._raw.institution.organization if self._raw.institution else None
-        self.number = self._raw.number
-        self.routing_number = self._raw.routing_number
-        self.type = self._raw.type
-        self.name = self._raw.number
+        self.currency = ofx_account.curdef
+        self.account_id = ofx_account.account_id
+        self.branch_id = ofx_account.branch_id
+        self.financial_institution = ofx_account.institution.organization if ofx_account.institution else None
+        self.number = ofx_account.number
+        self.routing_number = ofx_account.routing_number
+        self.type = ofx_account.type
+        self.name = ofx_account.number
 
-    @property
-    def _id(self):
         signature = ''.join([str(getattr(self, field)) or '' for field in self.SIGNATURE_FIELDS])
-        print(signature)
-        return hashlib.sha1(signature.encode('ascii')).hexdigest()
+        self._id = hashlib.sha1(signature.encode('ascii')).hexdigest()
 
     @property
     def json(self):
@@ -47,23 +119,20 @@ class Transaction():
     SIGNATURE_FIELDS = ['amount', 'date', 'memo', 'payee', 'type', 'id']
     TYPES = {'credit': 'CREDIT', 'debit': 'DEBIT'}
 
+    __slots__ = ['amount', 'date', 'memo', 'payee', 'type', '_id', 'checksum']
+
     def __init__(self, ofx_txn):
-        self._raw = ofx_txn
         self.amount = str(ofx_txn.amount)
         self.date = ofx_txn.date.strftime("%Y-%m-%d")
         self.memo = ofx_txn.memo
         self.payee = ofx_txn.payee
         self.type = "CREDIT" if float(self.amount) > 0 else "DEBIT"
 
-    @property
-    def _id(self):
-        signature = ''.join([str(getattr(self._raw, field)) or '' for field in self.SIGNATURE_FIELDS])
-        return hashlib.sha1(signature.encode('ascii')).hexdigest()
-
-    @property
-    def checksum(self):
-        signature = ''.join([str(getattr(self._raw, field)) or '' for field in self.SIGNATURE_FIELDS])
-        return 'sha256:' + hashlib.sha256(signature.encode('ascii')).hexdigest()
+        # The signature is over the raw ofx values, which are not kept after this
+        signature = ''.join([str(getattr(ofx_txn, field)) or '' for field in self.SIGNATURE_FIELDS])
+        signature = signature.encode('ascii')
+        self._id = hashlib.sha1(signature).hexdigest()
+        self.checksum = 'sha256:' + hashlib.sha256(signature).hexdigest()
 
     @property
     def json(self):
@@ -81,14 +150,55 @@ class Transaction():
         }
 
 
+class ImportSummary(namedtuple('ImportSummary', ['inserted', 'skipped', 'conflicted'])):
+    def __add__(self, other):
+        return ImportSummary(*[a + b for a, b in zip(self, other)])
+
+
+# Balance history resolution: every balance of the last HISTORY_RECENT, then the
+# last balance of each day until HISTORY_DAILY ago, then of each month, keeping
+# at most HISTORY_MONTHS months.
+HISTORY_RECENT = datetime.timedelta(days=2)
+
+HISTORY_DAILY = datetime.timedelta(days=90)
+
+HISTORY_MONTHS = 120
+
+
+def compact_history(history, now, recent=HISTORY_RECENT, daily=HISTORY_DAILY, months=HISTORY_MONTHS):
+    """Downsamples the ``{'dateTime', 'balance'}`` entries of an account's history
+    relative to ``now``, so its size stays bounded however long the account lives.
+    Returns the entries oldest first.
+    """
+    recent_since = (now - recent).isoformat()
+    daily_since = (now - daily).isoformat()
+    buckets = OrderedDict()
+    # ISO timestamps sort chronologically and their prefixes are the day and month
+    for entry in sorted(history, key=lambda e: e['dateTime']):
+        date_time = entry['dateTime']
+        if date_time >= recent_since:
+            bucket = date_time
+        elif date_time >= daily_since:
+            bucket = date_time[:10]
+        else:
+            bucket = date_time[:7]
+        buckets[bucket] = entry
+    monthly = [bucket for bucket in buckets if len(bucket) == 7]
+    for bucket in monthly[:max(len(monthly) - months, 0)]:
+        del buckets[bucket]
+    return list(buckets.values())
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 class CouchDBImporter():
+    BULK_SIZE = 500
+
     def get_db(self, target):
-        server = couchdb.Server(target['db_server'])
-        try:
-            db = server[target['db_name']]
-        except:
-            db = server.create(target['db_name'])
-        return db
+        return connections().database(target['db_server'], target['db_name'])
 
     def get_db_account(self, db, ofx_account):
         account = Account(ofx_account)
@@ -100,25 +210,131 @@ class CouchDBImporter():
             db_account = db[account_id]
         return db_account
 
+    def existing_ids(self, db, ids):
+        """Returns the subset of ``ids`` that already exist in ``db`` using a single
+        ``_all_docs`` lookup.
+        """
+        if not ids:
+            return set()
+        rows = db.view('_all_docs', keys=ids)
+        return {
+            row.key for row in rows
+            if not row.error and not (row.value or {}).get('deleted')
+        }
+
+    def bulk_import(self, db, txn_docs, bulk_size):
+        unique_docs = {}
+        for txn_doc in txn_docs:
+            unique_docs.setdefault(txn_doc['_id'], txn_doc)
+
+        with metrics.stage('db_read'):
+            existing = self.existing_ids(db, list(unique_docs))
+        new_docs = [doc for doc_id, doc in unique_docs.items() if doc_id not in existing]
+        summary = ImportSummary(0, len(txn_docs) - len(new_docs), 0)
+
+        for batch in chunks(new_docs, bulk_size):
+            with metrics.stage('db_write'):
+                results = db.update(batch)
+            inserted = sum(1 for success, _, _ in results if success)
+            for success, doc_id, exc in results:
+                if not success:
+                    logger.warning('Transaction {} was not imported: {}'.format(doc_id, exc))
+            summary += ImportSummary(inserted, 0, len(results) - inserted)
+        return summary
+
+    def record_balance(self, db, db_account, balance_date, balance):
+        """Adds the balance to the account's history, unless it is the balance the
+        history already ends with. Returns whether the account was saved.
+        """
+        history = db_account.get('history') or []
+        entry = {
+            'dateTime': balance_date.isoformat(),
+            'balance': str(balance),
+        }
+        latest = max(history, key=lambda e: e['dateTime']) if history else None
+        if latest is not None and (latest['balance'] == entry['balance'] or
+                                   latest['dateTime'] >= entry['dateTime']):
+            metrics.count('unchanged_balances')
+            return False
+        db_account['history'] = compact_history(history + [entry], balance_date)
+        with metrics.stage('db_write'):
+            db.save(db_account)
+        return True
+
+    def record_summary(self, target, summary):
+        logger.info('Imported {} transactions into {}: {}'.format(
+            sum(summary), target['db_name'], summary))
+        for name, value in summary._asdict().items():
+            metrics.count(name, value)
+
     def upload(self, statement_content, target_account_id, target):
+        """Imports the statement into ``target``. Uploads to the same server wait for
+        one of its ``max_connections`` (default ``DEFAULT_MAX_CONNECTIONS``).
+
+        ``statement_content`` is the statement or a file to read it from. With
+        ``streaming`` set on the target, parsing takes the same memory whatever the
+        size of the statement; the statement itself is only kept out of memory when
+        it is passed as a file, since the bank clients download it whole.
+        """
+        import couchdb
+        fileobj = statement_content if hasattr(statement_content, 'read') else io.StringIO(statement_content)
+        with connections().limit(target['db_server'], target.get('max_connections')):
+            try:
+                if target.get('streaming'):
+                    return self.upload_stream(fileobj, target_account_id, target)
+                return self.upload_parsed(fileobj, target_account_id, target)
+            except couchdb.ResourceNotFound:
+                connections().forget(target['db_server'], target['db_name'])
+                raise
+
+    def upload_parsed(self, fileobj, target_account_id, target):
+        import ofxparse
         parser = ofxparse.OfxParser()
-        ofx = parser.parse(io.StringIO(statement_content))
+        with metrics.stage('parse'):
+            ofx = parser.parse(fileobj)
         db = self.get_db(target)
+        bulk_size = target.get('bulk_size') or self.BULK_SIZE
+        summary = ImportSummary(0, 0, 0)
         for ofx_account in ofx.accounts:
             db_account = self.get_db_account(db, ofx_account)
             statement = ofx_account.statement
-            db_account['history'] = db_account.get('history', [])
-            db_account['history'].append({
-                'dateTime': statement.balance_date.isoformat(),
-                'balance': str(statement.balance),
-            })
-            db.save(db_account)
+            self.record_balance(db, db_account, statement.balance_date, statement.balance)
+            txn_docs = []
             for ofx_txn in ofx_account.statement.transactions:
-                txn = Transaction(ofx_txn)
-                txn_doc = txn.json
+                txn_doc = Transaction(ofx_txn).json
                 txn_doc['accountId'] = db_account.id
-                if db.get(txn_doc['_id']):
-                    logger.warn('Transaction {} already exists. Skipping'.format(txn_doc))
-                    continue
-                db.save(txn_doc)
-                logger.info('Transaction {} imported'.format(txn_doc))
+                txn_docs.append(txn_doc)
+            summary += self.bulk_import(db, txn_docs, bulk_size)
+
+        self.record_summary(target, summary)
+        return summary
+
+    def upload_stream(self, fileobj, target_account_id, target):
+        """Imports an OFX statement read from ``fileobj`` without building it in memory.
+
+        Transactions are written as soon as ``bulk_size`` of them have been read.
+        """
+        from .ofx_stream import iter_ofx
+        db = self.get_db(target)
+        bulk_size = target.get('bulk_size') or self.BULK_SIZE
+        summary = ImportSummary(0, 0, 0)
+        db_account = None
+        txn_docs = []
+        for kind, value in iter_ofx(fileobj):
+            if kind == 'transaction':
+                txn_doc = Transaction(value).json
+                txn_doc['accountId'] = db_account.id
+                txn_docs.append(txn_doc)
+                if len(txn_docs) >= bulk_size:
+                    summary += self.bulk_import(db, txn_docs, bulk_size)
+                    txn_docs = []
+            elif kind == 'account':
+                summary += self.bulk_import(db, txn_docs, bulk_size)
+                txn_docs = []
+                db_account = self.get_db_account(db, value)
+            elif kind == 'balance':
+                self.record_balance(db, db_account, value.balance_date, value.balance)
+        summary += self.bulk_import(db, txn_docs, bulk_size)
+
+        self.record_summary(target, summary)
+        return summary
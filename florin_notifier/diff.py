@@ -0,0 +1,15 @@
+import hashlib
+import json
+
+
+def fingerprint(txn, fields=None):
+    """Returns a stable hash of the transaction.
+
+    If ``fields`` is given, only those fields take part in the hash; missing fields
+    hash as ``None``. Key order does not matter.
+    """
+    if fields is not None:
+        txn = {field: txn.get(field) for field in fields}
+    signature = json.dumps(txn, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
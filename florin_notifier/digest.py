@@ -0,0 +1,95 @@
+"""Per-recipient digest buffers in Redis.
+
+Notifier runs append their (already adapted) new transactions to the recipient's
+buffer instead of emailing them. ``email.flush_digests`` later sends everything a
+recipient has accumulated as one email, once the buffer is older than the
+configured window or bigger than the configured size.
+"""
+import json
+import time
+from collections import OrderedDict
+from . import redis
+
+
+DEFAULT_WINDOW = 60 * 60
+
+DEFAULT_MAX_SIZE = 200
+
+RECIPIENTS_KEY = 'digest:recipients'
+
+
+def buffer_key(recipient):
+    return 'digest:buffer:{}'.format(recipient)
+
+
+def since_key(recipient):
+    return 'digest:since:{}'.format(recipient)
+
+
+def enqueue(recipient, new_transactions, transaction_adapter):
+    """Appends ``new_transactions`` (account id -> transactions) to the recipient's
+    buffer and returns the number of transactions now waiting.
+    """
+    entries = _entries(new_transactions, transaction_adapter)
+    if not entries:
+        return 0
+    with redis.client().pipeline() as pipe:
+        pipe.rpush(buffer_key(recipient), *entries)
+        pipe.set(since_key(recipient), time.time(), nx=True)
+        pipe.sadd(RECIPIENTS_KEY, recipient)
+        size, _, _ = pipe.execute()
+    return size
+
+
+def restore(recipient, new_transactions):
+    """Puts drained transactions (account id -> adapted transactions) back at the
+    head of the recipient's buffer, when their email could not be sent.
+    """
+    entries = _entries(new_transactions, lambda t: t)
+    if not entries:
+        return
+    with redis.client().pipeline() as pipe:
+        # Without a start time the buffer is due on the next flush
+        pipe.lpush(buffer_key(recipient), *reversed(entries))
+        pipe.sadd(RECIPIENTS_KEY, recipient)
+        pipe.execute()
+
+
+def _entries(new_transactions, transaction_adapter):
+    return [
+        json.dumps({'account': account, 'txn': transaction_adapter(txn)}, default=str)
+        for account, txns in new_transactions.items()
+        for txn in txns
+    ]
+
+
+def pending_recipients():
+    return sorted(r.decode('utf-8') for r in redis.client().smembers(RECIPIENTS_KEY))
+
+
+def is_due(recipient, window=DEFAULT_WINDOW, max_size=DEFAULT_MAX_SIZE, now=None):
+    with redis.client().pipeline(transaction=False) as pipe:
+        pipe.get(since_key(recipient))
+        pipe.llen(buffer_key(recipient))
+        since, size = pipe.execute()
+    if not size:
+        return False
+    now = time.time() if now is None else now
+    return size >= max_size or since is None or now - float(since) >= window
+
+
+def drain(recipient):
+    """Atomically takes everything out of the recipient's buffer and returns it
+    grouped by account, in the order it was enqueued.
+    """
+    with redis.client().pipeline() as pipe:
+        pipe.lrange(buffer_key(recipient), 0, -1)
+        pipe.delete(buffer_key(recipient), since_key(recipient))
+        pipe.srem(RECIPIENTS_KEY, recipient)
+        entries, _, _ = pipe.execute()
+
+    grouped = OrderedDict()
+    for entry in entries:
+        entry = json.loads(entry.decode('utf-8'))
+        grouped.setdefault(entry['account'], []).append(entry['txn'])
+    return grouped
@@ -1,9 +1,12 @@
+import asyncio
 import os
-import sendgrid
 import logging
-from sendgrid.helpers.mail import Email, Content, Mail
-from jinja2 import Environment, FileSystemLoader
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict, namedtuple
 from .config import config
+from . import digest, metrics
 
 
 EMAIL_TEMPLATE_DIR = os.path.join(
@@ -11,41 +14,189 @@ EMAIL_TEMPLATE_DIR = os.path.join(
     'email_template')
 
 
-env = Environment(loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
-                  trim_blocks=True)
+_env = None
+
+_templates = None
+
+
+def environment():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+        _env = Environment(loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
+                           trim_blocks=True,
+                           auto_reload=False,
+                           bytecode_cache=FileSystemBytecodeCache())
+    return _env
+
+
+def templates():
+    """Returns every template, compiled the first time this is called and never
+    reloaded. The bytecode cache lets the next process skip the compilation as well.
+    """
+    global _templates
+    if _templates is None:
+        env = environment()
+        _templates = {name: env.get_template(name) for name in env.list_templates()}
+    return _templates
 
 
 logger = logging.getLogger(__name__)
 
 
-def sendgrid_client():
-    sendgrid_api_key = config['sendgrid_api_key']
-    return sendgrid.SendGridAPIClient(apikey=sendgrid_api_key)
+SENDGRID_MAIL_SEND_URL = 'https://api.sendgrid.com/v3/mail/send'
 
 
-def send_new_transaction_email(recipient, new_transactions, transaction_adapter):
+_session = None
+
+
+def sendgrid_session():
+    """Returns the keep-alive session to the SendGrid API shared by every send."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update({
+            'Authorization': 'Bearer {}'.format(config['sendgrid_api_key']),
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.get('sendgrid_pool_size', 4))
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+    return _session
+
+
+def send_mail(mail):
+    with metrics.stage('send'):
+        response = sendgrid_session().post(SENDGRID_MAIL_SEND_URL, json=mail, timeout=30)
+    logger.info(response.status_code)
+    logger.info(response.text)
+    logger.info(response.headers)
+    if not 200 <= response.status_code < 300:
+        raise requests.HTTPError('Sending the email failed: status={};msg={}'.format(
+            response.status_code, response.text), response=response)
+    return response
+
+
+def digest_options():
+    """Returns the digest window and size from the config, or None if emails are
+    sent right away.
+    """
+    digest_config = config.get('digest')
+    if not digest_config:
+        return None
+    return {
+        'window': digest_config.get('window', digest.DEFAULT_WINDOW),
+        'max_size': digest_config.get('max_size', digest.DEFAULT_MAX_SIZE),
+    }
+
+
+Row = namedtuple('Row', ['date', 'description', 'amount'])
+
+
+def transaction_rows(new_transactions, transaction_adapter=None):
+    """Adapts every transaction up front into the ``Row`` the templates display,
+    grouped by account. Without an adapter the transactions are already adapted.
+    """
+    adapt = transaction_adapter or (lambda t: t)
+    return OrderedDict(
+        (account, [Row(t['date'], t['description'], t['amount']) for t in map(adapt, txns)])
+        for account, txns in new_transactions.items()
+    )
+
+
+def new_transaction_mail(recipient, new_transactions, transaction_adapter=None):
+    """Returns the SendGrid request body of the email, or None if there is nothing new."""
     if all(map(lambda v: len(v) == 0, new_transactions.values())):
         logger.info('No new transactions')
-        return
+        return None
 
     logger.info('{} new transactions discovered'.format(len(new_transactions)))
-    email_content = render_template(
-        'new_transactions.html.jinja2',
-        {
-            'txns': new_transactions,
-            'transaction_adapter': transaction_adapter,
-        }
-    )
-    from_email = Email('noreply@idempotent.ca')
-    to_email = Email(recipient)
-    subject = 'New Transactions'
-    content = Content('text/html', email_content)
-    mail = Mail(from_email, subject, to_email, content)
-    response = sendgrid_client().client.mail.send.post(request_body=mail.get())
-    logger.info(response.status_code)
-    logger.info(response.body)
-    logger.info(response.headers)
+    from sendgrid.helpers.mail import Email, Content, Mail
+    with metrics.stage('render'):
+        context = {'txns': transaction_rows(new_transactions, transaction_adapter)}
+        from_email = Email('noreply@idempotent.ca')
+        to_email = Email(recipient)
+        subject = 'New Transactions'
+        # SendGrid wants the plain text part first
+        mail = Mail(from_email, subject, to_email,
+                    Content('text/plain', render_template('new_transactions.txt.jinja2', context)))
+        mail.add_content(Content('text/html', render_template('new_transactions.html.jinja2', context)))
+        return mail.get()
+
+
+def send_new_transaction_email(recipient, new_transactions, transaction_adapter):
+    options = digest_options()
+    if options is not None:
+        if digest.enqueue(recipient, new_transactions, transaction_adapter) and \
+                digest.is_due(recipient, **options):
+            flush_digest(recipient)
+        return
+
+    mail = new_transaction_mail(recipient, new_transactions, transaction_adapter)
+    if mail is None:
+        return
+    send_mail(mail)
+
+
+def flush_digest(recipient):
+    """Sends everything waiting in the recipient's digest as one email. If the
+    email cannot be sent, the transactions go back into the digest.
+    """
+    new_transactions = digest.drain(recipient)
+    mail = new_transaction_mail(recipient, new_transactions)
+    if mail is None:
+        return
+    try:
+        send_mail(mail)
+    except Exception:
+        digest.restore(recipient, new_transactions)
+        raise
+
+
+def flush_digests(force=False):
+    """Sends the digests that are due, or all of them if ``force`` is set."""
+    options = digest_options() or {}
+    for recipient in digest.pending_recipients():
+        if force or digest.is_due(recipient, **options):
+            flush_digest(recipient)
+
+
+async def send_new_transaction_email_async(recipient, new_transactions, transaction_adapter, session=None,
+                                           recorder=None):
+    """Same as ``send_new_transaction_email``, but posts to SendGrid without blocking
+    the event loop. Pass ``session`` to reuse an ``aiohttp.ClientSession``, and the
+    ``recorder`` of the job to time the ``render`` and ``send`` stages into.
+    """
+    bind = recorder.bind if recorder is not None else (lambda fn: fn)
+    if digest_options() is not None:
+        # The digest is kept in Redis with the blocking client
+        await asyncio.get_event_loop().run_in_executor(
+            None, bind(send_new_transaction_email), recipient, new_transactions, transaction_adapter)
+        return
+
+    mail = bind(new_transaction_mail)(recipient, new_transactions, transaction_adapter)
+    if mail is None:
+        return
+
+    headers = {'Authorization': 'Bearer {}'.format(config['sendgrid_api_key'])}
+    if session is None:
+        import aiohttp
+        async with aiohttp.ClientSession() as session:
+            return await _post_mail(session, mail, headers, recorder)
+    return await _post_mail(session, mail, headers, recorder)
+
+
+async def _post_mail(session, mail, headers, recorder=None):
+    start = time.perf_counter()
+    try:
+        async with session.post(SENDGRID_MAIL_SEND_URL, json=mail, headers=headers) as response:
+            logger.info(response.status)
+            logger.info(await response.text())
+            logger.info(response.headers)
+    finally:
+        if recorder is not None:
+            recorder.timing('send', time.perf_counter() - start)
 
 
 def render_template(template_name, context):
-    return env.get_template(template_name).render(**context)
+    template = templates().get(template_name) or environment().get_template(template_name)
+    return template.render(**context)
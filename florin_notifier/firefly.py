@@ -0,0 +1,99 @@
+"""Statement uploads to a Firefly importer endpoint.
+
+The same statement is usually downloaded again on every run, so the hash of what
+was last uploaded is kept in Redis per ``(endpoint, account)`` and an unchanged
+statement is not posted again. Fields that change on every download (server time,
+statement period, ...) are left out of the hash.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from . import metrics, redis
+
+
+logger = logging.getLogger(__name__)
+
+
+UPLOAD_TIMEOUT = 300
+
+UPLOAD_HASH_TTL = 30 * redis.DAY
+
+# OFX elements whose value differs between two downloads of the same statement
+VOLATILE = re.compile(r'<(DTSERVER|DTSTART|DTEND|DTASOF|TRNUID|DTACCTUP)>[^<\r\n]*|^NEWFILEUID:.*$',
+                      re.MULTILINE)
+
+# Returned by ``upload`` for a statement that was uploaded already
+UNCHANGED = 'unchanged'
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def session():
+    """Returns the keep-alive session shared by all uploads."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def statement_hash(statement_content, target_account_id, user_id=None):
+    normalized = VOLATILE.sub('', statement_content)
+    digest = hashlib.sha256('{}\0{}\0'.format(target_account_id, user_id).encode('utf-8'))
+    digest.update(normalized.encode('utf-8'))
+    return 'sha256:' + digest.hexdigest()
+
+
+def hash_key(endpoint, target_account_id):
+    return 'upload:firefly:{}:{}'.format(hashlib.sha1(endpoint.encode('utf-8')).hexdigest(), target_account_id)
+
+
+def post_statement(endpoint, request_json, compress=False):
+    body = json.dumps(request_json).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if compress:
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    with metrics.stage('post'):
+        return session().post(endpoint, data=body, headers=headers, timeout=UPLOAD_TIMEOUT)
+
+
+def upload(statement_content, target_account_id, target):
+    """Posts the statement to ``target['endpoint']`` unless the same statement was
+    uploaded there for the account already. Returns True if it was posted, or
+    ``UNCHANGED``. Raises ``requests.HTTPError`` if the endpoint rejects it, in which
+    case it is posted again next time.
+    """
+    endpoint = target['endpoint']
+    user_id = target.get('user_id')
+    content_hash = statement_hash(statement_content, target_account_id, user_id)
+    key = hash_key(endpoint, target_account_id)
+    if redis.client().get(key) == content_hash.encode('ascii'):
+        logger.info('Statement of account {} is unchanged since the last upload. Skip...'.format(target_account_id))
+        metrics.count('unchanged')
+        return UNCHANGED
+
+    request_json = {
+        'account_id': target_account_id,
+        'data': base64.b64encode(statement_content.encode('ascii')).decode('ascii'),
+    }
+    if user_id is not None:
+        request_json.update({'user_id': user_id})
+
+    response = post_statement(endpoint, request_json, compress=target.get('gzip', False))
+    if response.status_code != 200:
+        raise requests.HTTPError('Upload of account {} failed: status={};msg={}'.format(
+            target_account_id, response.status_code, response.text), response=response)
+    redis.client().set(key, content_hash, ex=UPLOAD_HASH_TTL)
+    return True
@@ -0,0 +1,369 @@
+"""On-disk journal of the transactions a notifier has seen.
+
+An alternative to the Redis backed ``redis.ScrapeState`` that does not expire:
+history is kept for as long as the files are, at a small, fixed cost per
+transaction.
+
+A journal is two files:
+
+``<name>.log``
+    Append-only, fixed-size records of ``(identity, fingerprint, time)``. A
+    transaction whose fingerprint changes gets a new record; the old one stays
+    until the next compaction.
+``<name>.idx``
+    A memory-mapped open-addressing hash table from identity to its latest log
+    record, so a lookup reads one or two slots and one record whatever the size of
+    the history. The header also holds the high-water mark.
+
+Identities and fingerprints are the 40 character sha1 hex digests made by
+``diff.fingerprint``. One process writes a journal at a time (an exclusive
+``flock`` on ``<name>.lock``) while readers hold a shared one; the index can be
+rebuilt from the log at any time. A rebuilt index or a compacted log is a new
+file swapped in, which the other processes reopen the next time they take the
+lock.
+"""
+import contextlib
+import datetime
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from . import redis
+
+
+logger = logging.getLogger(__name__)
+
+
+RECORD = struct.Struct('<20s20sd')
+
+SLOT = struct.Struct('<QI')
+
+HEADER = struct.Struct('<8sQQQd')
+
+MAGIC = b'FLJIDX01'
+
+MIN_CAPACITY = 1024
+
+MAX_LOAD = 0.5
+
+# Compact once the log holds this many times more records than there are identities
+COMPACT_RATIO = 2
+
+COMPACT_MIN_RECORDS = 10000
+
+
+def _capacity_for(count):
+    capacity = MIN_CAPACITY
+    while count > capacity * MAX_LOAD:
+        capacity *= 2
+    return capacity
+
+
+def _replaced(path, f):
+    """Whether ``path`` is no longer the file ``f`` has open."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return True
+    fst = os.fstat(f.fileno())
+    return (st.st_dev, st.st_ino) != (fst.st_dev, fst.st_ino)
+
+
+def _digest(value):
+    try:
+        digest = bytes.fromhex(value)
+    except ValueError:
+        digest = b''
+    if len(digest) != 20:
+        # Not a sha1 digest, hash it into one
+        digest = hashlib.sha1(value.encode('utf-8')).digest()
+    return digest
+
+
+class Journal():
+    """``max_age`` (seconds) drops identities that have not changed for that long
+    when the journal is compacted; by default they are kept forever.
+    """
+    def __init__(self, path, max_age=None):
+        self._log_path = path + '.log'
+        self._index_path = path + '.idx'
+        self._max_age = max_age
+        self._lock = open(path + '.lock', 'a')
+        self._log_map = None
+        self._index = None
+        self._index_file = None
+        with self._locked():
+            self._log = open(self._log_path, 'a+b')
+            if not os.path.exists(self._index_path):
+                self._build_index(MIN_CAPACITY)
+            else:
+                self._open_index()
+            self._catch_up()
+
+    # -- index -----------------------------------------------------------------
+
+    def _open_index(self):
+        self._close_index()
+        self._index_file = open(self._index_path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        if self._read_header() != MAGIC:
+            raise ValueError('{} is not a journal index'.format(self._index_path))
+
+    def _read_header(self):
+        magic, self._capacity, self._count, self._indexed, self._hwm = HEADER.unpack_from(self._index, 0)
+        return magic
+
+    def _close_index(self):
+        if self._index is not None:
+            self._index.close()
+            self._index_file.close()
+            self._index = self._index_file = None
+
+    def _write_header(self):
+        HEADER.pack_into(self._index, 0, MAGIC, self._capacity, self._count, self._indexed, self._hwm)
+
+    def _slots(self, digest):
+        """Yields ``(slot, key, slot key, record + 1)`` along the probe sequence of
+        ``digest``, where ``key`` is the slot key ``digest`` would have.
+        """
+        key = int.from_bytes(digest[:8], 'little') or 1
+        slot = key % self._capacity
+        while True:
+            slot_key, record = SLOT.unpack_from(self._index, HEADER.size + slot * SLOT.size)
+            yield slot, key, slot_key, record
+            slot = (slot + 1) % self._capacity
+
+    def _find(self, digest):
+        """Returns ``(slot, key, record)`` of ``digest``, or its free slot and None."""
+        for slot, key, slot_key, record in self._slots(digest):
+            if record == 0:
+                return slot, key, None
+            if slot_key == key and self._record(record - 1)[0] == digest:
+                return slot, key, record - 1
+
+    def _set_slot(self, slot, key, record):
+        SLOT.pack_into(self._index, HEADER.size + slot * SLOT.size, key, record + 1)
+
+    def _build_index(self, capacity, hwm=0.0):
+        """Writes a fresh index of the whole log and swaps it in."""
+        records = self._log_size() // RECORD.size
+        capacity = max(capacity, _capacity_for(records))
+        tmp = self._index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.truncate(HEADER.size + capacity * SLOT.size)
+        with open(tmp, 'r+b') as f:
+            index = mmap.mmap(f.fileno(), 0)
+            HEADER.pack_into(index, 0, MAGIC, capacity, 0, 0, hwm)
+            index.close()
+        os.replace(tmp, self._index_path)
+        self._open_index()
+        self._index_records(0, records)
+        self._write_header()
+
+    def _index_records(self, start, end):
+        for record in range(start, end):
+            digest = self._record(record)[0]
+            slot, key, existing = self._find(digest)
+            if existing is None:
+                self._count += 1
+            self._set_slot(slot, key, record)
+        self._indexed = end
+
+    def _catch_up(self):
+        """Indexes records appended after the index was last written, e.g. by a
+        process that died in between.
+        """
+        records = self._log_size() // RECORD.size
+        if records > self._indexed:
+            logger.info('Indexing {} journal records'.format(records - self._indexed))
+            self._grow(records - self._indexed)
+            self._index_records(self._indexed, records)
+            self._write_header()
+
+    def _grow(self, adding):
+        if self._count + adding > self._capacity * MAX_LOAD:
+            self._build_index(_capacity_for(self._count + adding), self._hwm)
+
+    def _refresh(self):
+        """Catches up with what other processes wrote: a compacted log, a rebuilt
+        index or new records and high-water mark in the header.
+        """
+        if _replaced(self._log_path, self._log):
+            self._close_log_map()
+            self._log.close()
+            self._log = open(self._log_path, 'a+b')
+        if _replaced(self._index_path, self._index_file):
+            self._open_index()
+        else:
+            self._read_header()
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        fcntl.flock(self._lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            if self._index is not None:
+                self._refresh()
+            yield
+        finally:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+    # -- log -------------------------------------------------------------------
+
+    def _log_size(self):
+        return os.fstat(self._log.fileno()).st_size
+
+    def _close_log_map(self):
+        if self._log_map is not None:
+            self._log_map.close()
+            self._log_map = None
+
+    def _record(self, record):
+        offset = record * RECORD.size
+        if self._log_map is None or offset + RECORD.size > len(self._log_map):
+            self._close_log_map()
+            self._log_map = mmap.mmap(self._log.fileno(), 0, access=mmap.ACCESS_READ)
+        return RECORD.unpack_from(self._log_map, offset)
+
+    # -- api -------------------------------------------------------------------
+
+    def __len__(self):
+        with self._locked(shared=True):
+            return self._count
+
+    @property
+    def records(self):
+        with self._locked(shared=True):
+            return self._indexed
+
+    @property
+    def high_water_mark(self):
+        with self._locked(shared=True):
+            return self._hwm or None
+
+    def get_many(self, identities):
+        """Returns the latest fingerprint (or None) of each identity, in order."""
+        fps = []
+        with self._locked(shared=True):
+            for identity in identities:
+                _, _, record = self._find(_digest(identity))
+                fps.append(self._record(record)[1].hex() if record is not None else None)
+        return fps
+
+    def put_many(self, fingerprints, high_water_mark=None):
+        """Appends ``fingerprints`` (identity -> fingerprint) and moves the high-water
+        mark (a POSIX timestamp).
+        """
+        now = time.time()
+        with self._locked():
+            self._catch_up()
+            self._grow(len(fingerprints))
+            start = self._log_size() // RECORD.size
+            self._log.seek(0, os.SEEK_END)
+            self._log.write(b''.join(RECORD.pack(_digest(identity), _digest(fp), now)
+                                     for identity, fp in fingerprints.items()))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._index_records(start, start + len(fingerprints))
+            if high_water_mark is not None:
+                self._hwm = high_water_mark
+            self._write_header()
+            self._index.flush()
+        if self._indexed >= COMPACT_MIN_RECORDS and self._indexed > COMPACT_RATIO * self._count:
+            self.compact(self._max_age)
+
+    def compact(self, max_age=None):
+        """Rewrites the log with only the latest record of each identity, dropping
+        those last changed more than ``max_age`` seconds ago.
+        """
+        cutoff = time.time() - max_age if max_age is not None else None
+        with self._locked():
+            self._catch_up()
+            live = sorted(record for _, _, record in self._live_slots())
+            tmp = self._log_path + '.tmp'
+            kept = 0
+            with open(tmp, 'wb') as f:
+                for record in live:
+                    digest, fp, ts = self._record(record)
+                    if cutoff is not None and ts < cutoff:
+                        continue
+                    f.write(RECORD.pack(digest, fp, ts))
+                    kept += 1
+                f.flush()
+                os.fsync(f.fileno())
+            logger.info('Compacted journal {}: {} -> {} records'.format(self._log_path, self._indexed, kept))
+            self._close_log_map()
+            os.replace(tmp, self._log_path)
+            self._log.close()
+            self._log = open(self._log_path, 'a+b')
+            self._build_index(_capacity_for(kept), self._hwm)
+
+    def _live_slots(self):
+        for slot in range(self._capacity):
+            key, record = SLOT.unpack_from(self._index, HEADER.size + slot * SLOT.size)
+            if record:
+                yield slot, key, record - 1
+
+    def close(self):
+        self._close_index()
+        self._close_log_map()
+        self._log.close()
+        self._lock.close()
+
+
+class JournalState():
+    """Drop-in replacement of ``redis.ScrapeState`` backed by a ``Journal`` in the
+    directory ``path``, keeping transactions for ``retention_days`` (by default,
+    forever).
+    """
+    _journals = {}
+
+    def __init__(self, prefix, path, retention_days=None):
+        self._prefix = prefix
+        journal_path = os.path.join(path, prefix.strip(':').replace(':', '-') or 'default')
+        if journal_path not in self._journals:
+            os.makedirs(path, exist_ok=True)
+            max_age = retention_days * redis.DAY if retention_days else None
+            self._journals[journal_path] = Journal(journal_path, max_age)
+        self.journal = self._journals[journal_path]
+
+    @property
+    def high_water_mark(self):
+        hwm = self.journal.high_water_mark
+        return datetime.datetime.fromtimestamp(hwm) if hwm is not None else None
+
+    def lookup(self, identities):
+        if not identities:
+            return []
+        return self.journal.get_many(identities)
+
+    async def high_water_mark_async(self):
+        return self.high_water_mark
+
+    async def lookup_async(self, identities):
+        return self.lookup(identities)
+
+    def commit(self, seen, high_water_mark, pipe=None):
+        """Same as ``ScrapeState.commit``. ``pipe`` is accepted for compatibility; the
+        journal is written right away.
+        """
+        self.journal.put_many(seen, high_water_mark.timestamp())
+
+    def migrate(self, identify):
+        """Seeds the journal from the Redis state (or, failing that, from the latest
+        Redis snapshot). Returns False if there was nothing to migrate.
+        """
+        state = redis.ScrapeState(self._prefix)
+        high_water_mark = state.high_water_mark
+        if high_water_mark is None and state.migrate(identify):
+            high_water_mark = state.high_water_mark
+        if high_water_mark is None:
+            return False
+        seen = {}
+        for identity, fp in redis.client().hscan_iter(state.seen_key):
+            seen[identity.decode('ascii')] = fp.decode('ascii')
+        self.commit(seen, high_water_mark)
+        logger.info('Migrated {} transactions from Redis into {}'.format(len(seen), self._prefix))
+        return True
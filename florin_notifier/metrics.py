@@ -0,0 +1,278 @@
+"""Per-stage timings and counters of jobs.
+
+A job records into a ``Recorder``, labelled with the job kind and the bank::
+
+    recorder = Recorder('notify', bank='tangerine')
+    with recorder.job():
+        with recorder.stage('fetch'):
+            ...
+        recorder.count('fetched', len(txns))
+
+While a job runs its recorder is the thread's current one, so code further down
+(decrypting secrets, logging in, rendering, sending) records with the module level
+``stage()`` and ``count()``, which do nothing outside a job. Work handed to a
+thread pool is attributed to the job with ``recorder.bind(fn)``.
+
+Every measurement goes to the configured sinks. Prometheus (text exposition
+format, written to a file for node_exporter's textfile collector) and StatsD over
+UDP are built in; other sinks can be added to ``SINK_TYPES``.
+"""
+import contextlib
+import functools
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+logger = logging.getLogger(__name__)
+
+
+class Sink():
+    def timing(self, labels, stage, seconds):
+        pass
+
+    def count(self, labels, name, value):
+        pass
+
+    def flush(self):
+        """Called when a job finishes."""
+        pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class PrometheusSink(Sink):
+    """Accumulates the process' measurements and rewrites ``path`` with them in the
+    Prometheus text format after every job. ``{pid}`` in the path is replaced with
+    the process id, so worker processes do not overwrite each other's file.
+    """
+    def __init__(self, path, namespace='florin'):
+        self._path = path.format(pid=os.getpid())
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        self._seconds = defaultdict(float)
+        self._observations = defaultdict(int)
+        self._counters = defaultdict(int)
+
+    @staticmethod
+    def _key(labels, **extra):
+        return tuple(sorted(dict(labels, **extra).items()))
+
+    def timing(self, labels, stage, seconds):
+        key = self._key(labels, stage=stage)
+        with self._lock:
+            self._seconds[key] += seconds
+            self._observations[key] += 1
+
+    def count(self, labels, name, value):
+        with self._lock:
+            self._counters[self._key(labels, kind=name)] += value
+
+    def render(self):
+        def line(name, key, value):
+            labels = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in key)
+            return '{}_{}{{{}}} {}\n'.format(self._namespace, name, labels, value)
+
+        with self._lock:
+            out = ['# HELP {}_stage_seconds Time spent in each stage of a job.\n'.format(self._namespace),
+                   '# TYPE {}_stage_seconds summary\n'.format(self._namespace)]
+            for key in sorted(self._seconds):
+                out.append(line('stage_seconds_sum', key, repr(self._seconds[key])))
+                out.append(line('stage_seconds_count', key, self._observations[key]))
+            out.append('# HELP {}_events_total Transactions fetched, new, imported, ... by jobs.\n'.format(
+                self._namespace))
+            out.append('# TYPE {}_events_total counter\n'.format(self._namespace))
+            for key in sorted(self._counters):
+                out.append(line('events_total', key, self._counters[key]))
+        return ''.join(out)
+
+    def flush(self):
+        # Write and rename, so the collector never reads a partial file
+        tmp = '{}.tmp'.format(self._path)
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, self._path)
+
+
+class StatsdSink(Sink):
+    """Sends every measurement as it is recorded, as ``<prefix>.<job>.<bank>.<name>``."""
+    def __init__(self, host='localhost', port=8125, prefix='florin'):
+        self._address = (host, int(port))
+        self._prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def _name(self, labels, name):
+        parts = [self._prefix] + [str(v) for v in labels.values() if v] + [name]
+        return '.'.join(p.replace('.', '_') for p in parts if p)
+
+    def _send(self, metric):
+        try:
+            self._socket.sendto(metric.encode('utf-8'), self._address)
+        except OSError as e:
+            logger.debug('Could not send metric {}: {!r}'.format(metric, e))
+
+    def timing(self, labels, stage, seconds):
+        self._send('{}:{:.3f}|ms'.format(self._name(labels, stage), seconds * 1000))
+
+    def count(self, labels, name, value):
+        self._send('{}:{}|c'.format(self._name(labels, name), value))
+
+
+SINK_TYPES = {
+    'prometheus': PrometheusSink,
+    'statsd': StatsdSink,
+}
+
+
+_sinks = None
+
+
+def configured_sinks():
+    """Returns the sinks configured in the ``metrics`` section of the config, e.g.::
+
+        metrics:
+            statsd: {host: localhost, port: 8125}
+    """
+    global _sinks
+    if _sinks is None:
+        from .config import config
+        _sinks = [SINK_TYPES[name](**(options or {}))
+                  for name, options in (config.get('metrics') or {}).items()]
+    return _sinks
+
+
+@contextlib.contextmanager
+def use_sinks(sinks):
+    """Sends the measurements of recorders without sinks of their own to ``sinks``
+    instead of the configured ones inside the block.
+    """
+    global _sinks
+    saved, _sinks = _sinks, sinks
+    try:
+        yield sinks
+    finally:
+        _sinks = saved
+
+
+_local = threading.local()
+
+
+def current():
+    """Returns the recorder of the job running on this thread, or None."""
+    return getattr(_local, 'recorder', None)
+
+
+class Recorder():
+    def __init__(self, job, sinks=None, **labels):
+        self.labels = OrderedDict([('job', job)], **labels)
+        self.timings = OrderedDict()
+        self.counters = OrderedDict()
+        self._sinks = sinks
+        self._lock = threading.Lock()
+        self._depth = 0
+
+    @property
+    def sinks(self):
+        if self._sinks is None:
+            self._sinks = configured_sinks()
+        return self._sinks
+
+    def timing(self, stage, seconds):
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0) + seconds
+        for sink in self.sinks:
+            sink.timing(self.labels, stage, seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for sink in self.sinks:
+            sink.count(self.labels, name, value)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Makes this the current recorder of the thread inside the block."""
+        previous = current()
+        _local.recorder = self
+        try:
+            yield self
+        finally:
+            _local.recorder = previous
+
+    def bind(self, fn):
+        """Wraps ``fn`` so that it records into this recorder on whatever thread runs it."""
+        @functools.wraps(fn)
+        def bound(*args, **kwargs):
+            with self.activate():
+                return fn(*args, **kwargs)
+        return bound
+
+    @contextlib.contextmanager
+    def job(self, activate=True):
+        """Runs the block as the job: it is timed as the ``total`` stage, counted as
+        ``failed`` if it raises, and once the outermost ``job()`` block exits the
+        measurements are logged and the sinks flushed. Nested blocks only make the
+        recorder current. A job sharing its thread with others (a coroutine) passes
+        ``activate=False`` and binds its recorder explicitly instead.
+        """
+        with contextlib.ExitStack() as stack:
+            if activate:
+                stack.enter_context(self.activate())
+            self._depth += 1
+            if self._depth > 1:
+                try:
+                    yield self
+                finally:
+                    self._depth -= 1
+                return
+            try:
+                with self.stage('total'):
+                    yield self
+            except Exception:
+                self.count('failed')
+                raise
+            finally:
+                self._depth -= 1
+                self.finish()
+
+    def finish(self):
+        logger.info('{} {}'.format(
+            ' '.join('{}={}'.format(k, v) for k, v in self.labels.items()),
+            ' '.join(['{}={:.3f}s'.format(k, v) for k, v in self.timings.items()] +
+                     ['{}={}'.format(k, v) for k, v in self.counters.items()])))
+        for sink in self.sinks:
+            try:
+                sink.flush()
+            except Exception as e:
+                logger.warning('Could not flush metrics to {!r}: {!r}'.format(sink, e))
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Times the block into the current recorder, if there is one."""
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    with recorder.stage(name):
+        yield
+
+
+def count(name, value=1):
+    recorder = current()
+    if recorder is not None:
+        recorder.count(name, value)
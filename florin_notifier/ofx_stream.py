@@ -0,0 +1,172 @@
+"""Streaming OFX reader.
+
+``ofxparse`` builds a BeautifulSoup tree of the whole document before it hands back
+any transaction. ``iter_ofx`` instead tokenizes the file chunk by chunk and yields
+each ``<STMTTRN>`` as soon as its closing tag is read, so memory use does not depend
+on the size of the statement.
+
+The values are normalized with ofxparse's own helpers, so the ``Account`` and
+``Transaction`` objects it yields hash to the same ids as the ones ofxparse builds.
+Only bank and credit card statements are supported.
+"""
+import datetime
+import functools
+import html
+import logging
+import re
+from collections import namedtuple
+from ofxparse import Account, AccountType, OfxParser, Transaction
+from ofxparse.ofxparse import Institution
+
+
+logger = logging.getLogger(__name__)
+
+
+TOKEN = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+DTPOSTED = re.compile(r'<DTPOSTED>\s*(\d{8})', re.IGNORECASE)
+
+STATEMENT_TYPES = {
+    'STMTRS': AccountType.Bank,
+    'CCSTMTRS': AccountType.CreditCard,
+}
+
+Balance = namedtuple('Balance', ['balance', 'balance_date'])
+
+# ofxparse.OfxParser.toDecimal reads the value off a tag's contents
+_Tag = namedtuple('_Tag', ['contents'])
+
+
+class _Parser(OfxParser):
+    # OfxParser.parse() sets these on the class; pin the defaults for the helpers
+    fail_fast = True
+    custom_date_format = None
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_datetime(value):
+    return _Parser.parseOfxDateTime(value)
+
+
+def parse_decimal(value):
+    return _Parser.toDecimal(_Tag([value]))
+
+
+def tokens(fileobj, chunk_size):
+    """Yields ``(slash, tag, text)`` for every tag in the file, one chunk at a time."""
+    buf = ''
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('latin-1')
+        if not chunk:
+            break
+        buf += chunk
+        # Only tokenize up to the last '<', the tag after it may be incomplete
+        end = buf.rfind('<')
+        if end <= 0:
+            continue
+        yield from TOKEN.findall(buf, 0, end)
+        buf = buf[end:]
+    yield from TOKEN.findall(buf)
+
+
+def build_transaction(fields):
+    txn = Transaction()
+    txn.type = fields.get('TRNTYPE', '').lower()
+    txn.payee = fields.get('NAME', '')
+    txn.memo = fields.get('MEMO', '')
+    txn.amount = parse_decimal(fields['TRNAMT'])
+    txn.date = parse_datetime(fields['DTPOSTED'])
+    if 'DTUSER' in fields:
+        txn.user_date = parse_datetime(fields['DTUSER'])
+    txn.id = fields.get('FITID', '')
+    txn.checknum = fields.get('CHECKNUM', '')
+    return txn
+
+
+def iter_ofx(fileobj, chunk_size=64 * 1024):
+    """Yields the contents of an OFX statement as it is read.
+
+    Events are ``('account', ofxparse.Account)`` once an account's details have been
+    read, then ``('transaction', ofxparse.Transaction)`` for each of its transactions,
+    and ``('balance', Balance)`` for its ledger balance. The accounts have no
+    ``statement`` attached.
+    """
+    institution = None
+    account = None
+    account_announced = False
+    fields = None
+    aggregate = None
+    balance = {}
+
+    for slash, tag, text in tokens(fileobj, chunk_size):
+        tag = tag.upper()
+        value = text.strip()
+        if '&' in value:
+            value = html.unescape(value)
+
+        if slash:
+            if tag == 'STMTTRN' and fields is not None:
+                if account is not None and not account_announced:
+                    account_announced = True
+                    yield 'account', account
+                yield 'transaction', build_transaction(fields)
+                fields = None
+            elif tag in ('BANKACCTFROM', 'CCACCTFROM') and account is not None and not account_announced:
+                account_announced = True
+                yield 'account', account
+            elif tag == 'LEDGERBAL' and account is not None and 'BALAMT' in balance and 'DTASOF' in balance:
+                yield 'balance', Balance(parse_decimal(balance['BALAMT']), parse_datetime(balance['DTASOF']))
+            elif tag in STATEMENT_TYPES:
+                account = None
+            if tag == aggregate:
+                aggregate = None
+            continue
+
+        if fields is not None:
+            fields[tag] = value
+        elif tag == 'STMTTRN':
+            fields = {}
+        elif tag in STATEMENT_TYPES:
+            account = Account()
+            account.type = STATEMENT_TYPES[tag]
+            account.institution = institution
+            account_announced = False
+        elif tag == 'INVSTMTRS':
+            logger.warning('Investment statements are not supported in streaming mode. Skipping...')
+        elif tag in ('FI', 'LEDGERBAL'):
+            aggregate = tag
+            if tag == 'FI':
+                institution = Institution()
+            else:
+                balance = {}
+        elif aggregate == 'FI':
+            if tag == 'ORG':
+                institution.organization = value
+            elif tag == 'FID':
+                institution.fid = value
+        elif aggregate == 'LEDGERBAL':
+            balance[tag] = value
+        elif account is not None:
+            if tag == 'CURDEF':
+                account.curdef = value
+            elif tag == 'ACCTID':
+                account.account_id = value
+            elif tag == 'BANKID':
+                account.routing_number = value
+            elif tag == 'BRANCHID':
+                account.branch_id = value
+            elif tag == 'ACCTTYPE':
+                account.account_type = value
+
+
+def latest_posted_date(content):
+    """Returns the date of the latest transaction in an OFX statement, or None.
+
+    A regular expression scan, much cheaper than parsing the statement.
+    """
+    dates = DTPOSTED.findall(content)
+    if not dates:
+        return None
+    return datetime.datetime.strptime(max(dates), '%Y%m%d').date()
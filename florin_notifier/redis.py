@@ -1,6 +1,19 @@
+import asyncio
+import contextlib
+import datetime
 import json
+import logging
 import os
-from redis import Redis
+import zlib
+from redis import ConnectionPool, Redis
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+logger = logging.getLogger(__name__)
 
 
 DAY = 24 * 60 * 60
@@ -10,16 +23,318 @@ REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 
 REDIS_PORT = os.getenv('REDIS_PORT', 6379)
 
-r = Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+class JSONCodec():
+    def encode(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class ZlibCodec(JSONCodec):
+    MAGIC = b'z:'
+
+    def __init__(self, level=6):
+        self._level = level
+
+    def encode(self, obj):
+        return self.MAGIC + zlib.compress(super().encode(obj), self._level)
+
+    def decode(self, data):
+        return super().decode(zlib.decompress(data[len(self.MAGIC):]))
+
+
+class MsgpackCodec():
+    MAGIC = b'm:'
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError('The msgpack codec requires the msgpack package')
+
+    def encode(self, obj):
+        return self.MAGIC + msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data[len(self.MAGIC):], raw=False)
+
+
+CODECS = {
+    'json': JSONCodec,
+    'zlib': ZlibCodec,
+    'msgpack': MsgpackCodec,
+}
 
 
-def store(key, obj):
-    r.set(key, json.dumps(obj), ex=1*DAY)
+def decode(data):
+    """Decodes a value written by any of the codecs, so switching codecs does not
+    strand values written before the switch.
+    """
+    if data.startswith(ZlibCodec.MAGIC):
+        return ZlibCodec().decode(data)
+    if data.startswith(MsgpackCodec.MAGIC):
+        return MsgpackCodec().decode(data)
+    return JSONCodec().decode(data)
+
+
+_client = None
+_async_client = None
+_async_loop = None
+_pool_options = None
+_codec = JSONCodec()
+
+
+def connect(host=REDIS_HOST, port=REDIS_PORT, db=0, max_connections=10,
+            socket_timeout=10, socket_connect_timeout=5, codec='json'):
+    """(Re)creates the pooled clients used by this module."""
+    global _client, _async_client, _pool_options, _codec
+    _pool_options = dict(host=host, port=int(port), db=db,
+                         max_connections=max_connections,
+                         socket_timeout=socket_timeout,
+                         socket_connect_timeout=socket_connect_timeout)
+    _client = Redis(connection_pool=ConnectionPool(**_pool_options))
+    _async_client = None
+    _codec = CODECS[codec]()
+    return _client
+
+
+def client():
+    """Returns the pooled client, creating it from the ``redis`` section of the
+    config on first use.
+    """
+    if _client is None:
+        from .config import config
+        connect(**(config.get('redis') or {}))
+    return _client
+
+
+def async_client():
+    """Returns the asyncio client of the running event loop, created with the same
+    options as ``client()``. Asyncio connections cannot be shared across loops, so a
+    new client is made whenever the loop changes.
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_event_loop()
+    if _async_client is None or _async_loop is not loop:
+        from redis import asyncio as aioredis
+        client()
+        _async_client = aioredis.Redis(connection_pool=aioredis.ConnectionPool(**_pool_options))
+        _async_loop = loop
+    return _async_client
+
+
+@contextlib.contextmanager
+def pipeline(pipe=None, transaction=True):
+    """Batches the commands issued inside the block into one round trip.
+
+    If ``pipe`` is given, the commands are queued on it instead and the caller
+    that owns it executes them.
+    """
+    if pipe is not None:
+        yield pipe
+        return
+    with client().pipeline(transaction=transaction) as pipe:
+        yield pipe
+        pipe.execute()
+
+
+def store(key, obj, pipe=None):
+    with pipeline(pipe) as p:
+        p.set(key, _codec.encode(obj), ex=1*DAY)
 
 
 def retrieve(key):
-    return json.loads(r.get(key))
+    return decode(client().get(key))
 
 
 def get_sorted_keys(key_pattern):
-    return sorted(r.keys(key_pattern))
+    return sorted(client().scan_iter(key_pattern))
+
+
+SNAPSHOT_TTL = 1 * DAY
+
+STATE_TTL = 90 * DAY
+
+SNAPSHOT_TIMESTAMP_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']
+
+
+def parse_snapshot_timestamp(key, prefix):
+    timestamp = key.split(prefix)[-1]
+    for fmt in SNAPSHOT_TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(timestamp, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Unrecognized snapshot timestamp: {}'.format(timestamp))
+
+
+def index_key(prefix):
+    return 'state:index:{}'.format(prefix)
+
+
+def store_snapshot(prefix, timestamp, obj, pipe=None):
+    """Stores ``obj`` under ``<prefix><timestamp>`` and registers the key in the
+    prefix's sorted index, scored by timestamp.
+    """
+    key = '{}{}'.format(prefix, timestamp.isoformat())
+    with pipeline(pipe) as p:
+        p.set(key, _codec.encode(obj), ex=SNAPSHOT_TTL)
+        p.zadd(index_key(prefix), {key: timestamp.timestamp()})
+        # Anything scored before this has expired already
+        p.zremrangebyscore(index_key(prefix), '-inf', '({}'.format(timestamp.timestamp() - SNAPSHOT_TTL))
+    return key
+
+
+def _existing(prefix, keys):
+    """Filters out (and unindexes) keys that have expired."""
+    if not keys:
+        return []
+    with client().pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.exists(key)
+        exists = pipe.execute()
+    expired = [key for key, e in zip(keys, exists) if not e]
+    if expired:
+        client().zrem(index_key(prefix), *expired)
+    return [key for key, e in zip(keys, exists) if e]
+
+
+def latest(prefix):
+    """Returns the key of the latest live snapshot under ``prefix``, or None."""
+    while True:
+        keys = client().zrevrange(index_key(prefix), 0, 0)
+        if not keys:
+            return None
+        if _existing(prefix, keys):
+            return keys[0]
+
+
+def between(prefix, from_, to_):
+    """Returns the keys of the live snapshots taken between ``from_`` and ``to_``
+    (inclusive), oldest first.
+    """
+    keys = client().zrangebyscore(index_key(prefix), from_.timestamp(), to_.timestamp())
+    return _existing(prefix, keys)
+
+
+def reindex(prefix):
+    """Registers snapshots written before the index existed. Uses SCAN, so it does
+    not block the server; returns the number of keys indexed.
+    """
+    scores = {}
+    for key in client().scan_iter('{}*'.format(prefix)):
+        try:
+            scores[key] = parse_snapshot_timestamp(key.decode('ascii'), prefix).timestamp()
+        except ValueError:
+            continue
+    if scores:
+        client().zadd(index_key(prefix), scores)
+    return len(scores)
+
+
+class ScrapeState():
+    """Incremental scrape state of a notifier.
+
+    Keeps a hash of ``identity -> fingerprint`` for every transaction seen so far and
+    a high-water mark of the last scrape, so a run only reads the entries of the
+    transactions it just fetched and only writes the ones that are new or changed.
+    """
+    def __init__(self, prefix, ttl=STATE_TTL):
+        self._prefix = prefix
+        self._seen_key = 'state:seen:{}'.format(prefix)
+        self._hwm_key = 'state:hwm:{}'.format(prefix)
+        self._ttl = ttl
+
+    @property
+    def seen_key(self):
+        return self._seen_key
+
+    @staticmethod
+    def _parse_high_water_mark(hwm):
+        if hwm is None:
+            return None
+        return datetime.datetime.strptime(hwm.decode('ascii'), SNAPSHOT_TIMESTAMP_FORMATS[0])
+
+    @staticmethod
+    def _parse_fingerprints(fps):
+        return [fp.decode('ascii') if fp is not None else None for fp in fps]
+
+    @property
+    def high_water_mark(self):
+        """The time of the last recorded scrape, or None if the state is empty."""
+        return self._parse_high_water_mark(client().get(self._hwm_key))
+
+    def lookup(self, identities):
+        """Returns the stored fingerprint (or None) of each identity, in order."""
+        if not identities:
+            return []
+        return self._parse_fingerprints(client().hmget(self._seen_key, identities))
+
+    async def high_water_mark_async(self):
+        return self._parse_high_water_mark(await async_client().get(self._hwm_key))
+
+    async def lookup_async(self, identities):
+        if not identities:
+            return []
+        return self._parse_fingerprints(await async_client().hmget(self._seen_key, identities))
+
+    def commit(self, seen, high_water_mark, pipe=None):
+        """Records ``seen`` (a mapping of identity -> fingerprint) and moves the
+        high-water mark, in a single round trip.
+        """
+        with pipeline(pipe) as p:
+            if seen:
+                p.hset(self._seen_key, mapping=seen)
+            p.expire(self._seen_key, self._ttl)
+            p.set(self._hwm_key, high_water_mark.strftime(SNAPSHOT_TIMESTAMP_FORMATS[0]), ex=self._ttl)
+
+    def migrate(self, identify):
+        """Seeds the state from the latest ``<prefix><timestamp>`` snapshot.
+
+        ``identify`` maps a transaction to its ``(identity, fingerprint)`` pair.
+        Returns False if there was no usable snapshot.
+        """
+        key = latest(self._prefix)
+        if key is None and reindex(self._prefix):
+            key = latest(self._prefix)
+        if key is None:
+            return False
+        key = key.decode('ascii')
+        try:
+            high_water_mark = parse_snapshot_timestamp(key, self._prefix)
+            txns = retrieve(key)
+        except Exception:
+            logger.warning('Could not migrate snapshot {}.'.format(key))
+            return False
+        self.commit(dict(identify(txn) for txn in txns), high_water_mark)
+        logger.info('Migrated {} transactions from snapshot {}'.format(len(txns), key))
+        return True
+
+
+class Checkpoints():
+    """Newest transaction date imported per account and target, so a statement
+    importer only downloads what is new since.
+    """
+    def __init__(self, prefix):
+        self._prefix = prefix
+
+    def key(self, account_id):
+        return 'checkpoint:{}{}'.format(self._prefix, account_id)
+
+    def get(self, account_id, target_keys):
+        """Returns the checkpoint (a date, or None) of each target, in order."""
+        if not target_keys:
+            return []
+        values = client().hmget(self.key(account_id), target_keys)
+        return [datetime.datetime.strptime(v.decode('ascii'), '%Y-%m-%d').date() if v is not None else None
+                for v in values]
+
+    def advance(self, account_id, target_key, date):
+        """Moves the checkpoint of the target forward to ``date``; never backwards."""
+        [current] = self.get(account_id, [target_key])
+        if current is None or date > current:
+            client().hset(self.key(account_id), target_key, date.isoformat())
+
+    def clear(self, account_ids):
+        if account_ids:
+            client().delete(*[self.key(account_id) for account_id in account_ids])
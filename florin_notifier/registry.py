@@ -0,0 +1,64 @@
+"""Implementations picked by name (a job's ``bank`` or ``type``, a config
+option), imported on first use.
+
+A bank client pulls in its whole scraping stack when imported, so the modules
+are only named here; a worker imports the ones its jobs actually use.
+"""
+import importlib
+import threading
+from collections.abc import MutableMapping
+
+
+def resolve(path):
+    """Imports ``'package.module:attribute'`` and returns the attribute."""
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class Registry(MutableMapping):
+    """Maps names to objects. An object can be registered as a ``'module:attribute'``
+    path, which is resolved the first time it is looked up.
+    """
+    def __init__(self, kind, entries=None):
+        self.kind = kind
+        self._entries = dict(entries or {})
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        if name not in self._entries:
+            raise KeyError('Unknown {}: {}'.format(self.kind, name))
+        entry = self._entries[name]
+        if isinstance(entry, str):
+            with self._lock:
+                entry = self._entries[name]
+                if isinstance(entry, str):
+                    entry = self._entries[name] = resolve(entry)
+        return entry
+
+    def __setitem__(self, name, entry):
+        self._entries[name] = entry
+
+    def __delitem__(self, name):
+        del self._entries[name]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+BANK_CLIENTS = Registry('bank', {
+    'tangerine': 'florin_notifier.clients:tangerine_client_factory',
+    'rogersbank': 'florin_notifier.clients:rogersbank_client_factory',
+})
+
+STATE_BACKENDS = Registry('state backend', {
+    'redis': 'florin_notifier.redis:ScrapeState',
+    'journal': 'florin_notifier.journal:JournalState',
+})
+
+
+def create_client(bank, secret_file):
+    """Creates a client of ``bank`` logging in with the secrets of ``secret_file``."""
+    return BANK_CLIENTS[bank](secret_file)
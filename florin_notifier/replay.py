@@ -0,0 +1,282 @@
+"""Bank responses recorded to files and replayed offline.
+
+    # Run the jobs of the config once, recording what the banks return
+    CONFIG_FILE=config.yaml python -m florin_notifier.replay record fixtures/
+    # Run them against the recording: 10 cycles, 100 times the transactions
+    CONFIG_FILE=config.yaml python -m florin_notifier.replay load-test fixtures/ --cycles 10 --scale 100
+
+``RecordingClient`` wraps a bank client and appends its responses to
+``<bank>.jsonl.gz``; ``ReplayClient`` serves them back in the same order, over and
+over. Jobs run dry either way: emails are rendered but not sent, statements are
+not uploaded, and the Redis state goes to a database of its own (``--redis-db``).
+The load test prints the latency of every stage and the throughput of the run.
+"""
+import argparse
+import contextlib
+import functools
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from . import bank_sessions, metrics, redis, tasks
+from .registry import BANK_CLIENTS
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bank client attributes whose values are recorded; the others are passed through
+RECORDED = ('list_transactions', 'recent_activities', 'list_accounts', 'download_ofx', 'download_statement')
+
+# Responses that are lists of transactions, multiplied by the replay scale
+SCALED = ('list_transactions', 'recent_activities')
+
+NOTIFY_JOBS = {
+    'notify_tangerine_transactions': ('tangerine', tasks.notify_tangerine_transactions),
+    'notify_rogersbank_transactions': ('rogersbank', tasks.notify_rogersbank_transactions),
+}
+
+DEFAULT_REDIS_DB = 15
+
+
+def fixture_path(directory, bank):
+    return os.path.join(directory, '{}.jsonl.gz'.format(bank))
+
+
+class RecordingClient():
+    """Proxies ``client``, appending the value of every ``RECORDED`` attribute (or
+    method call) to the fixture file ``path``.
+    """
+    def __init__(self, client, path):
+        self._client = client
+        self._path = path
+        self._lock = threading.Lock()
+
+    def _record(self, name, call, result):
+        line = json.dumps({'name': name, 'call': call, 'result': result}, default=str)
+        with self._lock, gzip.open(self._path, 'at') as f:
+            f.write(line + '\n')
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        value = getattr(self._client, name)
+        if name not in RECORDED:
+            return value
+        if not callable(value):
+            self._record(name, False, value)
+            return value
+
+        @functools.wraps(value)
+        def recorded(*args, **kwargs):
+            result = value(*args, **kwargs)
+            self._record(name, True, result)
+            return result
+        return recorded
+
+
+def scale_transactions(txns, scale):
+    """Returns ``scale`` copies of every transaction, each with its own identity."""
+    scaled = list(txns)
+    for copy in range(1, scale):
+        for txn in txns:
+            if 'id' in txn:
+                scaled.append(dict(txn, id='{}~{}'.format(txn['id'], copy)))
+            else:
+                scaled.append(dict(txn, replay_copy=copy))
+    return scaled
+
+
+class ReplayClient():
+    """A bank client answering with the responses recorded in ``path``, in the order
+    they were recorded and starting over once they run out. Every response takes
+    ``latency`` seconds, like a bank would.
+    """
+    def __init__(self, path, scale=1, latency=0.0):
+        self._responses = defaultdict(list)
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                entry = json.loads(line)
+                self._responses[entry['name']].append((entry['call'], entry['result']))
+        self._scale = scale
+        self._latency = latency
+        self._positions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def login(self):
+        yield
+
+    def _next(self, name):
+        with self._lock:
+            responses = self._responses[name]
+            _, result = responses[self._positions[name] % len(responses)]
+            self._positions[name] += 1
+        if self._latency:
+            time.sleep(self._latency)
+        if name in SCALED and self._scale > 1:
+            return scale_transactions(result, self._scale)
+        return result
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._responses:
+            raise AttributeError(name)
+        call, _ = self._responses[name][0]
+        if not call:
+            return self._next(name)
+        return lambda *args, **kwargs: self._next(name)
+
+
+class DryRunEmail():
+    """Renders the emails the jobs would send, without sending them."""
+    @staticmethod
+    def send_new_transaction_email(recipient, new_transactions, transaction_adapter):
+        from . import email
+        email.new_transaction_mail(recipient, new_transactions, transaction_adapter)
+
+
+def dry_run_importer(importer_class):
+    """Returns a subclass of ``importer_class`` that only counts what it would upload."""
+    class DryRunImporter(importer_class):
+        def upload(self, statement_content, target_account_id, target):
+            metrics.count('dry_run_bytes', len(statement_content))
+            return True
+    DryRunImporter.__name__ = 'DryRun' + importer_class.__name__
+    return DryRunImporter
+
+
+def job_bank(job):
+    """Returns the bank whose client the job uses, or None if it cannot be replayed."""
+    if job['type'] in NOTIFY_JOBS:
+        return NOTIFY_JOBS[job['type']][0]
+    if job['type'] == 'upload_statement' and job['args']['bank'] in tasks.STATEMENT_IMPORTER:
+        return tasks.STATEMENT_IMPORTER[job['args']['bank']].BANK
+    return None
+
+
+def run_job(job, client):
+    """Runs ``job`` dry, with ``client`` as its bank client."""
+    args = dict(job['args'])
+    if job['type'] in NOTIFY_JOBS:
+        _, notify = NOTIFY_JOBS[job['type']]
+        return notify(args['account_ids'], args['secret_file'], args['recipient'], client, DryRunEmail)
+    importer_class = dry_run_importer(tasks.STATEMENT_IMPORTER[args.pop('bank')])
+    account_ids, targets = args.pop('account_ids'), args.pop('targets')
+    importer = importer_class(args.pop('secret_file'), client=client, **args)
+    return importer(account_ids, targets)
+
+
+def replayable(jobs):
+    jobs = [job for job in jobs or [] if job.get('enabled', True)]
+    for job in jobs:
+        if job_bank(job) is None:
+            logger.warning('Jobs of type {} cannot be replayed. Skip...'.format(job['type']))
+    return [job for job in jobs if job_bank(job) is not None]
+
+
+class StageStats(metrics.Sink):
+    """Collects every timing and counter, per job kind, bank and stage."""
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timing(self, labels, stage, seconds):
+        with self._lock:
+            self.timings[(labels['job'], labels.get('bank'), stage)].append(seconds)
+
+    def count(self, labels, name, value):
+        with self._lock:
+            self.counters[(labels['job'], labels.get('bank'), name)] += value
+
+    @staticmethod
+    def percentile(values, q):
+        values = sorted(values)
+        return values[int(round(q * (len(values) - 1)))]
+
+    def report(self, elapsed):
+        lines = ['{:>8} {:>11} {:>12} {:>6} {:>10} {:>10} {:>10}'.format(
+            'job', 'bank', 'stage', 'count', 'p50 ms', 'p95 ms', 'max ms')]
+        for (job, bank, stage), seconds in sorted(self.timings.items()):
+            lines.append('{:>8} {:>11} {:>12} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                job, bank, stage, len(seconds), self.percentile(seconds, 0.5) * 1e3,
+                self.percentile(seconds, 0.95) * 1e3, max(seconds) * 1e3))
+        lines.append('')
+        lines.append('{:>8} {:>11} {:>12} {:>10} {:>10}'.format('job', 'bank', 'counter', 'total', 'per s'))
+        for (job, bank, name), value in sorted(self.counters.items()):
+            lines.append('{:>8} {:>11} {:>12} {:>10} {:>10.1f}'.format(job, bank, name, value, value / elapsed))
+        jobs = sum(len(seconds) for (_, _, stage), seconds in self.timings.items() if stage == 'total')
+        lines.append('')
+        lines.append('{} jobs in {:.2f}s, {:.1f} jobs/s'.format(jobs, elapsed, jobs / elapsed))
+        return '\n'.join(lines)
+
+
+def record(jobs, directory):
+    """Runs ``jobs`` once against the banks, recording their responses in
+    ``directory``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for job in replayable(jobs):
+        bank = job_bank(job)
+        client = bank_sessions.manager().get(bank, job['args']['secret_file'], BANK_CLIENTS[bank])
+        results.append(run_job(job, RecordingClient(client, fixture_path(directory, bank))))
+    return results
+
+
+def load_test(jobs, directory, cycles=1, scale=1, concurrency=4, latency=0.0):
+    """Runs ``cycles`` scheduler cycles of ``jobs``, each job concurrently with the
+    others, against the recording in ``directory``. Returns the ``StageStats`` and
+    the elapsed seconds.
+    """
+    jobs = replayable(jobs)
+    clients = {}
+    for bank in set(job_bank(job) for job in jobs):
+        clients[bank] = ReplayClient(fixture_path(directory, bank), scale, latency)
+
+    stats = StageStats()
+    with metrics.use_sinks([stats]), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        for cycle in range(cycles):
+            futures = [(job, executor.submit(run_job, job, clients[job_bank(job)])) for job in jobs]
+            for job, future in futures:
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception('Job {} failed'.format(job['type']))
+        elapsed = time.perf_counter() - start
+    return stats, elapsed
+
+
+def main():
+    from .config import config
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['record', 'load-test'])
+    parser.add_argument('directory')
+    parser.add_argument('--cycles', type=int, default=1)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds every bank response takes')
+    parser.add_argument('--redis-db', type=int, default=DEFAULT_REDIS_DB)
+    args = parser.parse_args()
+    logging.basicConfig(level='WARNING')
+
+    # Keep the dry runs' state away from the real one
+    redis.connect(**dict(config.get('redis') or {}, db=args.redis_db))
+    config['state'] = {'backend': 'redis'}
+
+    if args.command == 'record':
+        record(config['jobs'], args.directory)
+        print('Recorded into {}'.format(args.directory))
+        return
+    stats, elapsed = load_test(config['jobs'], args.directory, cycles=args.cycles, scale=args.scale,
+                               concurrency=args.concurrency, latency=args.latency)
+    print(stats.report(elapsed))
+
+
+if __name__ == '__main__':
+    main()
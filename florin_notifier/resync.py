@@ -0,0 +1,47 @@
+"""Backfills statements, ignoring the download checkpoints.
+
+    CONFIG_FILE=config.yaml python -m florin_notifier.resync --since 2017-01-01 [--account 12345 ...]
+
+Runs every enabled Tangerine ``upload_statement`` job of the config once,
+downloading everything since ``--since``. Checkpoints only ever move forward, so
+the scheduled runs carry on from where they were.
+"""
+import argparse
+import datetime
+import logging
+from .tasks import upload_statement
+
+
+RESYNC_BANKS = ('tangerine', 'tangerine_florin')
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def resync(jobs, since, account_ids=None):
+    results = []
+    for job in jobs or []:
+        args = job['args']
+        if job['type'] != 'upload_statement' or args['bank'] not in RESYNC_BANKS or not job.get('enabled', True):
+            continue
+        job_account_ids = [a for a in args['account_ids'] if not account_ids or a in account_ids]
+        if not job_account_ids:
+            continue
+        results.append(upload_statement(**dict(args, account_ids=job_account_ids, full_resync_since=since)))
+    return results
+
+
+def main():
+    from .config import config
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--since', type=parse_date, required=True)
+    parser.add_argument('--account', dest='account_ids', action='append')
+    args = parser.parse_args()
+    logging.basicConfig(level='INFO')
+    for result in resync(config['jobs'], args.since, args.account_ids):
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
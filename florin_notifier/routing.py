@@ -0,0 +1,114 @@
+"""Which queue a job goes to, for running the jobs on several workers.
+
+Every bank has a queue per kind of job (``notify`` or ``import``) and per shard,
+named ``<bank>.<kind>.s<n>``; the jobs of a bank and kind are spread over the
+``shards`` of the ``routing`` section of the config by a consistent hash of the
+job, so a job always goes to the same shard and adding a shard moves only the
+jobs it takes over. Anything else goes to the default ``celery`` queue.
+
+Workers pick the queues they consume::
+
+    celery -A florin_notifier.scheduler worker \\
+        -Q $(python -m florin_notifier.routing queues --shard s0)
+"""
+import argparse
+import bisect
+import hashlib
+from . import single_flight
+from .registry import BANK_CLIENTS
+
+
+DEFAULT_QUEUE = 'celery'
+
+KINDS = ('notify', 'import')
+
+NOTIFY_JOBS = {
+    'notify_tangerine_transactions': 'tangerine',
+    'notify_rogersbank_transactions': 'rogersbank',
+}
+
+# Points per shard on the ring; more points spread the jobs more evenly
+REPLICAS = 100
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing():
+    def __init__(self, nodes, replicas=REPLICAS):
+        self.nodes = list(nodes)
+        points = sorted((_hash('{}#{}'.format(node, i)), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key):
+        """Returns the node owning ``key``: the first one clockwise of its hash."""
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[i]
+
+
+def job_route(job_type, args):
+    """Returns the bank and kind of a job, or None if it uses no bank."""
+    if job_type in NOTIFY_JOBS:
+        return NOTIFY_JOBS[job_type], 'notify'
+    if job_type == 'upload_statement':
+        from .tasks import STATEMENT_IMPORTER
+        return STATEMENT_IMPORTER[args['bank']].BANK, 'import'
+    return None
+
+
+def shard_names(shards):
+    return ['s{}'.format(n) for n in range(shards)]
+
+
+class Router():
+    def __init__(self, shards=1):
+        self.shards = shard_names(shards)
+        self._ring = HashRing(self.shards)
+
+    def queue(self, job_type, args):
+        route = job_route(job_type, args)
+        if route is None:
+            return DEFAULT_QUEUE
+        bank, kind = route
+        return '{}.{}.{}'.format(bank, kind, self._ring.node(single_flight.job_key(job_type, args)))
+
+    def queues(self, shard=None, bank=None, kind=None):
+        """Returns the queues of ``shard``, ``bank`` and ``kind`` (all of them when
+        None). The default queue is consumed by the first shard.
+        """
+        shards = self.shards if shard is None else [shard]
+        queues = ['{}.{}.{}'.format(b, k, s)
+                  for s in shards
+                  for b in sorted(BANK_CLIENTS) if bank in (None, b)
+                  for k in KINDS if kind in (None, k)]
+        if bank is None and kind is None and self.shards[0] in shards:
+            queues.append(DEFAULT_QUEUE)
+        return queues
+
+
+_router = None
+
+
+def router():
+    """Returns the router of the ``routing`` section of the config."""
+    global _router
+    if _router is None:
+        from .config import config
+        _router = Router(**(config.get('routing') or {}))
+    return _router
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['queues'])
+    parser.add_argument('--shard', help='s0, s1, ...')
+    parser.add_argument('--bank', choices=sorted(BANK_CLIENTS))
+    parser.add_argument('--kind', choices=KINDS)
+    args = parser.parse_args()
+    print(','.join(router().queues(shard=args.shard, bank=args.bank, kind=args.kind)))
+
+
+if __name__ == '__main__':
+    main()
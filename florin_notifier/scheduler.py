@@ -1,19 +1,54 @@
+import functools
 import logging
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 from .tasks import (
     notify_rogersbank_transactions as _notify_rogersbank_transactions,
     notify_tangerine_transactions as _notify_tangerine_transactions,
     upload_statement as _upload_statement,
 )
+from .email import flush_digests as _flush_digests
 from .config import config
+from . import bank_limits, email, routing, secret_cache, single_flight
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Sends every job to the queue of its bank, kind and shard; see ``routing``."""
+    return {'queue': routing.router().queue(name.rsplit('.', 1)[-1], kwargs or {})}
 
 
 app = Celery()
+app.conf.task_routes = (route_task,)
+
+
+def scheduler_options():
+    return config.get('scheduler') or {}
+
+
+def single_flight_task(fn):
+    """Registers ``fn`` as a task of which one run at a time is allowed per set of
+    arguments; see ``single_flight``. A job using a bank also waits for a slot
+    within the bank's limits; see ``bank_limits``.
+    """
+    def limited(**kwargs):
+        route = routing.job_route(fn.__name__, kwargs)
+        if route is None:
+            return fn(**kwargs)
+        with bank_limits.limits(route[0]).slot():
+            return fn(**kwargs)
 
-notify_rogersbank_transactions = app.task(_notify_rogersbank_transactions)
-notify_tangerine_transactions = app.task(_notify_tangerine_transactions)
-upload_statement = app.task(_upload_statement)
+    @functools.wraps(fn)
+    def run(**kwargs):
+        lease = scheduler_options().get('lease', single_flight.DEFAULT_LEASE)
+        return single_flight.run(fn.__name__, limited, kwargs, lease=lease)
+    return app.task(run)
+
+
+notify_rogersbank_transactions = single_flight_task(_notify_rogersbank_transactions)
+notify_tangerine_transactions = single_flight_task(_notify_tangerine_transactions)
+upload_statement = single_flight_task(_upload_statement)
+flush_digests = app.task(_flush_digests)
 
 
 logging.basicConfig(level='INFO')
@@ -21,8 +56,21 @@ logging.basicConfig(level='INFO')
 
 @app.on_after_configure.connect
 def setup(sender, **kwargs):
-    for job in config['jobs']:
+    max_jitter = scheduler_options().get('jitter', 0)
+    for job in config['jobs'] or []:
         if job.get('enabled', True):
             fn = globals()[job['type']]
             ct = crontab(**job['schedule'])
-            sender.add_periodic_task(ct, fn.s(**job['args']))
+            key = single_flight.job_key(job['type'], job['args'])
+            # Jobs on the same schedule start up to max_jitter seconds apart
+            sender.add_periodic_task(ct, fn.s(**job['args']), name='{} {}'.format(job['type'], key[:12]),
+                                     countdown=single_flight.jitter(key, max_jitter))
+
+    if config.get('digest'):
+        sender.add_periodic_task(config['digest'].get('flush_interval', 60), flush_digests.s())
+
+
+@worker_process_init.connect
+def warm_up(**kwargs):
+    secret_cache.warm(config['jobs'])
+    email.templates()
@@ -0,0 +1,108 @@
+"""In-process cache of decrypted secret files.
+
+Decrypting a secret forks ``gpg`` and does an asymmetric decrypt, which takes
+seconds on a small host. ``SecretCache`` keeps the decrypted secret in memory
+(it is never written anywhere) keyed by the file's path and mtime, so editing
+the file takes effect on the next run, and drops it after ``ttl`` seconds.
+"""
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TTL = 60 * 60
+
+
+_gpg = None
+
+
+def gpg_decrypt(filename):
+    """Decrypts a gpg encrypted JSON file."""
+    global _gpg
+    if _gpg is None:
+        import gnupg
+        _gpg = gnupg.GPG(gnupghome=os.path.expanduser('~/.gnupg'))
+    with open(filename) as f:
+        crypt = _gpg.decrypt(f.read())
+    return json.loads(crypt.data.decode('ascii'))
+
+
+class SecretCache():
+    def __init__(self, ttl=DEFAULT_TTL, decrypt=gpg_decrypt, clock=time.monotonic):
+        self._ttl = ttl
+        self._decrypt = decrypt
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._file_locks = {}
+
+    def _file_lock(self, path):
+        with self._lock:
+            return self._file_locks.setdefault(path, threading.Lock())
+
+    def get(self, filename):
+        """Returns a copy of the decrypted secret of ``filename``, decrypting it
+        only if it is not cached, has expired or the file has changed.
+        """
+        path = os.path.abspath(filename)
+        mtime = os.stat(path).st_mtime_ns
+        # One decrypt per file even when several jobs ask for it at once
+        with self._file_lock(path):
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != mtime or self._clock() >= entry[1]:
+                logger.info('Decrypting {}'.format(filename))
+                with metrics.stage('decrypt'):
+                    secret = self._decrypt(path)
+                entry = (mtime, self._clock() + self._ttl, secret)
+                if self._ttl > 0:
+                    self._entries[path] = entry
+            return copy.deepcopy(entry[2])
+
+    def warm(self, filenames):
+        """Decrypts ``filenames`` ahead of time. Files that cannot be decrypted are
+        logged and skipped; returns the number of files cached.
+        """
+        warmed = 0
+        for filename in set(filenames):
+            try:
+                self.get(filename)
+                warmed += 1
+            except Exception as e:
+                logger.warning('Could not decrypt {}: {!r}'.format(filename, e))
+        return warmed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def secret_files(jobs):
+    """Returns the secret files used by the enabled ``jobs``."""
+    return [job['args']['secret_file'] for job in jobs or []
+            if job.get('enabled', True) and 'secret_file' in job.get('args', {})]
+
+
+_cache = None
+
+
+def cache():
+    """Returns the process wide cache, configured from the ``secret_cache``
+    section of the config on first use.
+    """
+    global _cache
+    if _cache is None:
+        from .config import config
+        options = config.get('secret_cache') or {}
+        _cache = SecretCache(ttl=options.get('ttl', DEFAULT_TTL))
+    return _cache
+
+
+def warm(jobs):
+    return cache().warm(secret_files(jobs))
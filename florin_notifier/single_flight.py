@@ -0,0 +1,132 @@
+"""At most one run of a job at a time, across workers.
+
+A run holds a Redis lock named after the job (its type and arguments) for a
+``lease`` of seconds, which a heartbeat thread keeps extending while the job runs,
+so a crashed worker's lock expires on its own. A trigger that finds the job
+running does not wait or queue: it flags the running one to go once more when it
+is done, so any number of overlapping triggers add up to one follow-up run.
+"""
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from redis import WatchError
+from . import redis
+
+
+logger = logging.getLogger(__name__)
+
+
+LOCK_PREFIX = 'lock:job:'
+
+PENDING_PREFIX = 'pending:job:'
+
+DEFAULT_LEASE = 60
+
+# A follow-up flag outlives a worker that crashed before it could see it, but not forever
+PENDING_TTL = redis.DAY
+
+
+def job_key(name, kwargs):
+    """Identifies a job by its type and arguments."""
+    signature = json.dumps([name, kwargs], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+
+def jitter(key, max_jitter):
+    """Spreads jobs that share a schedule over ``max_jitter`` seconds. The delay of a
+    job is derived from its key, so it is the same on every run.
+    """
+    if not max_jitter:
+        return 0
+    return int(key, 16) % (int(max_jitter) + 1)
+
+
+class Lease():
+    """The lock of a job, held for ``lease`` seconds at a time and renewed every
+    third of that by a heartbeat thread until it is released.
+    """
+    def __init__(self, key, lease=DEFAULT_LEASE):
+        self.key = LOCK_PREFIX + key
+        self._lease_ms = int(lease * 1000)
+        self._token = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.lost = False
+
+    def acquire(self):
+        """Takes the lock if it is free, and starts the heartbeat. Returns whether
+        the lock was taken.
+        """
+        if not redis.client().set(self.key, self._token, nx=True, px=self._lease_ms):
+            return False
+        self._heartbeat = threading.Thread(target=self._beat, name='lease-{}'.format(self.key), daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def _if_held(self, command):
+        """Runs ``command(pipe)`` atomically if the lock is still ours."""
+        with redis.client().pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                if pipe.get(self.key) != self._token.encode('ascii'):
+                    return False
+                pipe.multi()
+                command(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def renew(self):
+        return self._if_held(lambda pipe: pipe.pexpire(self.key, self._lease_ms))
+
+    def _beat(self):
+        while not self._stop.wait(self._lease_ms / 3000):
+            try:
+                renewed = self.renew()
+            except Exception as e:
+                logger.warning('Could not renew {}: {!r}'.format(self.key, e))
+                continue
+            if not renewed:
+                logger.warning('Lost {}; another run of the job may start'.format(self.key))
+                self.lost = True
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        self._if_held(lambda pipe: pipe.delete(self.key))
+
+
+def run(name, fn, kwargs, lease=DEFAULT_LEASE):
+    """Calls ``fn(**kwargs)`` unless the same job is running elsewhere, in which case
+    that run is asked for one follow-up run and None is returned.
+    """
+    key = job_key(name, kwargs)
+    pending_key = PENDING_PREFIX + key
+    result = None
+    follow_up = False
+    while True:
+        job_lease = Lease(key, lease)
+        if not job_lease.acquire():
+            if follow_up:
+                # Another trigger took over, and reruns the job itself
+                return result
+            redis.client().set(pending_key, 1, ex=PENDING_TTL)
+            # The running job may have finished before it could see the flag
+            if not job_lease.acquire():
+                logger.info('{} is already running; it will run once more when done'.format(name))
+                return None
+        try:
+            # This run covers every trigger so far
+            redis.client().delete(pending_key)
+            result = fn(**kwargs)
+        finally:
+            job_lease.release()
+        if not redis.client().exists(pending_key):
+            return result
+        logger.info('{} was triggered while running; running it again'.format(name))
+        follow_up = True
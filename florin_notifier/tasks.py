@@ -1,45 +1,33 @@
-import base64
-import requests
+import asyncio
 import logging
-import json
 import datetime
-import os
-import gnupg
-from rogersbank.client import RogersBankClient
-from rogersbank.secret_provider import DictionaryBasedSecretProvider as RogersBankSecretProvider
-from tangerine import TangerineClient, DictionaryBasedSecretProvider as TangerineSecretProvider
+import functools
+import inspect
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dateutil.relativedelta import relativedelta
 from .couchdb_importer import CouchDBImporter
-from . import redis
+from .diff import fingerprint
+from .registry import BANK_CLIENTS, STATE_BACKENDS, Registry
+from . import bank_sessions, firefly, metrics, redis
 
 
 logger = logging.getLogger(__name__)
 
 
-def create_provider(filename, provider_factory):
-    gpg = gnupg.GPG(gnupghome=os.path.expanduser('~/.gnupg'))
-    with open(filename) as f:
-        crypt = gpg.decrypt(f.read())
-    secret = json.loads(crypt.data.decode('ascii'))
-    return provider_factory(secret)
-
-
-def get_new_transactions(previous, current):
-    return [txn for txn in current if txn not in previous]
-
-
-def tangerine_client_factory(secret_file):
-    secret_provider = create_provider(secret_file, provider_factory=TangerineSecretProvider)
-    tangerine_client = TangerineClient(secret_provider)
-    return tangerine_client
-
-
 class NewTransactionNotifier():
-    def __init__(self, account_ids, recipient, client=None, email=None):
+    BANK = None
+    # Fields hashed to decide whether two scraped transactions are equal. None means all fields.
+    FINGERPRINT_FIELDS = None
+    # Fields that identify a transaction across scrapes, so that a transaction whose other
+    # fields change (e.g. pending -> posted) is reported as changed rather than added.
+    IDENTITY_FIELDS = None
+
+    def __init__(self, account_ids, recipient, client=None, email=None, metrics_recorder=None):
         self._account_ids = account_ids
         self._recipient = recipient
         self._client = client
+        self.metrics = metrics_recorder or metrics.Recorder('notify', bank=self.BANK)
 
         if not email:
             from . import email
@@ -53,9 +41,6 @@ class NewTransactionNotifier():
     def client(self):
         return self._client
 
-    def get_new_transactions(self, previous, current):
-        return [txn for txn in current if txn not in previous]
-
     def group_transactions_by_account_id(self, txns):
         return txns
 
@@ -72,38 +57,127 @@ class NewTransactionNotifier():
     def fetch_current_transactions(self):
         raise NotImplementedError()
 
-    def __call__(self):
-        previous_scrapes = redis.get_sorted_keys('{}*'.format(self.key_prefix))
-
-        now = datetime.datetime.now()
-        from_ = (now - datetime.timedelta(days=1)).date()
-
-        if len(previous_scrapes) < 1:
-            previous = []
-        else:
-            key = previous_scrapes[-1]
-            try:
-                key = key.decode('ascii')
-                from_ = key.split(self.key_prefix)[-1]
-                from_ = datetime.datetime.strptime(from_, '%Y-%m-%dT%H:%M:%S.%f')
-                previous = redis.retrieve(key)
-            except:
-                logger.warn('Could not process key: {}.'.format(key))
-                previous = []
+    def identify(self, txn):
+        """Returns the ``(identity, fingerprint)`` pair of a scraped transaction."""
+        fp = fingerprint(txn, self.FINGERPRINT_FIELDS)
+        if self.IDENTITY_FIELDS is None:
+            return fp, fp
+        return fingerprint(txn, self.IDENTITY_FIELDS), fp
 
+    def select_unseen(self, current, identities, known):
+        """Returns the transactions in ``current`` whose fingerprint differs from the
+        ``known`` one, and the state entries to record for them.
+        """
+        unseen, seen, changed = [], {}, 0
+        for txn, (identity, fp), known_fp in zip(current, identities, known):
+            if known_fp == fp:
+                continue
+            if known_fp is not None:
+                changed += 1
+            unseen.append(txn)
+            seen[identity] = fp
+        logger.info('{} added, {} changed transactions'.format(len(unseen) - changed, changed))
+        self.metrics.count('fetched', len(current))
+        self.metrics.count('added', len(unseen) - changed)
+        self.metrics.count('changed', changed)
+        return unseen, seen
+
+    def filter_unseen(self, state, current):
+        """Returns the transactions in ``current`` that are new or changed since they
+        were last recorded in ``state``, and the state entries to record for them.
+        """
+        with self.metrics.stage('diff'):
+            identities = [self.identify(txn) for txn in current]
+        with self.metrics.stage('redis_load'):
+            known = state.lookup([identity for identity, _ in identities])
+        return self.select_unseen(current, identities, known)
+
+    async def filter_unseen_async(self, state, current):
+        with self.metrics.stage('diff'):
+            identities = [self.identify(txn) for txn in current]
+        with self.metrics.stage('redis_load'):
+            known = await state.lookup_async([identity for identity, _ in identities])
+        return self.select_unseen(current, identities, known)
+
+    def open_state(self):
+        """Returns the scrape state of the backend selected by the ``state`` section
+        of the config (Redis by default).
+        """
+        from .config import config
+        options = dict(config.get('state') or {})
+        name = options.pop('backend', 'redis')
+        backend = STATE_BACKENDS[name]
+        unknown = sorted(set(options) - set(inspect.signature(backend).parameters))
+        if unknown:
+            raise ValueError('The {} state backend does not take {}'.format(name, ', '.join(unknown)))
+        return backend(self.key_prefix, **options)
+
+    def scrape_period(self, now, high_water_mark):
+        from_ = high_water_mark or (now - datetime.timedelta(days=1)).date()
         to_ = now.date() + datetime.timedelta(days=1)
         logger.info('Scrapping from {} to {}'.format(from_, to_))
+        return from_, to_
 
-        key = '{}{}'.format(self.key_prefix, now.isoformat())
+    def fetch(self, period_from, period_to):
         with self.client.login():
-            current = self.fetch_current_transactions(from_, to_)
-            redis.store(key, current)
+            with self.metrics.stage('fetch'):
+                return self.fetch_current_transactions(period_from, period_to)
 
-        new_transactions = self.group_transactions_by_account_id(self.get_new_transactions(previous, current))
-        self._email.send_new_transaction_email(self._recipient, new_transactions, self.transaction_adapter)
+    def __call__(self):
+        with self.metrics.job():
+            state = self.open_state()
+            with self.metrics.stage('redis_load'):
+                high_water_mark = state.high_water_mark
+                if high_water_mark is None and state.migrate(self.identify):
+                    high_water_mark = state.high_water_mark
+
+            now = datetime.datetime.now()
+            current = self.fetch(*self.scrape_period(now, high_water_mark))
+
+            unseen, seen = self.filter_unseen(state, current)
+            with self.metrics.stage('redis_store'), redis.pipeline() as pipe:
+                state.commit(seen, now, pipe)
+                redis.store_snapshot(self.key_prefix, now, unseen, pipe)
+
+            new_transactions = self.group_transactions_by_account_id(unseen)
+            self._email.send_new_transaction_email(self._recipient, new_transactions, self.transaction_adapter)
+
+    async def run_async(self, executor=None):
+        """Same as calling the notifier, but on an event loop: the blocking bank client
+        runs on ``executor`` while Redis and SendGrid are used asynchronously.
+        """
+        loop = asyncio.get_event_loop()
+        # Coroutines of other jobs run on this thread too, so the recorder is only
+        # made current on the executor threads.
+        bind = self.metrics.bind
+        with self.metrics.job(activate=False):
+            state = self.open_state()
+            with self.metrics.stage('redis_load'):
+                high_water_mark = await state.high_water_mark_async()
+                if high_water_mark is None and \
+                        await loop.run_in_executor(executor, bind(state.migrate), self.identify):
+                    high_water_mark = await state.high_water_mark_async()
+
+            now = datetime.datetime.now()
+            current = await loop.run_in_executor(executor, bind(self.fetch),
+                                                 *self.scrape_period(now, high_water_mark))
+
+            unseen, seen = await self.filter_unseen_async(state, current)
+            with self.metrics.stage('redis_store'):
+                async with redis.async_client().pipeline() as pipe:
+                    state.commit(seen, now, pipe)
+                    redis.store_snapshot(self.key_prefix, now, unseen, pipe)
+                    await pipe.execute()
+
+            new_transactions = self.group_transactions_by_account_id(unseen)
+            await self._email.send_new_transaction_email_async(self._recipient, new_transactions,
+                                                               self.transaction_adapter, recorder=self.metrics)
 
 
 class TangerineTransactionNotifier(NewTransactionNotifier):
+    BANK = 'tangerine'
+    IDENTITY_FIELDS = ['account_id', 'id']
+
     @property
     def key_prefix(self):
         return 'scrape:tangerine:'
@@ -124,20 +198,34 @@ class TangerineTransactionNotifier(NewTransactionNotifier):
 
 
 class RogersBankTransactionNotifier(NewTransactionNotifier):
-    def __init__(self, account_ids, *args, **kwargs):
-        if len(account_ids) != 1:
-            raise AssertionError('Currently only one account for RogersBank per login is supported')
-        super().__init__(account_ids, *args, **kwargs)
+    BANK = 'rogersbank'
+    # When a login has several cards, the client tags each activity with its card's
+    # account id. Untagged activities can only belong to a single configured account.
+    ACCOUNT_FIELD = 'account_id'
 
     @property
     def key_prefix(self):
         return 'scrape:rogersbank:'
 
+    def account_of(self, txn):
+        account_id = txn.get(self.ACCOUNT_FIELD)
+        if account_id:
+            return account_id
+        if len(self._account_ids) > 1:
+            raise ValueError('This rogersbank client does not tell which card an activity belongs to; '
+                             'configure one account per job')
+        return self._account_ids[0]
+
     def fetch_current_transactions(self, period_from, period_to):
-        return self.client.recent_activities
+        # One request for the activities of every card of the login
+        activities = self.client.recent_activities
+        return [txn for txn in activities if self.account_of(txn) in self._account_ids]
 
     def group_transactions_by_account_id(self, txns):
-        return {self._account_ids[0]: txns}  # TODO: single account supported currently
+        grouped_txns = defaultdict(list)
+        for txn in txns:
+            grouped_txns[self.account_of(txn)].append(txn)
+        return grouped_txns
 
 
 def notify_tangerine_transactions(account_ids,
@@ -145,11 +233,12 @@ def notify_tangerine_transactions(account_ids,
                                   recipient,
                                   tangerine_client=None,
                                   email=None):
-    if tangerine_client is None:
-        secret_provider = create_provider(secret_file, provider_factory=TangerineSecretProvider)
-        tangerine_client = TangerineClient(secret_provider)
-    notifier = TangerineTransactionNotifier(account_ids, recipient, tangerine_client, email)
-    return notifier()
+    recorder = metrics.Recorder('notify', bank='tangerine')
+    with recorder.job():
+        if tangerine_client is None:
+            tangerine_client = bank_sessions.manager().get('tangerine', secret_file, BANK_CLIENTS['tangerine'])
+        notifier = TangerineTransactionNotifier(account_ids, recipient, tangerine_client, email, recorder)
+        return notifier()
 
 
 def notify_rogersbank_transactions(account_ids,
@@ -157,71 +246,224 @@ def notify_rogersbank_transactions(account_ids,
                                    recipient,
                                    rogersbank_client=None,
                                    email=None):
-    if rogersbank_client is None:
-        secret_provider = create_provider(secret_file, provider_factory=RogersBankSecretProvider)
-        rogersbank_client = RogersBankClient(secret_provider)
-    notifier = RogersBankTransactionNotifier(account_ids, recipient, rogersbank_client, email)
-    return notifier()
+    recorder = metrics.Recorder('notify', bank='rogersbank')
+    with recorder.job():
+        if rogersbank_client is None:
+            rogersbank_client = bank_sessions.manager().get('rogersbank', secret_file, BANK_CLIENTS['rogersbank'])
+        notifier = RogersBankTransactionNotifier(account_ids, recipient, rogersbank_client, email, recorder)
+        return notifier()
+
+
+class ImportResult():
+    """Outcome of a statement import.
+
+    ``imported`` and ``failed`` hold ``(account_id, target, value)`` tuples, where value
+    is what ``upload`` returned or the exception that was raised. A failed download
+    is reported with a ``None`` target.
+    """
+    def __init__(self):
+        self.imported = []
+        self.failed = []
+        self.skipped = []
 
+    @property
+    def ok(self):
+        return not self.failed
 
-class RogersBankStatementImporter():
-    def __init__(self, secret_file):
-        secret_provider = create_provider(secret_file, provider_factory=RogersBankSecretProvider)
-        self._client = RogersBankClient(secret_provider)
+    def __repr__(self):
+        return '<ImportResult imported={} failed={} skipped={}>'.format(
+            len(self.imported), len(self.failed), len(self.skipped))
 
-    def upload(self, statement_content, target_account_id, target):
-        raise NotImplemented()
+
+class StatementImporter():
+    BANK = None
+    DEFAULT_CONCURRENCY = 4
+
+    def __init__(self, concurrency=None, metrics_recorder=None):
+        self._concurrency = concurrency or self.DEFAULT_CONCURRENCY
+        self.metrics = metrics_recorder or metrics.Recorder('import', bank=self.BANK)
 
     def __call__(self, account_ids, targets):
-        assert len(account_ids) == 1
-        with self._client.login():
-            content = self._client.download_statement('00', save=False)
+        with self.metrics.job():
+            return self.import_statements(account_ids, targets)
+
+    def import_statements(self, account_ids, targets):
+        raise NotImplementedError()
 
+    def upload(self, statement_content, target_account_id, target):
+        raise NotImplementedError()
+
+    def timed_upload(self, statement_content, target_account_id, target):
+        with self.metrics.stage('upload'):
+            return self.upload(statement_content, target_account_id, target)
+
+    def submit_uploads(self, executor, account_id, statement_content, targets):
+        """Uploads one downloaded statement to every target concurrently."""
+        futures = {}
         for target in targets:
             account_id_mapping = target.get('account_id_mapping') or {}
-            target_account_id = account_id_mapping.get(account_ids[0])
-            self.upload(content, target_account_id, target)
+            target_account_id = account_id_mapping.get(account_id)
+            future = executor.submit(self.metrics.bind(self.timed_upload),
+                                     statement_content, target_account_id, target)
+            futures[future] = (account_id, target)
+        return futures
+
+    def transfer(self, downloads, targets, result, download_concurrency=None):
+        """Runs ``downloads`` (account id -> function returning its statement)
+        concurrently, ``download_concurrency`` at a time, and uploads each statement
+        to every target as soon as it is downloaded. Returns the downloaded statements
+        by account id.
+        """
+        statements = {}
+        with ThreadPoolExecutor(max_workers=download_concurrency or self._concurrency) as download_executor, \
+                ThreadPoolExecutor(max_workers=self._concurrency) as upload_executor:
+            download_futures = {
+                download_executor.submit(self.metrics.bind(download)): account_id
+                for account_id, download in downloads.items()
+            }
+            upload_futures = {}
+            for future in as_completed(download_futures):
+                account_id = download_futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    logger.exception('Failed to download statement of account {}'.format(account_id))
+                    result.failed.append((account_id, None, e))
+                    continue
+                statements[account_id] = content
+                upload_futures.update(self.submit_uploads(upload_executor, account_id, content, targets))
+            self.collect_uploads(upload_futures, result)
+        return statements
+
+    def collect_uploads(self, futures, result):
+        for future in as_completed(futures):
+            account_id, target = futures[future]
+            try:
+                result.imported.append((account_id, target, future.result()))
+                self.metrics.count('uploads')
+            except Exception as e:
+                logger.exception('Failed to upload statement of account {}'.format(account_id))
+                result.failed.append((account_id, target, e))
+                self.metrics.count('failed_uploads')
+
+
+def accepts_keyword(fn, name):
+    try:
+        parameters = inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return True
+    return name in parameters or any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+
+
+class RogersBankStatementImporter(StatementImporter):
+    BANK = 'rogersbank'
+
+    def __init__(self, secret_file, client=None, concurrency=None, metrics_recorder=None):
+        super().__init__(concurrency, metrics_recorder)
+        if client is None:
+            with self.metrics.activate():
+                client = bank_sessions.manager().get('rogersbank', secret_file, BANK_CLIENTS['rogersbank'])
+        self._client = client
+
+    # The current billing cycle
+    BILLING_CYCLE = '00'
+
+    def download(self, account_id=None):
+        """Downloads the statement of the card. ``account_id`` selects the card when the
+        login has several; the client downloads the only card's statement without it.
+        """
+        kwargs = {'account_id': account_id} if account_id is not None else {}
+        with self.metrics.stage('download'):
+            return self._client.download_statement(self.BILLING_CYCLE, save=False, **kwargs)
+
+    def import_statements(self, account_ids, targets):
+        result = ImportResult()
+        if len(account_ids) == 1:
+            downloads = {account_ids[0]: self.download}
+        else:
+            if not accepts_keyword(self._client.download_statement, 'account_id'):
+                raise ValueError('This rogersbank client downloads the statement of one card per login; '
+                                 'configure one account per job')
+            downloads = {account_id: functools.partial(self.download, account_id)
+                         for account_id in account_ids}
+        with self._client.login():
+            # The downloads of a login share its session on the bank's side
+            self.transfer(downloads, targets, result, download_concurrency=1)
+        logger.info('Statement import finished: {}'.format(result))
+        return result
 
 
 class RogersBankFireflyStatementImporter(RogersBankStatementImporter):
     def upload(self, statement_content, target_account_id, target):
-        endpoint = target['endpoint']
-        request_json = {
-            'account_id': target_account_id,
-            'data': base64.b64encode(statement_content.encode('ascii')).decode('ascii'),
-        }
+        return firefly.upload(statement_content, target_account_id, target)
 
-        if target.get('user_id') is not None:
-            request_json.update({
-                'user_id': target['user_id'],
-            })
 
-        response = requests.post(endpoint, json=request_json, timeout=300)
+class RogersBankFlorinV2StatementImporter(CouchDBImporter, RogersBankStatementImporter):
+    pass
 
-        if response.status_code != 200:
-            logger.warn('Failed: status={};msg={}'.format(response.status_code, response.text))
 
+def target_key(target):
+    """Identifies an upload target across runs."""
+    return target.get('name') or target.get('endpoint') or '{}/{}'.format(target.get('db_server'),
+                                                                           target.get('db_name'))
 
-class RogersBankFlorinV2StatementImporter(CouchDBImporter, RogersBankStatementImporter):
-    pass
 
+def receives(target, account_id):
+    """Whether ``target`` takes the statements of ``account_id``: targets with an
+    ``account_id_mapping`` only take the accounts it maps.
+    """
+    mapping = target.get('account_id_mapping')
+    return mapping is None or mapping.get(account_id) is not None
 
-class TangerineStatementImporter():
-    def __init__(self, secret_file):
-        secret_provider = create_provider(secret_file, provider_factory=TangerineSecretProvider)
-        self._client = TangerineClient(secret_provider)
 
-    def _get_date_range(self):
-        today = datetime.date.today()
-        from_ = today - relativedelta(months=1)
-        to_ = today + relativedelta(days=1)
-        return from_, to_
+class TangerineStatementImporter(StatementImporter):
+    BANK = 'tangerine'
+    # Downloaded when there is no checkpoint yet
+    DEFAULT_WINDOW = relativedelta(months=1)
+    # Downloaded again before the checkpoint, for transactions that post late
+    DEFAULT_OVERLAP_DAYS = 3
 
-    def upload(self, statement_content, target_account_id, target):
-        raise NotImplemented()
+    def __init__(self, secret_file, client=None, concurrency=None, metrics_recorder=None,
+                 overlap_days=None, full_resync_since=None):
+        """``full_resync_since`` (a date) ignores the checkpoints and downloads
+        everything since that date instead.
+        """
+        super().__init__(concurrency, metrics_recorder)
+        if client is None:
+            with self.metrics.activate():
+                client = bank_sessions.manager().get('tangerine', secret_file, BANK_CLIENTS['tangerine'])
+        self._client = client
+        self._overlap = datetime.timedelta(
+            days=self.DEFAULT_OVERLAP_DAYS if overlap_days is None else overlap_days)
+        self._full_resync_since = full_resync_since
+        self.checkpoints = redis.Checkpoints('tangerine:')
 
-    def __call__(self, account_ids, targets):
-        from_, to_ = self._get_date_range()
+    def _get_date_range(self, account_id, targets):
+        today = datetime.date.today()
+        to_ = today + relativedelta(days=1)
+        if self._full_resync_since is not None:
+            return self._full_resync_since, to_
+        checkpoints = self.checkpoints.get(
+            account_id, [target_key(target) for target in targets if receives(target, account_id)])
+        if not checkpoints or None in checkpoints:
+            return today - self.DEFAULT_WINDOW, to_
+        return min(checkpoints) - self._overlap, to_
+
+    def advance_checkpoints(self, result, latest_dates):
+        """Moves the checkpoint of every (account, target) that imported something."""
+        for account_id, target, value in result.imported:
+            latest = latest_dates.get(account_id)
+            # None: the target does not take the account
+            if value is not None and latest is not None:
+                self.checkpoints.advance(account_id, target_key(target), latest)
+
+    def download(self, account_obj, from_, to_):
+        with self.metrics.stage('download'):
+            return self._client.download_ofx(account_obj, from_, to_, save=False)
+
+    def import_statements(self, account_ids, targets):
+        from .ofx_stream import latest_posted_date
+        result = ImportResult()
 
         with self._client.login():
             accounts = self._client.list_accounts()
@@ -229,17 +471,22 @@ class TangerineStatementImporter():
                 acct['number']: acct
                 for acct in accounts
             }
+            downloads = {}
             for account_id in account_ids:
                 account_obj = accounts.get(account_id)
                 if not account_obj:
                     logger.warn('Account {} does not exist. Skip...'.format(account_id))
+                    result.skipped.append(account_id)
                     continue
-                for target in targets:
-                    account_id_mapping = target.get('account_id_mapping') or  {}
+                from_, to_ = self._get_date_range(account_id, targets)
+                logger.info('Downloading account {} from {} to {}'.format(account_id, from_, to_))
+                downloads[account_id] = functools.partial(self.download, account_obj, from_, to_)
+            statements = self.transfer(downloads, targets, result)
 
-                    target_account_id = account_id_mapping.get(account_id)
-                    content = self._client.download_ofx(account_obj, from_, to_, save=False)
-                    self.upload(content, target_account_id, target)
+        latest_dates = {account_id: latest_posted_date(content) for account_id, content in statements.items()}
+        self.advance_checkpoints(result, latest_dates)
+        logger.info('Statement import finished: {}'.format(result))
+        return result
 
 
 class TangerineFireflyStatementImporter(TangerineStatementImporter):
@@ -248,33 +495,22 @@ class TangerineFireflyStatementImporter(TangerineStatementImporter):
             logger.warn('Account {} does not have a corresponding firefly id. Skip...'.format(target_account_id))
             return
 
-        endpoint = target['endpoint']
-        request_json = {
-            'account_id': target_account_id,
-            'data': base64.b64encode(statement_content.encode('ascii')).decode('ascii'),
-        }
-
-        if target.get('user_id') is not None:
-            request_json.update({'user_id': target.get('user_id')})
-
-        response = requests.post(endpoint, json=request_json, timeout=300)
-        if response.status_code != 200:
-            logger.warn('Failed: status={};msg={}'.format(response.status_code, response.text))
+        return firefly.upload(statement_content, target_account_id, target)
 
 
 class TangerineFlorinV2StatementImporter(CouchDBImporter, TangerineStatementImporter):
     pass
 
 
-STATEMENT_IMPORTER = {
+STATEMENT_IMPORTER = Registry('statement importer', {
     'rogersbank': RogersBankFireflyStatementImporter,
     'tangerine': TangerineFireflyStatementImporter,
     'rogersbank_florin': RogersBankFlorinV2StatementImporter,
     'tangerine_florin': TangerineFlorinV2StatementImporter,
-}
+})
 
 
-def upload_statement(bank, account_ids, secret_file, targets, client=None):
-    assert bank in STATEMENT_IMPORTER
-    importer = STATEMENT_IMPORTER[bank](secret_file)
+def upload_statement(bank, account_ids, secret_file, targets, client=None, concurrency=None, **options):
+    """``options`` are passed to the importer, e.g. ``overlap_days`` for Tangerine."""
+    importer = STATEMENT_IMPORTER[bank](secret_file, client=client, concurrency=concurrency, **options)
     return importer(account_ids, targets)
@@ -0,0 +1,41 @@
+import contextlib
+import os
+import mock
+import pytest
+from redis import Redis
+
+
+# The keys of the notifiers' state, cleared when a test module marks no others
+NOTIFIER_KEYS = ('scrape:*', 'state:*', 'checkpoint:*')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'redis_keys(*patterns): the keys the redis fixture clears')
+
+
+@pytest.fixture
+def redis(request):
+    marker = request.node.get_closest_marker('redis_keys')
+    patterns = marker.args if marker is not None else NOTIFIER_KEYS
+    r = Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=os.getenv('REDIS_PORT', 6379))
+    for pattern in patterns:
+        for key in r.scan_iter(pattern):
+            r.delete(key)
+    return r
+
+
+@pytest.fixture
+def tangerine_client():
+    m = mock.Mock()
+
+    @contextlib.contextmanager
+    def fake_ctx_mgr():
+        yield
+
+    m.login = fake_ctx_mgr
+    return m
+
+
+@pytest.fixture
+def email():
+    return mock.Mock()
@@ -0,0 +1,105 @@
+"""A minimal in-memory stand-in for the CouchDB HTTP API.
+
+Only the endpoints used by ``florin_notifier.couchdb_importer`` are
+implemented. Every request is recorded in ``FakeCouchDB.requests`` as a
+``(method, path)`` tuple so tests can assert on the number of round trips, and
+every connection that was opened is counted in ``FakeCouchDB.connections``.
+"""
+import json
+import uuid
+from collections import defaultdict
+from urllib.parse import unquote, urlparse
+from .fake_server import FakeHandler, FakeServer
+
+
+class FakeCouchDB(FakeServer):
+    def __init__(self):
+        self.databases = {}
+        self.requests = []
+        self._revs = defaultdict(int)
+        super().__init__()
+
+    def count(self, method, suffix=''):
+        return len([r for r in self.requests if r[0] == method and r[1].endswith(suffix)])
+
+    def _save(self, db, doc):
+        doc_id = doc.get('_id') or uuid.uuid4().hex
+        existing = db.get(doc_id)
+        if existing is not None and existing.get('_rev') != doc.get('_rev'):
+            return 409, {'id': doc_id, 'error': 'conflict', 'reason': 'Document update conflict.'}
+        self._revs[doc_id] += 1
+        doc = dict(doc, _id=doc_id, _rev='{}-{}'.format(self._revs[doc_id], uuid.uuid4().hex))
+        db[doc_id] = doc
+        return 201, {'ok': True, 'id': doc_id, 'rev': doc['_rev']}
+
+    def _bulk_save(self, db, docs):
+        return [self._save(db, doc)[1] for doc in docs]
+
+    class Handler(FakeHandler):
+        def _reply(self, status, body=None):
+            payload = json.dumps(body).encode('utf-8') if body is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(payload)
+
+        def _body(self):
+            body = self.read_body()
+            return json.loads(body.decode('utf-8')) if body else None
+
+        def _dispatch(self):
+            path = urlparse(self.path).path
+            parts = [unquote(p) for p in path.strip('/').split('/') if p]
+            body = self._body()
+            with self.fake._lock:
+                self.fake.requests.append((self.command, path))
+                status, reply = self._route(parts, body)
+            self._reply(status, reply)
+
+        def _route(self, parts, body):
+            fake = self.fake
+            if not parts:
+                return 200, {'couchdb': 'Welcome', 'version': '2.1.1'}
+            db_name, rest = parts[0], parts[1:]
+            db = fake.databases.get(db_name)
+
+            if not rest:
+                if self.command == 'PUT':
+                    if db is not None:
+                        return 412, {'error': 'file_exists', 'reason': 'The database could not be created.'}
+                    fake.databases[db_name] = {}
+                    return 201, {'ok': True}
+                if db is None:
+                    return 404, {'error': 'not_found', 'reason': 'Database does not exist.'}
+                if self.command == 'POST':
+                    return fake._save(db, body)
+                return 200, {'db_name': db_name, 'doc_count': len(db)}
+
+            if db is None:
+                return 404, {'error': 'not_found', 'reason': 'Database does not exist.'}
+
+            if rest == ['_all_docs']:
+                rows = []
+                for key in body['keys']:
+                    doc = db.get(key)
+                    if doc is None:
+                        rows.append({'key': key, 'error': 'not_found'})
+                    else:
+                        rows.append({'id': key, 'key': key, 'value': {'rev': doc['_rev']}})
+                return 200, {'total_rows': len(db), 'offset': 0, 'rows': rows}
+
+            if rest == ['_bulk_docs']:
+                return 201, fake._bulk_save(db, body['docs'])
+
+            doc_id = '/'.join(rest)
+            if self.command == 'PUT':
+                return fake._save(db, dict(body, _id=doc_id))
+            doc = db.get(doc_id)
+            if doc is None:
+                return 404, {'error': 'not_found', 'reason': 'missing'}
+            return 200, doc
+
+        do_GET = do_HEAD = do_PUT = do_POST = _dispatch
+
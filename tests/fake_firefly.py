@@ -0,0 +1,28 @@
+"""A local stand-in for the Firefly statement import endpoint.
+
+Every request is recorded in ``FakeFirefly.uploads`` with its headers and its
+(decompressed) JSON body; ``connections`` counts the connections opened.
+"""
+import gzip
+import json
+from .fake_server import FakeHandler, FakeServer
+
+
+class FakeFirefly(FakeServer):
+    path = '/import'
+
+    def __init__(self, status=200):
+        self.status = status
+        self.uploads = []
+        super().__init__()
+
+    class Handler(FakeHandler):
+        def do_POST(self):
+            body = self.read_body()
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            with self.fake._lock:
+                self.fake.uploads.append((dict(self.headers), json.loads(body.decode('utf-8'))))
+            self.send_response(self.fake.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
@@ -0,0 +1,34 @@
+"""Templates of the OFX statements used by the tests and the benchmarks.
+
+``STMTTRN`` takes the ``id``, ``day`` (of November 2017) and ``amount`` of a
+transaction; ``statement`` wraps transactions into a whole document.
+"""
+
+
+OFX_HEADER = '''OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+'''
+
+OFX_BODY = '''<OFX><SIGNONMSGSRSV1><SONRS><STATUS><CODE>0<SEVERITY>INFO</STATUS>
+<DTSERVER>20171110<LANGUAGE>ENG</SONRS></SIGNONMSGSRSV1>
+<BANKMSGSRSV1><STMTTRNRS><TRNUID>1<STATUS><CODE>0<SEVERITY>INFO</STATUS>
+<STMTRS><CURDEF>CAD<BANKACCTFROM><BANKID>0614<ACCTID>12345<ACCTTYPE>CHECKING</BANKACCTFROM>
+<BANKTRANLIST><DTSTART>20171001<DTEND>20171110
+{transactions}</BANKTRANLIST>
+<LEDGERBAL><BALAMT>100.00<DTASOF>20171110</LEDGERBAL></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+'''
+
+STMTTRN = '''<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>201711{day:02d}<TRNAMT>{amount}<FITID>{id}<NAME>PAYEE {id}<MEMO>MEMO {id}</STMTTRN>
+'''
+
+
+def statement(transactions):
+    return OFX_HEADER + OFX_BODY.format(transactions=''.join(transactions))
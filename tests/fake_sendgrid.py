@@ -0,0 +1,28 @@
+"""A local stand-in for the SendGrid mail send endpoint.
+
+Every request body is recorded in ``FakeSendGrid.mails`` and answered with
+``status``; every connection that was opened is counted in
+``FakeSendGrid.connections``.
+"""
+import json
+from .fake_server import FakeHandler, FakeServer
+
+
+class FakeSendGrid(FakeServer):
+    path = '/v3/mail/send'
+
+    def __init__(self, status=202):
+        self.status = status
+        self.mails = []
+        self.headers = []
+        super().__init__()
+
+    class Handler(FakeHandler):
+        def do_POST(self):
+            body = self.read_body()
+            with self.fake._lock:
+                self.fake.mails.append(json.loads(body.decode('utf-8')))
+                self.fake.headers.append(dict(self.headers))
+            self.send_response(self.fake.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
@@ -0,0 +1,58 @@
+"""The local HTTP server the fakes of the tests are built on.
+
+A fake subclasses ``FakeServer`` with its own ``Handler`` (a ``FakeHandler``
+reaching the fake through ``self.fake``) and the ``path`` of its endpoint.
+Every connection that was opened is counted in ``connections``.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # Only in http.server from Python 3.7 on
+    daemon_threads = True
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are separate writes; with Nagle the body waits
+    # for the client's delayed ACK on every kept-alive request
+    disable_nagle_algorithm = True
+    fake = None
+
+    def setup(self):
+        super().setup()
+        with self.fake._lock:
+            self.fake.connections += 1
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServer():
+    Handler = FakeHandler
+    path = ''
+
+    def __init__(self):
+        self.connections = 0
+        self._lock = threading.Lock()
+        handler = type('Handler', (self.Handler,), {'fake': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}{}'.format(host, port, self.path)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
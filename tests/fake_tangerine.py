@@ -0,0 +1,14 @@
+"""Scraped Tangerine transactions for the tests."""
+
+
+def transaction(i, account_id='12345'):
+    return {
+        'transaction_date': '2017-11-10T07:17:03',
+        'amount': -i,
+        'description': 'BUY STUFF #{}'.format(i),
+        'type': 'WITHDRAWAL',
+        'account_id': account_id,
+        'id': i,
+        'posted_date': '2017-11-04T00:00:00',
+        'status': 'POSTED'
+    }
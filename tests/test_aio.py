@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+import threading
+import time
+import mock
+import pytest
+from florin_notifier import aio, bank_sessions
+from florin_notifier.tasks import TangerineTransactionNotifier
+
+
+@pytest.fixture
+def email():
+    m = mock.Mock()
+    m.send_new_transaction_email_async = mock.AsyncMock()
+    return m
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def slow_client(transactions, delay, logins):
+    client = mock.Mock()
+
+    @contextlib.contextmanager
+    def login():
+        logins.append(threading.get_ident())
+        time.sleep(delay)
+        yield
+
+    client.login = login
+    client.list_transactions.return_value = transactions
+    return client
+
+
+def txn(id, account_id):
+    return {'id': id, 'account_id': account_id, 'amount': -1.0, 'posted_date': '2017-11-04T00:00:00'}
+
+
+def test_run_async___sends_only_the_delta(redis, email):
+    logins = []
+    client = slow_client([txn(1, '1')], 0, logins)
+    run(TangerineTransactionNotifier(['1'], 'foo@example.com', client, email).run_async())
+    client.list_transactions.return_value = [txn(1, '1'), txn(2, '1')]
+    run(TangerineTransactionNotifier(['1'], 'foo@example.com', client, email).run_async())
+
+    calls = email.send_new_transaction_email_async.call_args_list
+    assert calls[0][0][:2] == ('foo@example.com', {'1': [txn(1, '1')]})
+    assert calls[1][0][:2] == ('foo@example.com', {'1': [txn(2, '1')]})
+    assert redis.hlen('state:seen:scrape:tangerine:') == 2
+
+
+def test_run_jobs___runs_jobs_concurrently(redis, email, monkeypatch):
+    logins = []
+    clients = {
+        'a.gpg': slow_client([txn(1, 'a')], 0.3, logins),
+        'b.gpg': slow_client([txn(2, 'b')], 0.3, logins),
+    }
+    monkeypatch.setitem(aio.NOTIFIERS, 'notify_tangerine_transactions',
+                        (TangerineTransactionNotifier, clients.__getitem__))
+    monkeypatch.setattr(bank_sessions, '_manager', bank_sessions.SessionManager())
+    monkeypatch.setitem(aio.BLOCKING_JOBS, 'broken', mock.Mock(side_effect=RuntimeError('boom')))
+    jobs = [
+        {'type': 'notify_tangerine_transactions',
+         'args': {'account_ids': ['a'], 'secret_file': 'a.gpg', 'recipient': 'a@example.com'}},
+        {'type': 'notify_tangerine_transactions',
+         'args': {'account_ids': ['b'], 'secret_file': 'b.gpg', 'recipient': 'b@example.com'}},
+        {'type': 'broken', 'args': {}},
+        {'type': 'broken', 'args': {}, 'enabled': False},
+    ]
+
+    start = time.monotonic()
+    results = run(aio.run_jobs(jobs, email=email))
+    assert time.monotonic() - start < 0.55
+
+    assert results[:2] == [None, None]
+    assert isinstance(results[2], RuntimeError)
+    assert len(set(logins)) == 2
+    assert sorted(call[0][0] for call in email.send_new_transaction_email_async.call_args_list) == [
+        'a@example.com', 'b@example.com']
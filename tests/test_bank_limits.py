@@ -0,0 +1,122 @@
+import threading
+import time
+import mock
+import pytest
+from florin_notifier import bank_limits
+from florin_notifier.bank_limits import BankBusy, BankLimits
+from florin_notifier.bank_sessions import BankSession
+
+
+pytestmark = pytest.mark.redis_keys('limit:*')
+
+
+class FakeClock():
+    def __init__(self, now=6000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_slot___at_most_concurrency_jobs_at_once(redis):
+    limits = BankLimits('tangerine', concurrency=2, max_wait=5)
+    running, most = [], []
+    lock = threading.Lock()
+
+    def job():
+        with limits.slot():
+            with lock:
+                running.append(1)
+                most.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=job) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(most) == 5
+    assert max(most) == 2
+    assert redis.zcard(limits.slots_key) == 0
+
+
+def test_slot___busy_after_max_wait(redis):
+    clock = FakeClock()
+    limits = BankLimits('tangerine', concurrency=1, max_wait=3, clock=clock, sleep=clock.sleep)
+    with limits.slot():
+        with pytest.raises(BankBusy):
+            with limits.slot():
+                pass
+    assert clock.sleeps == [1.0, 1.0, 1.0]
+    # The slot of a worker that died expires
+    redis.zadd(limits.slots_key, {'dead': clock.now - 1})
+    with limits.slot():
+        assert redis.zscore(limits.slots_key, 'dead') is None
+    assert clock.sleeps == [1.0, 1.0, 1.0]
+
+
+def test_slot___renewed_while_the_job_runs(redis):
+    with BankLimits('tangerine', concurrency=1, slot_ttl=0.3).slot():
+        time.sleep(1)
+        with pytest.raises(BankBusy):
+            with BankLimits('tangerine', concurrency=1, max_wait=0).slot():
+                pass
+    with BankLimits('tangerine', concurrency=1, max_wait=0).slot():
+        pass
+
+
+def test_throttle___waits_for_the_next_minute(redis):
+    clock = FakeClock(6030.0)
+    limits = BankLimits('rogersbank', requests_per_minute=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limits.throttle()
+    assert clock.sleeps == []
+    limits.throttle()
+    assert clock.sleeps == [30.0]
+
+
+def test_no_limits(redis):
+    limits = BankLimits('tangerine')
+    with limits.slot():
+        limits.throttle()
+    assert list(redis.scan_iter('limit:*')) == []
+
+
+def test_limits___from_config(monkeypatch):
+    from florin_notifier.config import config
+    monkeypatch.setattr(bank_limits, '_limits', {})
+    monkeypatch.setitem(config, 'bank_limits', {'tangerine': {'concurrency': 2, 'requests_per_minute': 30}})
+    assert bank_limits.limits('tangerine').concurrency == 2
+    assert bank_limits.limits('tangerine').requests_per_minute == 30
+    assert bank_limits.limits('rogersbank').concurrency is None
+
+
+def test_bank_session___throttles_every_request():
+    class Client():
+        def login(self):
+            return mock.MagicMock()
+
+        def list_transactions(self):
+            return []
+
+        @property
+        def recent_activities(self):
+            return []
+
+        name = 'client'
+
+    throttle = mock.Mock()
+    session = BankSession(Client(), throttle=throttle)
+    with session.login():
+        session.list_transactions()
+        session.recent_activities
+        session.name
+    # Logging in, the call and the property
+    assert throttle.call_count == 3
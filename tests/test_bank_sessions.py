@@ -0,0 +1,140 @@
+import contextlib
+import threading
+import pytest
+import requests
+from florin_notifier.bank_sessions import BankSession, SessionManager
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBankClient():
+    """Counts logins and rejects requests made after ``expire()``."""
+    def __init__(self):
+        self.logins = 0
+        self.logouts = 0
+        self.requests = 0
+        self._valid = False
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def login(self):
+        with self._lock:
+            self.logins += 1
+            self._valid = True
+        try:
+            yield
+        finally:
+            self.logouts += 1
+            self._valid = False
+
+    def expire(self):
+        self._valid = False
+
+    def list_transactions(self, account_ids):
+        self.requests += 1
+        if not self._valid:
+            response = requests.Response()
+            response.status_code = 401
+            raise requests.HTTPError('401 Unauthorized', response=response)
+        return [{'account_id': account_id} for account_id in account_ids]
+
+    def broken(self):
+        raise ValueError('boom')
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def manager(clock):
+    return SessionManager(max_age=3600, max_idle=600, clock=clock)
+
+
+def run_job(session):
+    with session.login():
+        return session.list_transactions(['1'])
+
+
+def test_get___one_session_per_bank_and_secret_file(manager):
+    clients = []
+
+    def factory(secret_file):
+        clients.append(FakeBankClient())
+        return clients[-1]
+
+    a = manager.get('tangerine', 'a.gpg', factory)
+    assert manager.get('tangerine', 'a.gpg', factory) is a
+    assert manager.get('tangerine', 'b.gpg', factory) is not a
+    assert manager.get('rogersbank', 'a.gpg', factory) is not a
+    assert len(clients) == 3
+
+
+def test_login___reused_across_jobs(manager, clock):
+    client = FakeBankClient()
+    session = manager.get('tangerine', 'a.gpg', lambda f: client)
+    for _ in range(5):
+        assert run_job(session) == [{'account_id': '1'}]
+        clock.now += 60
+    assert client.logins == 1
+    assert client.logouts == 0
+
+
+def test_login___again_after_idle_or_max_age(manager, clock):
+    client = FakeBankClient()
+    session = manager.get('tangerine', 'a.gpg', lambda f: client)
+    run_job(session)
+    clock.now += 600
+    run_job(session)
+    assert (client.logins, client.logouts) == (2, 1)
+
+    for _ in range(8):
+        clock.now += 500
+        run_job(session)
+    assert client.logins == 3
+
+
+def test_rejected_session___logs_in_again_and_retries(manager):
+    client = FakeBankClient()
+    session = manager.get('tangerine', 'a.gpg', lambda f: client)
+    run_job(session)
+    client.expire()
+    assert run_job(session) == [{'account_id': '1'}]
+    assert client.logins == 2
+    assert client.requests == 3
+
+
+def test_other_errors___are_not_retried(manager):
+    client = FakeBankClient()
+    session = manager.get('tangerine', 'a.gpg', lambda f: client)
+    with pytest.raises(ValueError):
+        with session.login():
+            session.broken()
+    assert client.logins == 1
+
+
+def test_close___logs_out(manager):
+    client = FakeBankClient()
+    run_job(manager.get('tangerine', 'a.gpg', lambda f: client))
+    manager.close()
+    assert client.logouts == 1
+
+
+def test_concurrent_rejections___log_in_once(clock):
+    client = FakeBankClient()
+    session = BankSession(client, clock=clock)
+    with session.login():
+        client.expire()
+        threads = [threading.Thread(target=session.list_transactions, args=(['1'],)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert client.logins == 2
@@ -0,0 +1,182 @@
+import datetime
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import ofxparse
+import pytest
+from florin_notifier import couchdb_importer
+from florin_notifier.couchdb_importer import Account, CouchDBImporter, ImportSummary, Transaction, compact_history
+from .fake_couchdb import FakeCouchDB
+from .fake_ofx import STMTTRN, statement
+
+
+def make_statement(count, start=0):
+    return statement(STMTTRN.format(id=i, day=4, amount='-{}.00'.format(i + 1)) for i in range(start, start + count))
+
+
+def test_models___ids_are_stable():
+    ofx_account = ofxparse.OfxParser().parse(io.StringIO(make_statement(1))).accounts[0]
+    account = Account(ofx_account)
+    txn = Transaction(ofx_account.statement.transactions[0])
+    assert account._id == '778d09a6d77c0bc861684a49f665af6f734e2a40'
+    assert txn.json == {
+        'metadata': {'type': 'Transaction'},
+        '_id': 'e4cd7533af5b0ac8c2ed0caf67bb97441ebb135d',
+        'amount': '-1.00',
+        'date': '2017-11-04',
+        'name': 'PAYEE 0',
+        'memo': 'MEMO 0',
+        'checksum': 'sha256:56aca595f113e70ae9867ec1eea0ff0d635ed2149596a6652c99f87b3a7ca31e',
+        'type': 'DEBIT',
+    }
+    assert not hasattr(txn, '__dict__')
+    assert not hasattr(account, '__dict__')
+
+
+@pytest.fixture(autouse=True)
+def connections(monkeypatch):
+    monkeypatch.setattr(couchdb_importer, '_connections', None)
+
+
+@pytest.fixture
+def couchdb_server():
+    server = FakeCouchDB().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def target(couchdb_server):
+    return {'db_server': couchdb_server.url, 'db_name': 'florin', 'bulk_size': 4}
+
+
+def transaction_docs(couchdb_server):
+    db = couchdb_server.databases['florin']
+    return [doc for doc in db.values() if doc['metadata']['type'] == 'Transaction']
+
+
+def test_upload___bulk_inserts_new_transactions(couchdb_server, target):
+    summary = CouchDBImporter().upload(make_statement(10), None, target)
+    assert summary == ImportSummary(inserted=10, skipped=0, conflicted=0)
+    assert len(transaction_docs(couchdb_server)) == 10
+    assert couchdb_server.count('POST', '/_all_docs') == 1
+    assert couchdb_server.count('POST', '/_bulk_docs') == 3
+    assert couchdb_server.count('GET', '/florin/') == 0
+
+
+def test_upload___skips_existing_transactions(couchdb_server, target):
+    CouchDBImporter().upload(make_statement(6), None, target)
+    summary = CouchDBImporter().upload(make_statement(6, start=3), None, target)
+    assert summary == ImportSummary(inserted=3, skipped=3, conflicted=0)
+    assert len(transaction_docs(couchdb_server)) == 9
+
+
+def test_upload___reports_conflicts(couchdb_server, target):
+    importer = CouchDBImporter()
+    importer.existing_ids = lambda db, ids: set()
+    importer.upload(make_statement(2), None, target)
+    summary = importer.upload(make_statement(3), None, target)
+    assert summary == ImportSummary(inserted=1, skipped=0, conflicted=2)
+
+
+def test_upload___streaming(couchdb_server, target):
+    target['streaming'] = True
+    summary = CouchDBImporter().upload(make_statement(10), None, target)
+    assert summary == ImportSummary(inserted=10, skipped=0, conflicted=0)
+    assert couchdb_server.count('POST', '/_bulk_docs') == 3
+
+    del target['streaming']
+    summary = CouchDBImporter().upload(make_statement(12), None, target)
+    assert summary == ImportSummary(inserted=2, skipped=10, conflicted=0)
+    [account] = [doc for doc in couchdb_server.databases['florin'].values() if doc['metadata']['type'] == 'Account']
+    # Same balance as the first import
+    assert len(account['history']) == 1
+
+    target['streaming'] = True
+    summary = CouchDBImporter().upload(io.StringIO(make_statement(13)), None, target)
+    assert summary == ImportSummary(inserted=1, skipped=12, conflicted=0)
+
+
+def test_upload___reuses_database_handle_and_connections(couchdb_server, target):
+    CouchDBImporter().upload(make_statement(2), None, target)
+    probes = couchdb_server.count('HEAD', '/florin')
+    for i in range(1, 3):
+        CouchDBImporter().upload(make_statement(2, start=i), None, target)
+    assert couchdb_server.count('PUT', '/florin') == 1
+    assert couchdb_server.count('HEAD', '/florin') == probes
+    assert couchdb_server.connections == 1
+
+
+def test_upload___recreates_deleted_database(couchdb_server, target):
+    CouchDBImporter().upload(make_statement(2), None, target)
+    del couchdb_server.databases['florin']
+    with pytest.raises(Exception):
+        CouchDBImporter().upload(make_statement(2), None, target)
+    summary = CouchDBImporter().upload(make_statement(2), None, target)
+    assert summary == ImportSummary(inserted=2, skipped=0, conflicted=0)
+    assert couchdb_server.count('PUT', '/florin') == 2
+
+
+def test_upload___limits_connections_per_server(couchdb_server, target):
+    target['max_connections'] = 2
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    class SlowImporter(CouchDBImporter):
+        def upload_parsed(self, fileobj, target_account_id, target):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda _: SlowImporter().upload('', None, target), range(6)))
+    assert max(peak) == 2
+
+
+def account_doc(couchdb_server):
+    [account] = [doc for doc in couchdb_server.databases['florin'].values() if doc['metadata']['type'] == 'Account']
+    return account
+
+
+def test_upload___saves_account_only_when_balance_changes(couchdb_server, target):
+    importer = CouchDBImporter()
+    importer.upload(make_statement(1), None, target)
+    account_id = account_doc(couchdb_server)['_id']
+    assert couchdb_server.count('PUT', account_id) == 1
+    importer.upload(make_statement(1), None, target)
+    assert couchdb_server.count('PUT', account_id) == 1
+
+    statement = make_statement(1).replace('<BALAMT>100.00<DTASOF>20171110', '<BALAMT>90.00<DTASOF>20171111')
+    importer.upload(statement, None, target)
+    assert couchdb_server.count('PUT', account_id) == 2
+    assert [e['balance'] for e in account_doc(couchdb_server)['history']] == ['100.00', '90.00']
+
+
+def test_compact_history___downsamples_old_entries():
+    now = datetime.datetime(2017, 11, 10, 12)
+    hours = 2 * 365 * 24
+    history = [{'dateTime': (now - datetime.timedelta(hours=h)).isoformat(), 'balance': str(h)}
+               for h in range(hours)]
+    compacted = compact_history(history, now)
+    # 2 days hourly, 88 daily, then the months before
+    assert 48 + 88 + 21 <= len(compacted) <= 48 + 90 + 24
+    assert compacted == sorted(compacted, key=lambda e: e['dateTime'])
+    assert compacted[-1] == history[0]
+    # The last balance of a day stands for the day
+    day = [e for e in compacted if e['dateTime'].startswith('2017-10-01')]
+    assert day == [{'dateTime': '2017-10-01T23:00:00', 'balance': str(39 * 24 + 13)}]
+    assert compact_history(compacted, now) == compacted
+
+
+def test_compact_history___keeps_at_most_months():
+    now = datetime.datetime(2017, 11, 10)
+    history = [{'dateTime': datetime.datetime(2000 + y, m, 1).isoformat(), 'balance': '1'}
+               for y in range(17) for m in range(1, 13)]
+    compacted = compact_history(history, now, months=12)
+    assert len(compacted) == 12
+    assert compacted[-1]['dateTime'] == '2016-12-01T00:00:00'
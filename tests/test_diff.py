@@ -0,0 +1,15 @@
+from florin_notifier.diff import fingerprint
+
+
+def txn(id, amount, status='POSTED', account_id='12345'):
+    return {'id': id, 'amount': amount, 'status': status, 'account_id': account_id}
+
+
+def test_fingerprint___ignores_key_order():
+    assert fingerprint({'a': 1, 'b': 'x'}) == fingerprint({'b': 'x', 'a': 1})
+
+
+def test_fingerprint___only_hashes_selected_fields():
+    assert fingerprint(txn(1, -5), ['id']) == fingerprint(txn(1, -10), ['id'])
+    assert fingerprint(txn(1, -5)) != fingerprint(txn(1, -10))
+
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import mock
+import pytest
+import requests
+from florin_notifier import digest, email
+from florin_notifier.config import config
+from .fake_sendgrid import FakeSendGrid
+
+
+pytestmark = pytest.mark.redis_keys('digest:*')
+
+
+@pytest.fixture
+def sendgrid(monkeypatch):
+    server = FakeSendGrid().start()
+    monkeypatch.setattr(email, 'SENDGRID_MAIL_SEND_URL', server.url)
+    monkeypatch.setattr(email, '_session', None)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def digest_config(monkeypatch):
+    options = {'window': 3600, 'max_size': 5}
+    monkeypatch.setitem(config, 'digest', options)
+    return options
+
+
+def adapter(txn):
+    return {'date': txn['date'], 'description': txn['desc'], 'amount': txn['amount']}
+
+
+def txns(*ids):
+    return [{'date': '2017-11-04', 'desc': 'TXN {}'.format(i), 'amount': -i} for i in ids]
+
+
+def test_send_new_transaction_email___without_digest_sends_right_away(redis, sendgrid):
+    email.send_new_transaction_email('foo@example.com', {'12345': txns(1)}, adapter)
+    email.send_new_transaction_email('foo@example.com', {'12345': txns(2)}, adapter)
+    assert len(sendgrid.mails) == 2
+    assert sendgrid.connections == 1
+    assert sendgrid.headers[0]['Authorization'] == 'Bearer deadbeefcafebabe'
+    assert redis.keys('digest:*') == []
+
+
+def test_send_new_transaction_email___batches_into_one_digest(redis, sendgrid, digest_config):
+    for i in range(4):
+        email.send_new_transaction_email('foo@example.com', {'12345': txns(i), '45678': []}, adapter)
+    assert sendgrid.mails == []
+    assert digest.pending_recipients() == ['foo@example.com']
+
+    email.flush_digests()
+    assert sendgrid.mails == []
+
+    email.flush_digests(force=True)
+    assert len(sendgrid.mails) == 1
+    content = sendgrid.mails[0]['content'][0]['value']
+    assert all('TXN {}'.format(i) in content for i in range(4))
+    assert digest.pending_recipients() == []
+    assert redis.keys('digest:*') == []
+
+
+def test_send_new_transaction_email___flushes_when_digest_is_full(redis, sendgrid, digest_config):
+    email.send_new_transaction_email('foo@example.com', {'12345': txns(1, 2)}, adapter)
+    email.send_new_transaction_email('bar@example.com', {'12345': txns(3)}, adapter)
+    assert sendgrid.mails == []
+    email.send_new_transaction_email('foo@example.com', {'12345': txns(4, 5, 6)}, adapter)
+    assert len(sendgrid.mails) == 1
+    assert sendgrid.mails[0]['personalizations'][0]['to'] == [{'email': 'foo@example.com'}]
+    assert digest.pending_recipients() == ['bar@example.com']
+
+
+def test_flush_digest___keeps_the_digest_when_sending_fails(redis, sendgrid, digest_config):
+    email.send_new_transaction_email('foo@example.com', {'12345': txns(1, 2), '45678': txns(3)}, adapter)
+    sendgrid.status = 500
+    with pytest.raises(requests.HTTPError):
+        email.flush_digests(force=True)
+    assert digest.pending_recipients() == ['foo@example.com']
+    assert digest.is_due('foo@example.com', **digest_config)
+
+    sendgrid.status = 202
+    email.flush_digests()
+    assert len(sendgrid.mails) == 2
+    assert sendgrid.mails[0] == sendgrid.mails[1]
+    assert digest.pending_recipients() == []
+    assert redis.keys('digest:*') == []
+
+
+def test_is_due___after_the_window(redis):
+    digest.enqueue('foo@example.com', {'12345': txns(1)}, adapter)
+    since = float(redis.get(digest.since_key('foo@example.com')))
+    assert not digest.is_due('foo@example.com', window=60, now=since + 59)
+    assert digest.is_due('foo@example.com', window=60, now=since + 60)
+    assert not digest.is_due('bar@example.com', window=60, now=since + 60)
+
+
+def test_send_new_transaction_email_async___digest_off_the_event_loop(redis, sendgrid, digest_config):
+    loop = asyncio.new_event_loop()
+    blocking = []
+    enqueue = digest.enqueue
+
+    def enqueue_in_thread(*args):
+        blocking.append(threading.current_thread() is threading.main_thread())
+        return enqueue(*args)
+
+    with mock.patch.object(digest, 'enqueue', enqueue_in_thread):
+        for i in range(5):
+            loop.run_until_complete(
+                email.send_new_transaction_email_async('foo@example.com', {'12345': txns(i)}, adapter))
+    loop.close()
+    assert blocking == [False] * 5
+    assert len(sendgrid.mails) == 1
@@ -0,0 +1,35 @@
+import mock
+from florin_notifier import email
+
+
+def txn(i):
+    return {'posted_date': '2017-11-0{}'.format(i), 'description': 'TXN {}'.format(i), 'amount': -i}
+
+
+def adapter(t):
+    t = dict(t)
+    t['date'] = t['posted_date']
+    return t
+
+
+def test_templates___are_precompiled():
+    assert set(email.templates()) >= {'new_transactions.html.jinja2', 'new_transactions.txt.jinja2'}
+    assert email.templates() is email.templates()
+    assert email.environment().auto_reload is False
+
+
+def test_new_transaction_mail___adapts_each_transaction_once():
+    spy = mock.Mock(side_effect=adapter)
+    mail = email.new_transaction_mail('foo@example.com', {'12345': [txn(1), txn(2)], '45678': [txn(3)]}, spy)
+    assert spy.call_count == 3
+
+    plain, html = mail['content']
+    assert plain['type'] == 'text/plain'
+    assert '2017-11-01  TXN 1  -1' in plain['value']
+    assert html['type'] == 'text/html'
+    assert '<td>TXN 3</td>' in html['value']
+    assert html['value'].index('12345') < html['value'].index('45678')
+
+
+def test_new_transaction_mail___nothing_new():
+    assert email.new_transaction_mail('foo@example.com', {'12345': []}, adapter) is None
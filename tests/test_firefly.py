@@ -0,0 +1,79 @@
+import base64
+import mock
+import pytest
+import requests
+from florin_notifier import firefly
+from florin_notifier.tasks import TangerineFireflyStatementImporter
+from .fake_firefly import FakeFirefly
+
+
+pytestmark = pytest.mark.redis_keys('upload:*')
+
+
+STATEMENT = '''OFXHEADER:100
+NEWFILEUID:{uid}
+
+<OFX><SIGNONMSGSRSV1><SONRS><DTSERVER>{now}</SONRS></SIGNONMSGSRSV1>
+<BANKTRANLIST><DTSTART>20171001<DTEND>{now}
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20171104<TRNAMT>{amount}<FITID>1</STMTTRN>
+</BANKTRANLIST></OFX>
+'''
+
+
+def statement(now='20171110', uid='1', amount='-1.00'):
+    return STATEMENT.format(now=now, uid=uid, amount=amount)
+
+
+@pytest.fixture
+def server():
+    server = FakeFirefly().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def target(server):
+    return {'endpoint': server.url, 'user_id': 7}
+
+
+def test_upload___skips_unchanged_statements(redis, server, target):
+    assert firefly.upload(statement(), 'acct-1', target) is True
+    assert firefly.upload(statement(now='20171111', uid='2'), 'acct-1', target) == firefly.UNCHANGED
+    assert firefly.upload(statement(), 'acct-2', target) is True
+    assert firefly.upload(statement(amount='-2.00'), 'acct-1', target) is True
+
+    assert len(server.uploads) == 3
+    headers, body = server.uploads[0]
+    assert body == {'account_id': 'acct-1', 'user_id': 7,
+                    'data': base64.b64encode(statement().encode('ascii')).decode('ascii')}
+    assert server.connections == 1
+
+
+def test_upload___gzip(redis, server, target):
+    target['gzip'] = True
+    assert firefly.upload(statement(), 'acct-1', target)
+    headers, body = server.uploads[0]
+    assert headers['Content-Encoding'] == 'gzip'
+    assert body['account_id'] == 'acct-1'
+
+
+def test_upload___failures_are_retried_next_time(redis, server, target):
+    server.status = 500
+    with pytest.raises(requests.HTTPError):
+        firefly.upload(statement(), 'acct-1', target)
+    assert redis.get(firefly.hash_key(target['endpoint'], 'acct-1')) is None
+    server.status = 200
+    assert firefly.upload(statement(), 'acct-1', target) is True
+    assert len(server.uploads) == 2
+
+
+def test_importer___rejected_uploads_fail(redis, server, target):
+    client = mock.MagicMock()
+    client.list_accounts.return_value = [{'number': '1'}]
+    client.download_ofx.return_value = statement()
+    target['account_id_mapping'] = {'1': 'acct-1'}
+    server.status = 500
+    result = TangerineFireflyStatementImporter('SECRET', client=client)(['1'], [target])
+    assert not result.ok
+    assert result.imported == []
+    assert isinstance(result.failed[0][2], requests.HTTPError)
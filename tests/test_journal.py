@@ -0,0 +1,181 @@
+import datetime
+import hashlib
+import multiprocessing
+import os
+import freezegun
+import mock
+import pytest
+from florin_notifier import journal
+from florin_notifier.journal import Journal, JournalState
+from florin_notifier.tasks import notify_tangerine_transactions
+from .fake_tangerine import transaction
+
+
+def sha1(value):
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('tangerine'))
+
+
+@pytest.fixture(autouse=True)
+def journals():
+    yield
+    for j in JournalState._journals.values():
+        j.close()
+    JournalState._journals.clear()
+
+
+def test_put_and_get(path):
+    j = Journal(path)
+    assert j.get_many([sha1(1)]) == [None]
+    j.put_many({sha1(1): sha1('a'), sha1(2): sha1('b')}, 1000.0)
+    assert j.get_many([sha1(2), sha1(1), sha1(3)]) == [sha1('b'), sha1('a'), None]
+    assert len(j) == 2
+    assert j.high_water_mark == 1000.0
+
+
+def test_put___latest_fingerprint_wins(path):
+    j = Journal(path)
+    j.put_many({sha1(1): sha1('a')})
+    j.put_many({sha1(1): sha1('b')})
+    assert j.get_many([sha1(1)]) == [sha1('b')]
+    assert len(j) == 1
+    assert j.records == 2
+
+
+def test_reopen(path):
+    j = Journal(path)
+    j.put_many({sha1(1): sha1('a')}, 1000.0)
+    j.close()
+    j = Journal(path)
+    assert j.get_many([sha1(1)]) == [sha1('a')]
+    assert j.high_water_mark == 1000.0
+
+
+def test_reopen___rebuilds_lost_index(path):
+    j = Journal(path)
+    j.put_many({sha1(i): sha1(-i) for i in range(100)})
+    j.close()
+    os.remove(path + '.idx')
+    j = Journal(path)
+    assert j.get_many([sha1(i) for i in range(100)]) == [sha1(-i) for i in range(100)]
+
+
+def test_reopen___indexes_records_appended_after_the_index(path):
+    j = Journal(path)
+    j.put_many({sha1(1): sha1('a')})
+    with open(path + '.idx', 'rb') as f:
+        index = f.read()
+    j.put_many({sha1(2): sha1('b'), sha1(1): sha1('c')})
+    j.close()
+    # As if the process died after appending to the log
+    with open(path + '.idx', 'wb') as f:
+        f.write(index)
+    j = Journal(path)
+    assert j.get_many([sha1(1), sha1(2)]) == [sha1('c'), sha1('b')]
+    assert len(j) == 2
+
+
+def test_put___grows_the_index(path):
+    j = Journal(path)
+    count = journal.MIN_CAPACITY * 3
+    j.put_many({sha1(i): sha1(-i) for i in range(count)})
+    assert len(j) == count
+    assert j.get_many([sha1(i) for i in range(0, count, 97)]) == [sha1(-i) for i in range(0, count, 97)]
+
+
+def test_get___identities_that_are_not_digests(path):
+    j = Journal(path)
+    j.put_many({'12345:678': sha1('a')})
+    assert j.get_many(['12345:678', '12345:679']) == [sha1('a'), None]
+
+
+def test_compact(path):
+    j = Journal(path)
+    for fp in 'abc':
+        j.put_many({sha1(i): sha1(fp) for i in range(10)}, 1000.0)
+    j.compact()
+    assert j.records == 10
+    assert os.path.getsize(path + '.log') == 10 * journal.RECORD.size
+    assert j.get_many([sha1(i) for i in range(10)]) == [sha1('c')] * 10
+    assert j.high_water_mark == 1000.0
+
+
+def test_compact___drops_old_entries(path):
+    j = Journal(path)
+    with freezegun.freeze_time('2017-01-01'):
+        j.put_many({sha1(1): sha1('a')})
+    with freezegun.freeze_time('2017-06-01'):
+        j.put_many({sha1(2): sha1('b')})
+        j.compact(max_age=30 * 24 * 3600)
+    assert j.get_many([sha1(1), sha1(2)]) == [None, sha1('b')]
+    assert len(j) == 1
+
+
+def test_put___compacts_automatically(path, monkeypatch):
+    monkeypatch.setattr(journal, 'COMPACT_MIN_RECORDS', 20)
+    j = Journal(path)
+    for fp in 'abc':
+        j.put_many({sha1(i): sha1(fp) for i in range(10)})
+    assert j.records == 10
+
+
+def test_journal_state(tmpdir):
+    state = JournalState('state:tangerine', str(tmpdir))
+    assert state.high_water_mark is None
+    assert state.lookup([]) == []
+    now = datetime.datetime(2017, 11, 10, 12, 0, 0)
+    state.commit({sha1(1): sha1('a')}, now)
+    assert JournalState('state:tangerine', str(tmpdir)).high_water_mark == now
+    assert state.lookup([sha1(1), sha1(2)]) == [sha1('a'), None]
+    assert tmpdir.join('state-tangerine.log').check()
+
+
+@freezegun.freeze_time('2017-11-10T12:00:00')
+def test_notify_tangerine_transactions___journal_backend(redis, tmpdir, monkeypatch, tangerine_client, email):
+    from florin_notifier.config import config
+    monkeypatch.setitem(config, 'state', {'backend': 'journal', 'path': str(tmpdir)})
+    txn = transaction(1)
+    tangerine_client.list_transactions.return_value = [txn]
+    notify_tangerine_transactions(['12345'], 'SECRET', 'foo@example.com', tangerine_client, email)
+    notify_tangerine_transactions(['12345'], 'SECRET', 'foo@example.com', tangerine_client, email)
+    assert [c[0][1] for c in email.send_new_transaction_email.call_args_list] == [{'12345': [txn]}, {}]
+    assert redis.keys('state:seen:*') == [] and redis.keys('state:hwm:*') == []
+    assert tmpdir.listdir(lambda p: p.ext == '.log')
+
+
+def test_open_state___rejects_options_of_other_backends(redis, tmpdir, monkeypatch):
+    from florin_notifier.config import config
+    from florin_notifier.tasks import TangerineTransactionNotifier
+    notifier = TangerineTransactionNotifier(['12345'], 'foo@example.com', mock.Mock(), mock.Mock())
+    monkeypatch.setitem(config, 'state', {'backend': 'redis', 'path': str(tmpdir)})
+    with pytest.raises(ValueError) as e:
+        notifier.open_state()
+    assert 'The redis state backend does not take path' in str(e.value)
+    monkeypatch.setitem(config, 'state', {'backend': 'journal', 'path': str(tmpdir), 'retention_days': 30})
+    assert isinstance(notifier.open_state(), JournalState)
+
+
+def _grow_and_compact(path):
+    j = Journal(path)
+    j.put_many({sha1(i): sha1('b') for i in range(2000)}, 2000.0)
+    j.compact()
+    j.close()
+
+
+def test_other_process___grows_and_compacts(path):
+    j = Journal(path)
+    j.put_many({sha1(0): sha1('a')}, 1000.0)
+    assert j.high_water_mark == 1000.0
+    process = multiprocessing.get_context('fork').Process(target=_grow_and_compact, args=(path,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert j.get_many([sha1(0), sha1(1999)]) == [sha1('b'), sha1('b')]
+    assert j.high_water_mark == 2000.0
+    # Appends go to the compacted log, not the one it replaced
+    j.put_many({sha1(5000): sha1('c')})
+    assert Journal(path).get_many([sha1(5000), sha1(1)]) == [sha1('c'), sha1('b')]
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import socket
+import threading
+import mock
+import pytest
+from florin_notifier import email, metrics
+from florin_notifier.metrics import PrometheusSink, Recorder, Sink, StatsdSink
+from florin_notifier.tasks import TangerineTransactionNotifier
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.timings = []
+        self.counts = []
+        self.flushes = 0
+
+    def timing(self, labels, stage, seconds):
+        self.timings.append((dict(labels), stage))
+
+    def count(self, labels, name, value):
+        self.counts.append((dict(labels), name, value))
+
+    def flush(self):
+        self.flushes += 1
+
+
+def test_recorder___module_functions_record_into_the_current_job():
+    sink = ListSink()
+    recorder = Recorder('notify', sinks=[sink], bank='tangerine')
+    with metrics.stage('outside'):
+        metrics.count('outside')
+
+    with recorder.job():
+        with metrics.stage('decrypt'):
+            pass
+        thread = threading.Thread(target=recorder.bind(lambda: metrics.count('fetched', 3)))
+        thread.start()
+        thread.join()
+        with recorder.job():
+            metrics.count('fetched', 2)
+    assert metrics.current() is None
+
+    assert list(recorder.timings) == ['decrypt', 'total']
+    assert recorder.counters == {'fetched': 5}
+    assert sink.timings[0] == ({'job': 'notify', 'bank': 'tangerine'}, 'decrypt')
+    assert sink.flushes == 1
+
+
+def test_notifier___records_stages_and_counters(redis, tangerine_client):
+    client = tangerine_client
+    client.list_transactions.return_value = [{'id': 1, 'account_id': '1', 'posted_date': '2017-11-04'}]
+    recorder = Recorder('notify', sinks=[], bank='tangerine')
+    TangerineTransactionNotifier(['1'], 'foo@example.com', client, mock.Mock(), recorder)()
+
+    assert set(recorder.timings) == {'redis_load', 'fetch', 'diff', 'redis_store', 'total'}
+    assert recorder.counters == {'fetched': 1, 'added': 1, 'changed': 0}
+
+
+def test_prometheus_sink(tmpdir):
+    path = str(tmpdir.join('florin-{pid}.prom'))
+    sink = PrometheusSink(path)
+    recorder = Recorder('import', sinks=[sink], bank='tangerine')
+    with recorder.job():
+        recorder.timing('download', 1.5)
+        recorder.timing('download', 0.5)
+        recorder.count('inserted', 10)
+
+    with open(path.format(pid=os.getpid())) as f:
+        text = f.read()
+    assert '# TYPE florin_stage_seconds summary' in text
+    assert 'florin_stage_seconds_sum{bank="tangerine",job="import",stage="download"} 2.0\n' in text
+    assert 'florin_stage_seconds_count{bank="tangerine",job="import",stage="download"} 2\n' in text
+    assert 'florin_events_total{bank="tangerine",job="import",kind="inserted"} 10\n' in text
+
+
+def test_statsd_sink():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+    sink = StatsdSink(*server.getsockname(), prefix='florin')
+    recorder = Recorder('notify', sinks=[sink], bank='rogersbank')
+    recorder.timing('login', 0.25)
+    recorder.count('fetched', 7)
+
+    assert server.recv(1024) == b'florin.notify.rogersbank.login:250.000|ms'
+    assert server.recv(1024) == b'florin.notify.rogersbank.fetched:7|c'
+    server.close()
+
+
+def test_recorder___counts_failed_jobs():
+    sink = ListSink()
+    recorder = Recorder('notify', sinks=[sink])
+    with pytest.raises(RuntimeError):
+        with recorder.job():
+            raise RuntimeError('boom')
+    assert recorder.counters == {'failed': 1}
+    assert 'total' in recorder.timings
+    assert sink.flushes == 1
+
+
+def test_notifier___run_async_records_the_same_stages(redis, monkeypatch, tangerine_client):
+    client = tangerine_client
+    client.list_transactions.return_value = [{'id': 1, 'account_id': '1', 'posted_date': '2017-11-04',
+                                              'amount': -1, 'description': 'A'}]
+
+    async def post(session, mail, headers, recorder=None):
+        recorder.timing('send', 0)
+
+    monkeypatch.setattr(email, '_post_mail', post)
+    recorder = Recorder('notify', sinks=[], bank='tangerine')
+    notifier = TangerineTransactionNotifier(['1'], 'foo@example.com', client, email, recorder)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(notifier.run_async())
+    assert set(recorder.timings) == {'redis_load', 'fetch', 'diff', 'redis_store', 'render', 'send', 'total'}
+    assert metrics.current() is None
+
+    recorder = Recorder('notify', sinks=[], bank='tangerine')
+    client.list_transactions.side_effect = RuntimeError('bank down')
+    notifier = TangerineTransactionNotifier(['1'], 'foo@example.com', client, email, recorder)
+    with pytest.raises(RuntimeError):
+        loop.run_until_complete(notifier.run_async())
+    loop.close()
+    assert recorder.counters == {'failed': 1}
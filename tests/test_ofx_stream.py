@@ -0,0 +1,107 @@
+import io
+import itertools
+import os
+import subprocess
+import sys
+import ofxparse
+from florin_notifier.couchdb_importer import Account, Transaction
+from florin_notifier.ofx_stream import iter_ofx
+from .fake_ofx import OFX_BODY, OFX_HEADER, STMTTRN
+from .test_couchdb_importer import make_statement
+
+
+class SyntheticOfxFile():
+    """A file-like object that produces an OFX statement with ``count`` transactions
+    on the fly, without ever holding the whole document.
+    """
+    def __init__(self, count):
+        head, tail = (OFX_HEADER + OFX_BODY).split('{transactions}')
+        parts = itertools.chain(
+            [head],
+            (STMTTRN.format(id=i, day=4, amount='-{}.{:02d}'.format(i % 1000, i % 100)) for i in range(count)),
+            [tail])
+        self._parts = parts
+        self._buf = ''
+
+    def read(self, size):
+        while len(self._buf) < size:
+            part = next(self._parts, None)
+            if part is None:
+                break
+            self._buf += part
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+
+def test_iter_ofx___matches_ofxparse():
+    statement = make_statement(20)
+    ofx = ofxparse.OfxParser().parse(io.StringIO(statement))
+    events = list(iter_ofx(io.StringIO(statement), chunk_size=97))
+
+    kinds = [kind for kind, _ in events]
+    assert kinds == ['account'] + ['transaction'] * 20 + ['balance']
+    assert Account(events[0][1])._id == Account(ofx.accounts[0])._id
+    assert [Transaction(txn).json for _, txn in events[1:-1]] == [
+        Transaction(txn).json for txn in ofx.accounts[0].statement.transactions]
+    assert events[-1][1].balance == ofx.accounts[0].statement.balance
+    assert events[-1][1].balance_date == ofx.accounts[0].statement.balance_date
+
+
+def test_iter_ofx___handles_entities_and_closing_tags():
+    statement = OFX_HEADER + OFX_BODY.format(transactions=(
+        '<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20171104120000[-5:EST]</DTPOSTED>'
+        '<TRNAMT>1,234.50</TRNAMT><FITID>42</FITID><NAME>A &amp; B</NAME></STMTTRN>\n'))
+    ofx_txn = ofxparse.OfxParser().parse(io.StringIO(statement)).accounts[0].statement.transactions[0]
+    [txn] = [txn for kind, txn in iter_ofx(io.StringIO(statement)) if kind == 'transaction']
+    assert txn.payee == 'A & B'
+    assert Transaction(txn).json == Transaction(ofx_txn).json
+
+
+PEAK_RSS_SCRIPT = """
+import resource, sys
+from florin_notifier.ofx_stream import iter_ofx
+from tests.test_ofx_stream import SyntheticOfxFile
+count = sum(1 for kind, _ in iter_ofx(SyntheticOfxFile(int(sys.argv[1]))) if kind == 'transaction')
+print(count, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+# Uploads to the fake CouchDB, which keeps the account but drops the transactions
+# it is sent, so that only the memory of the importer is measured
+PEAK_RSS_UPLOAD_SCRIPT = """
+import resource, sys
+from florin_notifier.couchdb_importer import CouchDBImporter
+from tests.fake_couchdb import FakeCouchDB
+from tests.test_ofx_stream import SyntheticOfxFile
+
+class DiscardingCouchDB(FakeCouchDB):
+    def _bulk_save(self, db, docs):
+        return [{'ok': True, 'id': doc['_id'], 'rev': '1-0'} for doc in docs]
+
+server = DiscardingCouchDB().start()
+target = {'db_server': server.url, 'db_name': 'florin', 'streaming': True}
+summary = CouchDBImporter().upload(SyntheticOfxFile(int(sys.argv[1])), None, target)
+server.stop()
+print(summary.inserted, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def parse_in_subprocess(count, script=PEAK_RSS_SCRIPT):
+    """Returns the number of transactions parsed and the peak RSS in KiB."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script, str(count)], cwd=root)
+    return [int(v) for v in output.splitlines()[-1].split()]
+
+
+def test_iter_ofx___memory_is_bounded_for_500k_transactions():
+    _, baseline = parse_in_subprocess(1000)
+    count, peak = parse_in_subprocess(500000)
+    assert count == 500000
+    assert peak - baseline < 16 * 1024
+
+
+def test_upload___streaming_a_file_keeps_memory_bounded_for_500k_transactions():
+    _, baseline = parse_in_subprocess(1000, PEAK_RSS_UPLOAD_SCRIPT)
+    count, peak = parse_in_subprocess(500000, PEAK_RSS_UPLOAD_SCRIPT)
+    assert count == 500000
+    assert peak - baseline < 16 * 1024
@@ -0,0 +1,71 @@
+import datetime
+import pytest
+from florin_notifier import redis as store
+
+
+PREFIX = 'scrape:test:'
+
+
+def test_latest___returns_the_newest_snapshot(redis):
+    assert store.latest(PREFIX) is None
+    store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 12), [1])
+    store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 14), [3])
+    store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 13), [2])
+    assert store.latest(PREFIX) == b'scrape:test:2017-11-10T14:00:00'
+    assert store.retrieve(store.latest(PREFIX)) == [3]
+
+
+def test_latest___lazily_drops_expired_snapshots(redis):
+    store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 12), [1])
+    store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 13), [2])
+    redis.delete('scrape:test:2017-11-10T13:00:00')
+    assert store.latest(PREFIX) == b'scrape:test:2017-11-10T12:00:00'
+    assert redis.zcard(store.index_key(PREFIX)) == 1
+
+
+def test_between(redis):
+    for hour in range(10, 15):
+        store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, hour), [hour])
+    assert store.between(PREFIX, datetime.datetime(2017, 11, 10, 11), datetime.datetime(2017, 11, 10, 13)) == [
+        b'scrape:test:2017-11-10T11:00:00',
+        b'scrape:test:2017-11-10T12:00:00',
+        b'scrape:test:2017-11-10T13:00:00',
+    ]
+
+
+def test_reindex___picks_up_unindexed_snapshots(redis):
+    redis.set('scrape:test:2017-11-09T12:10:11', '[]')
+    redis.set('scrape:test:2017-11-10T12:10:11.123400', '[]')
+    assert store.latest(PREFIX) is None
+    assert store.reindex(PREFIX) == 2
+    assert store.latest(PREFIX) == b'scrape:test:2017-11-10T12:10:11.123400'
+
+
+@pytest.mark.parametrize('codec', ['json', 'zlib', 'msgpack'])
+def test_codecs___round_trip(codec):
+    if codec == 'msgpack':
+        pytest.importorskip('msgpack')
+    obj = [{'amount': -55.54, 'description': 'BUY STUFF', 'id': 123456789}] * 50
+    data = store.CODECS[codec]().encode(obj)
+    assert store.decode(data) == obj
+
+
+def test_store___reads_values_written_with_another_codec(redis):
+    store.store('scrape:test:json', [1, 2])
+    store.connect(codec='zlib')
+    try:
+        store.store('scrape:test:zlib', [3, 4])
+        assert redis.get('scrape:test:zlib').startswith(b'z:')
+        assert store.retrieve('scrape:test:json') == [1, 2]
+        assert store.retrieve('scrape:test:zlib') == [3, 4]
+    finally:
+        store.connect()
+
+
+def test_pipeline___batches_commands(redis):
+    with store.pipeline() as pipe:
+        store.store('scrape:test:a', 'a', pipe)
+        store.store_snapshot(PREFIX, datetime.datetime(2017, 11, 10, 12), ['b'], pipe)
+        assert redis.get('scrape:test:a') is None
+    assert store.retrieve('scrape:test:a') == 'a'
+    assert store.latest(PREFIX) == b'scrape:test:2017-11-10T12:00:00'
@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from florin_notifier.config import Config
+from florin_notifier.registry import Registry, STATE_BACKENDS
+
+
+def test_registry___imports_on_first_lookup():
+    registry = Registry('codec', {'json': 'json:dumps', 'repr': repr})
+    assert registry['json'] is json.dumps
+    assert registry['repr'] is repr
+    assert sorted(registry) == ['json', 'repr']
+
+
+def test_registry___unknown_name():
+    with pytest.raises(KeyError) as e:
+        Registry('bank')['hsbc']
+    assert 'Unknown bank: hsbc' in str(e.value)
+
+
+def test_state_backends():
+    from florin_notifier.redis import ScrapeState
+    assert STATE_BACKENDS['redis'] is ScrapeState
+
+
+def test_import___does_not_load_banks_or_backends():
+    modules = ['couchdb', 'ofxparse', 'tangerine', 'rogersbank', 'aiohttp', 'jinja2', 'sendgrid', 'gnupg']
+    code = 'import sys, florin_notifier.scheduler; print(" ".join(m for m in {!r} if m in sys.modules))'.format(modules)
+    output = subprocess.check_output([sys.executable, '-c', code], env=dict(os.environ, CONFIG_FILE='/nonexistent'))
+    assert output.decode('ascii').strip() == ''
+
+
+def test_config___read_on_first_use(tmpdir):
+    path = tmpdir.join('config.yaml')
+    config = Config(str(path))
+    path.write('jobs: []\n')
+    assert config['jobs'] == []
+    path.write('jobs: [1]\n')
+    assert config['jobs'] == []
+    config.reload()
+    assert config.get('jobs') == [1]
+
+
+def test_config___not_set(monkeypatch):
+    monkeypatch.delenv('CONFIG_FILE', raising=False)
+    with pytest.raises(RuntimeError):
+        Config().get('jobs')
@@ -0,0 +1,65 @@
+import mock
+import pytest
+from florin_notifier import replay
+from florin_notifier.replay import RecordingClient, ReplayClient
+from .fake_tangerine import transaction as txn
+
+
+@pytest.fixture
+def fixtures(tmpdir, tangerine_client):
+    tangerine_client.list_transactions.side_effect = [[txn(1)], [txn(1), txn(2)]]
+    tangerine_client.list_accounts.return_value = [{'number': '12345'}]
+    tangerine_client.download_ofx.return_value = '<OFX>statement</OFX>'
+    recording = RecordingClient(tangerine_client, replay.fixture_path(str(tmpdir), 'tangerine'))
+    recording.list_transactions(['12345'], '2017-11-09', '2017-11-10')
+    recording.list_transactions(['12345'], '2017-11-10', '2017-11-11')
+    recording.list_accounts()
+    recording.download_ofx({'number': '12345'}, '2017-11-01', '2017-11-10', save=False)
+    return str(tmpdir)
+
+
+def test_replay_client___serves_recorded_responses_in_order(fixtures):
+    client = ReplayClient(replay.fixture_path(fixtures, 'tangerine'))
+    with client.login():
+        assert client.list_transactions(['12345']) == [txn(1)]
+        assert client.list_transactions(['12345']) == [txn(1), txn(2)]
+        assert client.list_transactions(['12345']) == [txn(1)]
+        assert client.download_ofx(None, None, None, save=False) == '<OFX>statement</OFX>'
+    with pytest.raises(AttributeError):
+        client.recent_activities
+
+
+def test_replay_client___properties(tmpdir):
+    bank = mock.Mock(recent_activities=[{'amount': 1}])
+    path = replay.fixture_path(str(tmpdir), 'rogersbank')
+    assert RecordingClient(bank, path).recent_activities == [{'amount': 1}]
+    client = ReplayClient(path, scale=2)
+    assert client.recent_activities == [{'amount': 1}, {'amount': 1, 'replay_copy': 1}]
+
+
+def test_replay_client___scale(fixtures):
+    client = ReplayClient(replay.fixture_path(fixtures, 'tangerine'), scale=3)
+    assert [t['id'] for t in client.list_transactions()] == [1, '1~1', '1~2']
+    assert client.list_accounts() == [{'number': '12345'}]
+
+
+def test_load_test(redis, fixtures):
+    jobs = [
+        {'type': 'notify_tangerine_transactions',
+         'args': {'account_ids': ['12345'], 'secret_file': 'a.gpg', 'recipient': 'foo@example.com'}},
+        {'type': 'upload_statement',
+         'args': {'bank': 'tangerine', 'account_ids': ['12345'], 'secret_file': 'a.gpg',
+                  'targets': [{'endpoint': 'http://firefly.invalid/import', 'account_id_mapping': {'12345': 1}}]}},
+        {'type': 'notify_new_transactions', 'args': {}},
+    ]
+    with mock.patch('florin_notifier.email.send_mail') as send_mail:
+        stats, elapsed = replay.load_test(jobs, fixtures, cycles=2, scale=2)
+    assert not send_mail.called
+    assert len(stats.timings[('notify', 'tangerine', 'total')]) == 2
+    assert len(stats.timings[('import', 'tangerine', 'total')]) == 2
+    assert stats.counters[('notify', 'tangerine', 'fetched')] == 2 + 4
+    assert stats.counters[('notify', 'tangerine', 'added')] == 2 + 2
+    assert stats.counters[('import', 'tangerine', 'dry_run_bytes')] == 2 * len('<OFX>statement</OFX>')
+    report = stats.report(elapsed)
+    assert 'redis_load' in report
+    assert '4 jobs in' in report
@@ -0,0 +1,75 @@
+from collections import Counter
+import pytest
+from celery.contrib.testing.worker import start_worker
+from florin_notifier import routing, single_flight
+from florin_notifier.routing import HashRing, Router
+
+
+def upload_args(account_id, bank='tangerine'):
+    return {'bank': bank, 'account_ids': [account_id], 'secret_file': 's.gpg', 'targets': []}
+
+
+def test_hash_ring___spreads_keys_evenly():
+    ring = HashRing(['s0', 's1', 's2', 's3'])
+    counts = Counter(ring.node('job{}'.format(i)) for i in range(4000))
+    assert set(counts) == {'s0', 's1', 's2', 's3'}
+    assert all(600 < count < 1400 for count in counts.values())
+
+
+def test_hash_ring___adding_a_node_moves_only_its_keys():
+    before = HashRing(['s0', 's1', 's2'])
+    after = HashRing(['s0', 's1', 's2', 's3'])
+    keys = ['job{}'.format(i) for i in range(3000)]
+    moved = [key for key in keys if before.node(key) != after.node(key)]
+    assert all(after.node(key) == 's3' for key in moved)
+    assert 500 < len(moved) < 1100
+
+
+def test_router___queue():
+    router = Router(shards=4)
+    assert router.queue('notify_tangerine_transactions', {'account_ids': ['1']}).startswith('tangerine.notify.s')
+    assert router.queue('upload_statement', upload_args('1', 'rogersbank_florin')).startswith('rogersbank.import.s')
+    assert router.queue('flush_digests', {}) == 'celery'
+    shards = set(router.queue('upload_statement', upload_args(str(i))) for i in range(50))
+    assert shards == {'tangerine.import.s{}'.format(n) for n in range(4)}
+    # The same job always goes to the same shard
+    assert router.queue('upload_statement', upload_args('7')) == router.queue('upload_statement', upload_args('7'))
+
+
+def test_router___queues():
+    router = Router(shards=2)
+    assert router.queues(shard='s1') == [
+        'rogersbank.notify.s1', 'rogersbank.import.s1', 'tangerine.notify.s1', 'tangerine.import.s1']
+    assert router.queues(shard='s0', bank='tangerine') == ['tangerine.notify.s0', 'tangerine.import.s0']
+    assert 'celery' in router.queues(shard='s0')
+    assert len(router.queues()) == 2 * 2 * 2 + 1
+
+
+@pytest.fixture
+def app(monkeypatch):
+    from florin_notifier import scheduler
+    monkeypatch.setattr(routing, '_router', Router(shards=3))
+    monkeypatch.setattr(single_flight, 'run', lambda name, fn, kwargs, lease: (name, kwargs['account_ids']))
+    app = scheduler.app
+    app.conf.update(broker_url='memory://', result_backend='cache+memory://', task_queues=None)
+    return scheduler
+
+
+def test_scheduler___sends_jobs_to_their_shard(app):
+    args = upload_args('12345')
+    queue = routing.router().queue('upload_statement', args)
+    app.upload_statement.apply_async(kwargs=args)
+    with app.app.connection_for_write() as conn:
+        messages = conn.SimpleQueue(queue)
+        message = messages.get(timeout=1)
+        assert message.headers['task'].endswith('.upload_statement')
+        message.ack()
+        messages.close()
+
+
+def test_scheduler___worker_runs_the_jobs_of_its_queues(app):
+    args = upload_args('12345')
+    queue = routing.router().queue('upload_statement', args)
+    with start_worker(app.app, pool='solo', perform_ping_check=False, queues=[queue]):
+        result = app.upload_statement.apply_async(kwargs=args)
+        assert result.get(timeout=10) == ['upload_statement', ['12345']]
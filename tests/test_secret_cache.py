@@ -0,0 +1,83 @@
+import os
+import pytest
+from florin_notifier.secret_cache import SecretCache, secret_files
+
+
+class FakeDecrypt():
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, filename):
+        self.calls.append(filename)
+        with open(filename) as f:
+            return {'username': f.read()}
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def secret_file(tmpdir):
+    path = tmpdir.join('secret.json.gpg')
+    path.write('alice')
+    return str(path)
+
+
+def test_get___decrypts_once(secret_file):
+    decrypt = FakeDecrypt()
+    cache = SecretCache(decrypt=decrypt)
+    assert cache.get(secret_file) == {'username': 'alice'}
+    cache.get(secret_file)['username'] = 'mallory'
+    assert cache.get(secret_file) == {'username': 'alice'}
+    assert len(decrypt.calls) == 1
+
+
+def test_get___expires_after_ttl(secret_file):
+    decrypt, clock = FakeDecrypt(), FakeClock()
+    cache = SecretCache(ttl=60, decrypt=decrypt, clock=clock)
+    cache.get(secret_file)
+    clock.now = 59
+    cache.get(secret_file)
+    assert len(decrypt.calls) == 1
+    clock.now = 60
+    cache.get(secret_file)
+    assert len(decrypt.calls) == 2
+
+
+def test_get___file_change_invalidates(secret_file):
+    decrypt = FakeDecrypt()
+    cache = SecretCache(decrypt=decrypt)
+    cache.get(secret_file)
+    with open(secret_file, 'w') as f:
+        f.write('bob')
+    stat = os.stat(secret_file)
+    os.utime(secret_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert cache.get(secret_file) == {'username': 'bob'}
+    assert len(decrypt.calls) == 2
+
+
+def test_get___ttl_zero_disables_cache(secret_file):
+    decrypt = FakeDecrypt()
+    cache = SecretCache(ttl=0, decrypt=decrypt)
+    cache.get(secret_file)
+    cache.get(secret_file)
+    assert len(decrypt.calls) == 2
+
+
+def test_warm(secret_file, tmpdir):
+    decrypt = FakeDecrypt()
+    cache = SecretCache(decrypt=decrypt)
+    jobs = [
+        {'type': 'notify_tangerine_transactions', 'args': {'secret_file': secret_file}},
+        {'type': 'upload_statement', 'args': {'secret_file': secret_file}},
+        {'type': 'notify_rogersbank_transactions', 'enabled': False, 'args': {'secret_file': 'disabled'}},
+        {'type': 'notify_rogersbank_transactions', 'args': {'secret_file': str(tmpdir.join('missing'))}},
+    ]
+    assert cache.warm(secret_files(jobs)) == 1
+    cache.get(secret_file)
+    assert len(decrypt.calls) == 1
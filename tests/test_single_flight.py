@@ -0,0 +1,99 @@
+import threading
+import time
+import mock
+import pytest
+from florin_notifier import single_flight
+
+
+pytestmark = pytest.mark.redis_keys('lock:job:*', 'pending:job:*')
+
+
+def test_job_key():
+    assert single_flight.job_key('upload_statement', {'bank': 'a', 'account_ids': ['1']}) == \
+        single_flight.job_key('upload_statement', {'account_ids': ['1'], 'bank': 'a'})
+    assert single_flight.job_key('upload_statement', {'bank': 'a'}) != \
+        single_flight.job_key('upload_statement', {'bank': 'b'})
+
+
+def test_jitter():
+    delays = [single_flight.jitter(single_flight.job_key('job', {'n': i}), 300) for i in range(50)]
+    assert all(0 <= delay <= 300 for delay in delays)
+    assert len(set(delays)) > 25
+    assert single_flight.jitter(single_flight.job_key('job', {'n': 0}), 300) == delays[0]
+    assert single_flight.jitter(single_flight.job_key('job', {'n': 0}), None) == 0
+
+
+def test_run___releases_the_lock(redis):
+    fn = mock.Mock(return_value=42)
+    assert single_flight.run('job', fn, {'n': 1}) == 42
+    fn.assert_called_once_with(n=1)
+    assert redis.keys('lock:job:*') == []
+
+
+def test_run___releases_the_lock_when_the_job_fails(redis):
+    with pytest.raises(RuntimeError):
+        single_flight.run('job', mock.Mock(side_effect=RuntimeError('boom')), {})
+    assert redis.keys('lock:job:*') == []
+
+
+def test_run___coalesces_overlapping_triggers_into_one_follow_up(redis):
+    started = threading.Event()
+    proceed = threading.Event()
+    calls = []
+
+    def job(n):
+        calls.append(n)
+        started.set()
+        proceed.wait(5)
+        return len(calls)
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(single_flight.run('job', job, {'n': 1})))
+    first.start()
+    assert started.wait(5)
+    for _ in range(3):
+        assert single_flight.run('job', job, {'n': 1}) is None
+    # Other arguments are another job
+    assert single_flight.run('job', lambda n: n, {'n': 2}) == 2
+    proceed.set()
+    first.join(5)
+    assert calls == [1, 1]
+    assert results == [2]
+    assert redis.keys('pending:job:*') == []
+
+
+def test_run___renews_the_lease_while_running(redis):
+    def job():
+        time.sleep(0.5)
+        [key] = redis.keys('lock:job:*')
+        return redis.pttl(key)
+
+    assert single_flight.run('job', job, {}, lease=0.3) > 0
+
+
+def test_run___takes_over_an_expired_lease(redis):
+    redis.set(single_flight.LOCK_PREFIX + single_flight.job_key('job', {}), 'crashed', px=100)
+    fn = mock.Mock(return_value=1)
+    assert single_flight.run('job', fn, {}) is None
+    time.sleep(0.2)
+    assert single_flight.run('job', fn, {}) == 1
+    # One run for both triggers
+    assert fn.call_count == 1
+
+
+def test_setup___spreads_jobs_sharing_a_schedule(monkeypatch):
+    from florin_notifier import scheduler
+    from florin_notifier.config import config
+    jobs = [{'type': 'upload_statement', 'schedule': {'minute': '0'},
+             'args': {'bank': 'tangerine', 'account_ids': [str(i)], 'secret_file': 's', 'targets': []}}
+            for i in range(10)]
+    monkeypatch.setitem(config, 'jobs', jobs)
+    monkeypatch.setitem(config, 'scheduler', {'jitter': 600})
+    sender = mock.Mock()
+    scheduler.setup(sender)
+    calls = sender.add_periodic_task.call_args_list
+    assert len(calls) == 10
+    assert len(set(c[1]['name'] for c in calls)) == 10
+    countdowns = [c[1]['countdown'] for c in calls]
+    assert all(0 <= countdown <= 600 for countdown in countdowns)
+    assert len(set(countdowns)) > 5
@@ -1,36 +1,16 @@
+import datetime
 import json
 import freezegun
 import pytest
 import mock
-import os
 import contextlib
-from redis import Redis
-from florin_notifier.tasks import notify_tangerine_transactions
-
-
-@pytest.fixture
-def redis():
-    r = Redis(host=os.getenv('REDIS_HOST', 'localhost'), port=os.getenv('REDIS_PORT', 6379))
-    for key in r.scan_iter("scrape:*"):
-        r.delete(key)
-    return r
-
-
-@pytest.fixture
-def tangerine_client():
-    m = mock.Mock()
-
-    @contextlib.contextmanager
-    def fake_ctx_mgr():
-        yield
-
-    m.login = fake_ctx_mgr
-    return m
-
-
-@pytest.fixture
-def email():
-    return mock.Mock()
+import time
+from florin_notifier.tasks import (
+    notify_rogersbank_transactions,
+    notify_tangerine_transactions,
+    RogersBankStatementImporter,
+    TangerineStatementImporter,
+)
 
 
 @pytest.fixture
@@ -121,3 +101,206 @@ def test_notify_tangerine_transactions___with_previous_scrape_on_a_different_day
     assert email.send_new_transaction_email.call_args_list[0][0][:2] == ('foo@example.com',
                                                                          {'12345': [txn_2],
                                                                           '45678': [txn_3]})
+
+
+@freezegun.freeze_time('2017-11-10T12:00:00.1111')
+def test_notify_tangerine_transactions___only_stores_and_sends_the_delta(redis, tangerine_client, email):
+    txn_1 = {
+        'transaction_date': '2017-11-10T07:17:03',
+        'amount': -55.54,
+        'description': 'BUY STUFF',
+        'type': 'WITHDRAWAL',
+        'account_id': '12345',
+        'id': 1,
+        'posted_date': '2017-11-04T00:00:00',
+        'status': 'POSTED'
+    }
+    txn_2 = dict(txn_1, id=2, amount=-100.99)
+    tangerine_client.list_transactions.return_value = [txn_1]
+    notify_tangerine_transactions(['12345'], 'SECRET', 'foo@example.com', tangerine_client, email)
+
+    with freezegun.freeze_time('2017-11-10T13:00:00.2222'):
+        tangerine_client.list_transactions.return_value = [txn_1, txn_2]
+        notify_tangerine_transactions(['12345'], 'SECRET', 'foo@example.com', tangerine_client, email)
+
+    assert tangerine_client.list_transactions.call_args[1]['period_from'] == datetime.datetime(2017, 11, 10, 12, 0, 0, 111100)
+    assert json.loads(redis.get('scrape:tangerine:2017-11-10T13:00:00.222200')) == [txn_2]
+    assert email.send_new_transaction_email.call_args_list[1][0][:2] == ('foo@example.com', {'12345': [txn_2]})
+    assert redis.hlen('state:seen:scrape:tangerine:') == 2
+
+
+class RecordingTangerineStatementImporter(TangerineStatementImporter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploads = []
+
+    def upload(self, statement_content, target_account_id, target):
+        if target_account_id == 'broken':
+            raise ValueError('upload failed')
+        self.uploads.append((statement_content, target_account_id, target['name']))
+        return target_account_id
+
+
+def test_tangerine_statement_importer___downloads_each_account_once(tangerine_client):
+    account_ids = ['1', '2', '3', '4', '5']
+    tangerine_client.list_accounts.return_value = [{'number': n} for n in account_ids]
+    tangerine_client.download_ofx.side_effect = lambda account, from_, to_, save: 'OFX {}'.format(account['number'])
+    targets = [{'name': name, 'account_id_mapping': {n: name + n for n in account_ids}} for name in 'abc']
+
+    importer = RecordingTangerineStatementImporter('SECRET', client=tangerine_client, concurrency=3)
+    result = importer(account_ids, targets)
+
+    assert tangerine_client.download_ofx.call_count == 5
+    assert sorted(importer.uploads) == sorted(
+        ('OFX {}'.format(n), name + n, name) for n in account_ids for name in 'abc')
+    assert result.ok
+    assert len(result.imported) == 15
+
+
+def test_tangerine_statement_importer___isolates_failures(tangerine_client):
+    tangerine_client.list_accounts.return_value = [{'number': '1'}, {'number': '2'}, {'number': '3'}]
+
+    def download_ofx(account, from_, to_, save):
+        if account['number'] == '2':
+            raise RuntimeError('download failed')
+        return 'OFX {}'.format(account['number'])
+
+    tangerine_client.download_ofx.side_effect = download_ofx
+    targets = [{'name': 'a', 'account_id_mapping': {'1': 'a1', '2': 'a2', '3': 'broken'}}]
+
+    importer = RecordingTangerineStatementImporter('SECRET', client=tangerine_client)
+    result = importer(['1', '2', '3', '4'], targets)
+
+    assert importer.uploads == [('OFX 1', 'a1', 'a')]
+    assert result.imported == [('1', targets[0], 'a1')]
+    assert sorted((account_id, type(e)) for account_id, _, e in result.failed) == [
+        ('2', RuntimeError), ('3', ValueError)]
+    assert result.skipped == ['4']
+
+
+def dated_statement(*days):
+    return ''.join('<STMTTRN><DTPOSTED>201711{:02d}<TRNAMT>-1.00</STMTTRN>'.format(day) for day in days)
+
+
+@freezegun.freeze_time('2017-11-10T12:00:00')
+def test_tangerine_statement_importer___downloads_since_the_checkpoint(redis, tangerine_client):
+    tangerine_client.list_accounts.return_value = [{'number': '1'}, {'number': '2'}]
+    statements = {'1': dated_statement(1, 4), '2': dated_statement(2)}
+    tangerine_client.download_ofx.side_effect = lambda account, from_, to_, save: statements[account['number']]
+    targets = [{'name': 'a', 'account_id_mapping': {'1': 'a1', '2': 'a2'}},
+               {'name': 'b', 'account_id_mapping': {'1': 'b1'}}]
+
+    RecordingTangerineStatementImporter('SECRET', client=tangerine_client)(['1', '2'], targets)
+    ranges = {c[0][0]['number']: c[0][1:3] for c in tangerine_client.download_ofx.call_args_list}
+    assert ranges['1'] == (datetime.date(2017, 10, 10), datetime.date(2017, 11, 11))
+
+    statements['1'] = dated_statement(4, 9)
+    tangerine_client.download_ofx.reset_mock()
+    RecordingTangerineStatementImporter('SECRET', client=tangerine_client, overlap_days=2)(['1', '2'], targets)
+    ranges = {c[0][0]['number']: c[0][1:3] for c in tangerine_client.download_ofx.call_args_list}
+    assert ranges['1'] == (datetime.date(2017, 11, 2), datetime.date(2017, 11, 11))
+    # Target b has no mapping for account 2, so only the checkpoint of target a counts
+    assert ranges['2'] == (datetime.date(2017, 10, 31), datetime.date(2017, 11, 11))
+    assert redis.hgetall('checkpoint:tangerine:1') == {b'a': b'2017-11-09', b'b': b'2017-11-09'}
+    assert redis.hgetall('checkpoint:tangerine:2') == {b'a': b'2017-11-02'}
+
+    tangerine_client.download_ofx.reset_mock()
+    since = datetime.date(2017, 1, 1)
+    RecordingTangerineStatementImporter('SECRET', client=tangerine_client, full_resync_since=since)(['1'], targets)
+    assert tangerine_client.download_ofx.call_args[0][1] == since
+    assert redis.hget('checkpoint:tangerine:1', 'a') == b'2017-11-09'
+
+
+@pytest.fixture
+def rogersbank_client():
+    m = mock.Mock()
+    m.logins = 0
+
+    @contextlib.contextmanager
+    def login():
+        m.logins += 1
+        yield
+
+    m.login = login
+    return m
+
+
+def activity(account_id, description):
+    return {'date': 'Nov 4, 2017', 'description': description, 'amount': '$1.00', 'account_id': account_id}
+
+
+def test_notify_rogersbank_transactions___partitions_cards_of_one_login(redis, rogersbank_client, email):
+    rogersbank_client.recent_activities = [activity('1111', 'A'), activity('2222', 'B'),
+                                           activity('1111', 'C'), activity('3333', 'NOT CONFIGURED')]
+    notify_rogersbank_transactions(['1111', '2222'], 'SECRET', 'foo@example.com', rogersbank_client, email)
+
+    assert rogersbank_client.logins == 1
+    recipient, new_transactions, _ = email.send_new_transaction_email.call_args[0]
+    assert dict(new_transactions) == {
+        '1111': [activity('1111', 'A'), activity('1111', 'C')],
+        '2222': [activity('2222', 'B')],
+    }
+
+
+def test_notify_rogersbank_transactions___untagged_activities_belong_to_the_only_account(
+        redis, rogersbank_client, email):
+    rogersbank_client.recent_activities = [{'date': 'Nov 4, 2017', 'description': 'A', 'amount': '$1.00'}]
+    notify_rogersbank_transactions(['1111'], 'SECRET', 'foo@example.com', rogersbank_client, email)
+    assert dict(email.send_new_transaction_email.call_args[0][1]) == {
+        '1111': rogersbank_client.recent_activities}
+
+
+def test_notify_rogersbank_transactions___untagged_activities_of_several_accounts(
+        redis, rogersbank_client, email):
+    rogersbank_client.recent_activities = [{'date': 'Nov 4, 2017', 'description': 'A', 'amount': '$1.00'}]
+    with pytest.raises(ValueError):
+        notify_rogersbank_transactions(['1111', '2222'], 'SECRET', 'foo@example.com', rogersbank_client, email)
+    email.send_new_transaction_email.assert_not_called()
+    assert list(redis.scan_iter('scrape:rogersbank:*')) == []
+
+
+class RecordingRogersBankStatementImporter(RogersBankStatementImporter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploads = []
+
+    def upload(self, statement_content, target_account_id, target):
+        self.uploads.append((statement_content, target_account_id))
+        return target_account_id
+
+
+def test_rogersbank_statement_importer___downloads_every_card_under_one_login(rogersbank_client):
+    downloading = []
+
+    def download_statement(cycle, save, account_id=None):
+        downloading.append(account_id)
+        time.sleep(0.05)
+        assert downloading == [account_id], 'downloads of one login must not overlap'
+        downloading.remove(account_id)
+        return 'OFX {} {}'.format(cycle, account_id)
+
+    rogersbank_client.download_statement.side_effect = download_statement
+    targets = [{'name': 'a', 'account_id_mapping': {'1111': 'a1', '2222': 'a2'}}]
+
+    importer = RecordingRogersBankStatementImporter('SECRET', client=rogersbank_client)
+    result = importer(['1111', '2222'], targets)
+
+    assert rogersbank_client.logins == 1
+    assert sorted(importer.uploads) == [('OFX 00 1111', 'a1'), ('OFX 00 2222', 'a2')]
+    assert result.ok
+
+    importer = RecordingRogersBankStatementImporter('SECRET', client=rogersbank_client)
+    importer(['1111'], targets)
+    assert rogersbank_client.download_statement.call_args == mock.call('00', save=False)
+
+
+def test_rogersbank_statement_importer___several_cards_need_a_client_that_selects_them(rogersbank_client):
+    def download_statement(billing_cycle_value, filetype='ofx', base_filename='report', save=True):
+        return 'OFX'
+
+    rogersbank_client.download_statement = download_statement
+    importer = RecordingRogersBankStatementImporter('SECRET', client=rogersbank_client)
+    with pytest.raises(ValueError):
+        importer(['1111', '2222'], [])
+    assert rogersbank_client.logins == 0
+    assert importer(['1111'], [{'name': 'a', 'account_id_mapping': {'1111': 'a1'}}]).ok